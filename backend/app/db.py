@@ -1,12 +1,64 @@
 import sqlite3
 import os
+import queue
 
 DB_PATH = "prisma/dev.db"
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+class PooledConnection:
+    """
+    Thin wrapper over a pooled sqlite3 connection. close() hands the connection
+    back to the pool (rolling back anything left uncommitted) instead of closing it.
+    """
+    def __init__(self, pool, conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self._conn.in_transaction:
+            self._conn.rollback()
+        self._pool.release(self._conn)
+        self._conn = None
+
+class ConnectionPool:
+    """
+    Reuses SQLite connections across requests. Each connection runs in WAL mode,
+    so readers never wait on the writer, and keeps its own prepared-statement cache.
+    """
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+_pool = ConnectionPool(DB_PATH)
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return _pool.acquire()
 
 def init_db():
     conn = get_db_connection()
@@ -37,6 +89,11 @@ def init_db():
         )
     ''')
 
+    # purgedAt marks opt-outs whose points have been deleted from the vector index
+    c.execute("PRAGMA table_info(Shop)")
+    if "purgedAt" not in [col[1] for col in c.fetchall()]:
+        c.execute("ALTER TABLE Shop ADD COLUMN purgedAt TIMESTAMP")
+
     # Create Product table
     c.execute('''
         CREATE TABLE IF NOT EXISTS Product (
@@ -1,40 +1,30 @@
-from fastapi import Depends, HTTPException
-from typing import Optional
-from .db import get_db_connection
-import sqlite3
+from fastapi import Depends, File, Form, HTTPException, UploadFile
+from typing import List, Optional
+from .services.quota_counter import quota_counter
 
 # Simple mock user dependency for now
 async def get_current_user_id():
     return "demo-user-id" 
 
 async def check_search_limit(user_id: str = Depends(get_current_user_id)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Counted in memory; increments are written to SQLite in the background
+    await quota_counter.preload(user_id, "demo@example.com")
+    user = quota_counter.try_consume(user_id, "demo@example.com")
+    if user is None:
+        raise HTTPException(status_code=403, detail="Free plan limit reached (3 searches/month). Please upgrade.")
+    return user
 
-    try:
-        cursor.execute("SELECT * FROM User WHERE id = ?", (user_id,))
-        user_row = cursor.fetchone()
+async def check_search_limit_unless_paging(cursor: Optional[str] = Form(None), user_id: str = Depends(get_current_user_id)):
+    # Later pages were paid for by the first one; the route rejects cursors
+    # that are forged or belong to a different upload (see search_cursor)
+    if cursor:
+        return None
+    return await check_search_limit(user_id)
 
-        if not user_row:
-            # Create user if not exists
-            cursor.execute("INSERT INTO User (id, email, plan, searchCount) VALUES (?, ?, ?, ?)", 
-                           (user_id, "demo@example.com", "FREE", 0))
-            conn.commit()
-            cursor.execute("SELECT * FROM User WHERE id = ?", (user_id,))
-            user_row = cursor.fetchone()
-        
-        # Convert row to dict for easier access
-        user = dict(user_row)
-
-        # By-pass search limit for demo user during development/testing
-        if user['plan'] == "FREE" and user['searchCount'] >= 3 and user_id != "demo-user-id":
-             conn.close()
-             raise HTTPException(status_code=403, detail="Free plan limit reached (3 searches/month). Please upgrade.")
-        
-        # Increment search count
-        cursor.execute("UPDATE User SET searchCount = searchCount + 1 WHERE id = ?", (user_id,))
-        conn.commit()
-        
-        return user
-    finally:
-        conn.close()
+async def check_batch_search_limit(files: List[UploadFile] = File(...), user_id: str = Depends(get_current_user_id)):
+    # One batch is one search; the plan only bounds how many images it may carry
+    await quota_counter.preload(user_id, "demo@example.com")
+    max_images = quota_counter.batch_limit(user_id, "demo@example.com")
+    if len(files) > max_images:
+        raise HTTPException(status_code=403, detail=f"Your plan allows up to {max_images} images per batch search.")
+    return await check_search_limit(user_id)
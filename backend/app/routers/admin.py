@@ -1,14 +1,48 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
+import logging
 from ..db import get_db_connection
+from ..services.opt_out_enforcer import get_booth_identifiers
+from .search import get_opt_out_registry, get_vector_db
 
 router = APIRouter()
 
 class OptOutRequest(BaseModel):
     shopUrl: str
 
+def enforce_opt_out(shop_url: str, name: str):
+    """
+    Delete the opted-out points from the index, then drop the request from the
+    query-time filter. On failure it stays in the filter and is retried at startup.
+    """
+    identifiers = get_booth_identifiers(shop_url)
+    if name:
+        identifiers.add(name)
+    try:
+        get_vector_db().enforce_opt_out(identifiers)
+    except Exception as e:
+        logging.error(f"Opt-out enforcement failed for {shop_url}: {e}")
+        return
+
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE Shop SET purgedAt = CURRENT_TIMESTAMP WHERE url = ?", (shop_url,))
+        conn.commit()
+    finally:
+        conn.close()
+    get_opt_out_registry().refresh()
+
+def enforce_pending_opt_outs():
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("SELECT name, url FROM Shop WHERE optOut = 1 AND purgedAt IS NULL").fetchall()
+    finally:
+        conn.close()
+    for row in rows:
+        enforce_opt_out(row['url'], row['name'])
+
 @router.post("/opt-out")
-async def request_opt_out(req: OptOutRequest):
+async def request_opt_out(req: OptOutRequest, background_tasks: BackgroundTasks):
     if "booth.pm" not in req.shopUrl:
         raise HTTPException(status_code=400, detail="Invalid BOOTH URL")
     
@@ -28,7 +62,7 @@ async def request_opt_out(req: OptOutRequest):
         c.execute("SELECT id FROM Shop WHERE url = ?", (req.shopUrl,))
         row = c.fetchone()
         if row:
-            c.execute("UPDATE Shop SET optOut = 1 WHERE id = ?", (row['id'],))
+            c.execute("UPDATE Shop SET optOut = 1, purgedAt = NULL WHERE id = ?", (row['id'],))
         else:
              import uuid
              shop_id = str(uuid.uuid4())
@@ -40,4 +74,8 @@ async def request_opt_out(req: OptOutRequest):
     finally:
         conn.close()
     
+    # Exclude at query time right away, then delete from the index in the background
+    get_opt_out_registry().refresh()
+    background_tasks.add_task(enforce_opt_out, req.shopUrl, identifier)
+    
     return {"status": "success", "message": "Opt-out request received"}
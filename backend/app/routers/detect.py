@@ -0,0 +1,59 @@
+import io
+from typing import List
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from pydantic import BaseModel, Field
+from PIL import Image
+from ..services.garment_detector import GarmentDetector
+from ..services.inference_executor import InferenceExecutor
+from ..services.fast_preprocess import open_frame
+from .search import get_garment_detector, get_inference_executor
+
+router = APIRouter()
+
+class BoundingBox(BaseModel):
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+
+class Detection(BaseModel):
+    class_name: str = Field(..., alias="class")
+    confidence: float
+    box: BoundingBox
+
+class DetectResponse(BaseModel):
+    detections: List[Detection]
+
+def detect_upload(detector: GarmentDetector, contents: bytes) -> List[dict]:
+    # Boxes come back normalized, so detect on a reduced frame and scale to the upload's size
+    width, height = Image.open(io.BytesIO(contents)).size
+    detections = detector.detect(open_frame(contents, detector.imgsz))
+    return [
+        {
+            "class": d["label"],
+            "confidence": d["confidence"],
+            "box": {"x1": d["box"][0] * width, "y1": d["box"][1] * height, "x2": d["box"][2] * width, "y2": d["box"][3] * height},
+        } for d in detections
+    ]
+
+@router.post("/detect", response_model=DetectResponse, response_model_by_alias=True)
+async def detect_objects(
+    file: UploadFile = File(...),
+    detector: GarmentDetector = Depends(get_garment_detector),
+    executor: InferenceExecutor = Depends(get_inference_executor),
+):
+    """Garment/accessory boxes in the upload's pixel coordinates, best first."""
+    if file.content_type and not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    async with executor.reserve():
+        # The first check may load (and export) the model, so not on the event loop
+        if not await executor.run(getattr, detector, "available"):
+            raise HTTPException(status_code=503, detail="Object detection is unavailable")
+        try:
+            contents = await file.read()
+            return {"detections": await executor.run(detect_upload, detector, contents)}
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
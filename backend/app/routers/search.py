@@ -1,15 +1,27 @@
-import io
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Body
+import os
+from fastapi import APIRouter, UploadFile, File, Form, Query, Depends, HTTPException, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from PIL import Image
 from ..services.image_processor import ImageProcessor
 from ..services.vector_db import VectorDBService
-from ..middleware import check_search_limit
-from ..db import get_db_connection
+from ..services.embedding_batcher import EmbeddingBatcher
+from ..services.inference_executor import InferenceExecutor
+from ..services.opt_out_registry import OptOutRegistry
+from ..services.query_cache import QueryCache, TTLCache, dhash, filter_signature
+from ..services.search_cursor import encode_cursor, decode_cursor
+from ..services.text_embedding_cache import TextEmbeddingCache
+from ..services.embedding_cache import content_hash
+from ..services.fast_preprocess import load_image, open_frame, square_crop
+from ..services.garment_detector import GarmentDetector
+from ..middleware import check_search_limit, check_search_limit_unless_paging, check_batch_search_limit
 
 router = APIRouter()
 
+# Deepest a client can page into one query; bounds the cursor's exclusion list
+MAX_SEARCH_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "100"))
+MAX_PAGE_SIZE = 50
+
 class SearchQuery(BaseModel):
     query: str
     category: Optional[str] = None
@@ -27,44 +39,340 @@ def get_image_processor():
 def get_vector_db():
     return VectorDBService()
 
+@lru_cache()
+def get_opt_out_registry():
+    return OptOutRegistry()
+
+@lru_cache()
+def get_inference_executor():
+    return InferenceExecutor()
+
+@lru_cache()
+def get_embedding_batcher():
+    return EmbeddingBatcher(
+        get_image_processor(),
+        get_inference_executor(),
+        max_batch_size=int(os.getenv("EMBED_MAX_BATCH_SIZE", "16")),
+        max_wait_ms=float(os.getenv("EMBED_MAX_WAIT_MS", "10")),
+    )
+
+@lru_cache()
+def get_query_cache():
+    return QueryCache()
+
+@lru_cache()
+def get_text_embedding_cache():
+    return TextEmbeddingCache(get_image_processor())
+
+@lru_cache()
+def get_similar_cache():
+    # Per-item results for /api/similar, keyed like QueryCache's result level
+    return TTLCache(int(os.getenv("QUERY_CACHE_SIZE", "2048")), float(os.getenv("QUERY_CACHE_TTL", "600")))
+
+@lru_cache()
+def get_garment_detector():
+    return GarmentDetector()
+
+def serialize_hits(hits) -> List[dict]:
+    return [
+        {
+            "id": str(hit.id),
+            "score": hit.score,
+            "payload": hit.payload
+        } for hit in hits
+    ]
+
+def decode_image(contents: bytes) -> Image.Image:
+    # Reduced decode straight to CLIP's 224x224 input
+    return load_image(contents)
+
+def decode_and_hash(contents: bytes):
+    image = decode_image(contents)
+    return image, dhash(image)
+
 @router.post("/search")
 async def search_image(
     file: UploadFile = File(...),
-    image_processor: ImageProcessor = Depends(get_image_processor),
+    category: Optional[str] = Form(None),
+    avatars: Optional[List[str]] = Form(None),
+    colors: Optional[List[str]] = Form(None),
+    limit: int = Form(10),
+    cursor: Optional[str] = Form(None),
+    batcher: EmbeddingBatcher = Depends(get_embedding_batcher),
+    executor: InferenceExecutor = Depends(get_inference_executor),
     vector_db: VectorDBService = Depends(get_vector_db),
-    user = Depends(check_search_limit) # Enforce limit
+    opt_outs: OptOutRegistry = Depends(get_opt_out_registry),
+    query_cache: QueryCache = Depends(get_query_cache),
+    user = Depends(check_search_limit_unless_paging) # Enforce limit
 ):
+    """
+    Image search. category/avatars/colors are applied inside Qdrant; every
+    avatar and color given must match. Results come in pages of `limit`
+    distinct products: to get the next page, send the same file again with
+    the returned next_cursor (null once there are no more results). Pages
+    after the first do not count against the search quota.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    filters = {"category": category, "avatars": avatars, "colors": colors}
+
+    # Reject early with 503 when the inference queue is full
+    async with executor.reserve():
+        return await _search_image(file, batcher, executor, vector_db, opt_outs, query_cache, filters, limit, cursor)
+
+async def _search_image(file: UploadFile, batcher: EmbeddingBatcher, executor: InferenceExecutor, vector_db: VectorDBService, opt_outs: OptOutRegistry, query_cache: QueryCache, filters: dict = None, limit: int = 10, cursor: str = None):
+    filters = filters or {}
+    contents = await file.read()
+    sha = content_hash(contents)
+    seen_urls = decode_cursor(cursor, sha) if cursor else []
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        
         # 1. Get embedding for the whole image (MVP approach)
-        vector = image_processor.get_embedding(image)
-        
-        # 2. Search in Qdrant with opt-out filter
-        conn = get_db_connection()
-        excluded_shops = set()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM Shop WHERE optOut = 1")
-            rows = cursor.fetchall()
-            for row in rows:
-                excluded_shops.add(row['name'])
-        finally:
-            conn.close()
-
-        results = vector_db.search_similar(vector, excluded_shops=excluded_shops)
-        
-        return {
-            "results": [
-                {
-                    "id": str(hit.id),
-                    "score": hit.score,
-                    "payload": hit.payload
-                } for hit in results
-            ]
-        }
+        # Identical bytes skip decoding, near-duplicates (same dHash) skip the model
+        cached = query_cache.lookup_content(sha)
+        if cached is None:
+            # Decoding large uploads is CPU-bound, keep it off the event loop
+            image, phash = await executor.run(decode_and_hash, contents)
+            cached = query_cache.lookup_perceptual(phash)
+            if cached is None:
+                # Concurrent uploads share one batched forward pass
+                cached = (phash, await batcher.embed(image))
+            query_cache.put_embedding(sha, *cached)
+        phash, vector = cached
+
+        # 2. Search in Qdrant with opt-out filter, unless the index and opt-outs are unchanged since last time
+        exclusions = opt_outs.conditions
+        generation = (opt_outs.version, vector_db.collection_version)
+        signature = filter_signature(limit=limit, seen=seen_urls, **filters)
+        results = query_cache.get_results(phash, generation, signature)
+        if results is None:
+            hits = await vector_db.search_similar(
+                vector,
+                limit=limit,
+                seen_urls=seen_urls,
+                exclusion_conditions=exclusions,
+                **filters
+            )
+            results = serialize_hits(hits)
+            query_cache.put_results(phash, generation, results, signature)
+
+        # A short page means the ranking is exhausted
+        seen_urls = seen_urls + [r["payload"].get("boothUrl") for r in results]
+        next_cursor = None
+        if len(results) == limit and len(seen_urls) < MAX_SEARCH_RESULTS:
+            next_cursor = encode_cursor(sha, seen_urls)
+
+        return {"results": results, "next_cursor": next_cursor}
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+def decode_batch(contents: List[bytes]):
+    """decode_and_hash for each upload; None for files that are not readable images."""
+    decoded = []
+    for data in contents:
+        try:
+            decoded.append(decode_and_hash(data))
+        except Exception:
+            decoded.append(None)
+    return decoded
+
+@router.post("/search/batch")
+async def search_batch(
+    files: List[UploadFile] = File(...),
+    category: Optional[str] = Form(None),
+    avatars: Optional[List[str]] = Form(None),
+    colors: Optional[List[str]] = Form(None),
+    limit: int = Form(10),
+    image_processor: ImageProcessor = Depends(get_image_processor),
+    executor: InferenceExecutor = Depends(get_inference_executor),
+    vector_db: VectorDBService = Depends(get_vector_db),
+    opt_outs: OptOutRegistry = Depends(get_opt_out_registry),
+    query_cache: QueryCache = Depends(get_query_cache),
+    user = Depends(check_batch_search_limit) # One search per batch, size capped by plan
+):
+    """
+    Search many images (screenshots, or crops cut client-side) at once. The
+    uncached ones are embedded in one CLIP forward pass and searched in one
+    batched Qdrant request. Returns one group per file, in upload order, with
+    the same filters and `limit` as /api/search; unreadable files get an
+    "error" instead of results. Counts as one search.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    filters = {"category": category, "avatars": avatars, "colors": colors}
+
+    async with executor.reserve():
+        try:
+            contents = [await file.read() for file in files]
+            shas = [content_hash(data) for data in contents]
+
+            # Identical uploads are only embedded and searched once
+            unique = list(dict.fromkeys(shas))
+            embeddings = {sha: query_cache.lookup_content(sha) for sha in unique}
+            to_decode = [sha for sha in unique if embeddings[sha] is None]
+            content_by_sha = dict(zip(shas, contents))
+            decoded = await executor.run(decode_batch, [content_by_sha[sha] for sha in to_decode])
+
+            to_embed = []
+            for sha, item in zip(to_decode, decoded):
+                if item is None:
+                    continue
+                image, phash = item
+                embeddings[sha] = query_cache.lookup_perceptual(phash)
+                if embeddings[sha] is None:
+                    to_embed.append((sha, image, phash))
+            vectors = await executor.run(image_processor.get_embeddings, [image for _, image, _ in to_embed]) if to_embed else []
+            for (sha, _, phash), vector in zip(to_embed, vectors):
+                embeddings[sha] = (phash, vector)
+                query_cache.put_embedding(sha, phash, vector)
+
+            exclusions = opt_outs.conditions
+            generation = (opt_outs.version, vector_db.collection_version)
+            signature = filter_signature(limit=limit, seen=[], **filters)
+            results = {}
+            for sha in unique:
+                if embeddings[sha] is not None:
+                    results[sha] = query_cache.get_results(embeddings[sha][0], generation, signature)
+            to_search = [sha for sha, cached in results.items() if cached is None]
+            hits = await vector_db.search_similar_batch(
+                [embeddings[sha][1] for sha in to_search],
+                limit=limit,
+                exclusion_conditions=exclusions,
+                **filters
+            ) if to_search else []
+            for sha, sha_hits in zip(to_search, hits):
+                results[sha] = serialize_hits(sha_hits)
+                query_cache.put_results(embeddings[sha][0], generation, results[sha], signature)
+
+            return {
+                "results": [
+                    {"filename": file.filename, "results": results[sha]} if sha in results
+                    else {"filename": file.filename, "error": "Could not read image"}
+                    for file, sha in zip(files, shas)
+                ]
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/search/text")
+async def search_text(
+    search_query: SearchQuery,
+    text_cache: TextEmbeddingCache = Depends(get_text_embedding_cache),
+    executor: InferenceExecutor = Depends(get_inference_executor),
+    vector_db: VectorDBService = Depends(get_vector_db),
+    opt_outs: OptOutRegistry = Depends(get_opt_out_registry),
+    user = Depends(check_search_limit) # Enforce limit
+):
+    if not search_query.query.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+
+    async with executor.reserve():
+        try:
+            # Warmed phrases (avatar names, colors) never reach the text tower
+            vector = text_cache.lookup(search_query.query)
+            if vector is None:
+                vector = await executor.run(text_cache.get, search_query.query)
+
+            results = await vector_db.search_similar(
+                vector,
+                category=search_query.category,
+                avatars=search_query.avatars,
+                colors=search_query.colors,
+                exclusion_conditions=opt_outs.conditions,
+            )
+            return {"results": serialize_hits(results)}
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/similar/{item_id}")
+async def search_similar_items(
+    item_id: str,
+    response: Response,
+    category: Optional[str] = Query(None),
+    avatars: Optional[List[str]] = Query(None),
+    colors: Optional[List[str]] = Query(None),
+    limit: int = Query(10),
+    vector_db: VectorDBService = Depends(get_vector_db),
+    opt_outs: OptOutRegistry = Depends(get_opt_out_registry),
+    similar_cache: TTLCache = Depends(get_similar_cache),
+):
+    """
+    "More like this" for a result: item_id is a result's point ID or a BOOTH
+    item ID. Served from the precomputed k-NN graph when it covers the item,
+    otherwise searched with the product's stored vectors; either way no
+    upload and no model call, under the same opt-out filter and per-product
+    deduplication as /api/search, leaving the product itself out. Not
+    counted as a search.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    filters = {"category": category, "avatars": avatars, "colors": colors}
+
+    generation = (opt_outs.version, vector_db.collection_version)
+    key = (item_id, generation, filter_signature(limit=limit, **filters))
+    results = similar_cache.get(key)
+    if results is None:
+        try:
+            hits = await vector_db.search_similar_to_item(item_id, limit=limit, exclusion_conditions=opt_outs.conditions, **filters)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+        if hits is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        results = serialize_hits(hits)
+        similar_cache.put(key, results)
+
+    # Same for every user; short enough that opt-outs drop out of shared caches quickly
+    response.headers["Cache-Control"] = f"public, max-age={os.getenv('SIMILAR_CACHE_MAX_AGE', '300')}"
+    return {"results": results}
+
+def detect_and_crop(detector: GarmentDetector, contents: bytes):
+    """Full frame plus one square crop per detected item, ready for one CLIP batch."""
+    frame = open_frame(contents, detector.imgsz)
+    detections = detector.detect(frame) if detector.available else []
+    return detections, [frame] + [square_crop(frame, d["box"]) for d in detections]
+
+@router.post("/search/detect")
+async def search_detect(
+    file: UploadFile = File(...),
+    limit: int = Form(6),
+    image_processor: ImageProcessor = Depends(get_image_processor),
+    detector: GarmentDetector = Depends(get_garment_detector),
+    executor: InferenceExecutor = Depends(get_inference_executor),
+    vector_db: VectorDBService = Depends(get_vector_db),
+    opt_outs: OptOutRegistry = Depends(get_opt_out_registry),
+    user = Depends(check_search_limit) # Enforce limit
+):
+    """
+    Outfit search: YOLO finds each garment/accessory once, then the whole
+    image and every crop are embedded in one CLIP forward pass and searched
+    in one batched Qdrant request. Without a detector only the whole-image
+    results are returned. Counts as one search.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    async with executor.reserve():
+        try:
+            contents = await file.read()
+            detections, crops = await executor.run(detect_and_crop, detector, contents)
+            vectors = await executor.run(image_processor.get_embeddings, crops)
+            results = await vector_db.search_similar_batch(vectors, limit=limit, exclusion_conditions=opt_outs.conditions)
+            return {
+                "results": serialize_hits(results[0]),
+                "items": [
+                    {**detection, "results": serialize_hits(hits)}
+                    for detection, hits in zip(detections, results[1:])
+                ],
+                "detector_available": detector.available,
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,66 @@
+"""
+Avatar and color vocabulary shared by the scraper (payload tagging) and the
+API (text-search warm-up), kept free of scraper-only dependencies.
+"""
+from typing import List
+
+# Comprehensive list of popular VRChat avatars (2024-2025)
+TARGET_AVATARS = [
+    # --- Very Popular ---
+    "マヌカ", "桔梗", "セレスティア", "萌", "森羅", "瑞希", "ライム", "シフォン",
+    "ウルフェリア", "薄荷", "京狐", "狛乃", "水瀬", "ユリスフィア", "エミスティア",
+    "杏里", "彼方", "サクヤ", "ナユ", "真冬",
+    # --- Popular (2024-2025) ---
+    "リーファ", "ここあ", "イナバ", "カリン", "チセ", "ルーシュ", "リルモワ",
+    "竜胆", "あのん", "ANON", "ミルク", "ラシューシャ", "メリノ", "キキョウ",
+    "舞夜", "ルキフェル", "ソフィナ", "ヴェール", "フィリナ", "リミリア",
+    "マリエル", "セフィラ", "チューベローズ", "シエル", "イヨ",
+    "あまなつ", "しなの", "ラスク", "シュガ", "ルシナ",
+    # --- Male / Neutral ---
+    "アル", "ディオ", "Dio", "カーネリア", "グリフ",
+    # --- Newer models ---
+    "オディール", "ズフィ", "フェリス", "アイリス", "ミント",
+]
+
+# Color keywords (Japanese + English)
+TARGET_COLORS = {
+    # Japanese → Normalized key
+    "黒": "black", "ブラック": "black",
+    "白": "white", "ホワイト": "white",
+    "赤": "red", "レッド": "red",
+    "青": "blue", "ブルー": "blue",
+    "緑": "green", "グリーン": "green",
+    "黄": "yellow", "イエロー": "yellow",
+    "ピンク": "pink",
+    "紫": "purple", "パープル": "purple",
+    "茶": "brown", "ブラウン": "brown",
+    "グレー": "gray", "灰": "gray",
+    "水色": "light_blue",
+    "オレンジ": "orange",
+    "ベージュ": "beige",
+    "ネイビー": "navy",
+    "ワインレッド": "wine_red",
+    "モノクロ": "monochrome",
+    "ゴールド": "gold", "金": "gold",
+    "シルバー": "silver", "銀": "silver",
+    # English
+    "black": "black", "white": "white", "red": "red",
+    "blue": "blue", "green": "green", "yellow": "yellow",
+    "pink": "pink", "purple": "purple", "brown": "brown",
+    "gray": "gray", "grey": "gray", "orange": "orange",
+    "navy": "navy", "beige": "beige", "gold": "gold", "silver": "silver",
+}
+
+
+def text_warmup_phrases() -> List[str]:
+    """
+    Queries worth having a text embedding for before the first request: every
+    avatar and color keyword, plus the "<avatar>対応" form users type when
+    looking for clothing that fits their avatar.
+    """
+    phrases = []
+    for avatar in TARGET_AVATARS:
+        phrases.extend([avatar, f"{avatar}対応"])
+    phrases.extend(TARGET_COLORS)
+    # Dedupe while keeping the order, most popular avatars first
+    return list(dict.fromkeys(phrases))
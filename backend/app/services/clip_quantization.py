@@ -0,0 +1,31 @@
+import logging
+import os
+
+# Only the image side is benchmarked for recall (scripts/benchmark_quantized_clip.py);
+# the text tower stays fp32 so text queries keep matching unquantized vectors
+IMAGE_TOWER_MODULES = ("vision_model", "visual_projection")
+
+def quantize_torch_model(model):
+    """
+    Dynamic INT8 quantization of the nn.Linear layers in a CLIPModel's image
+    tower (weights stored as int8, activations quantized on the fly). CPU only.
+    """
+    import torch
+    from torch.ao.quantization import default_dynamic_qconfig
+    qconfig_spec = {
+        name: default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear) and name.split(".")[0] in IMAGE_TOWER_MODULES
+    }
+    return torch.ao.quantization.quantize_dynamic(model.cpu(), qconfig_spec, dtype=torch.qint8)
+
+def quantize_onnx_model(fp32_path: str) -> str:
+    """
+    Write a dynamic INT8 copy of an exported ONNX graph next to it (once) and return its path.
+    """
+    int8_path = os.path.splitext(fp32_path)[0] + ".int8.onnx"
+    if not os.path.exists(int8_path) or os.path.getmtime(int8_path) < os.path.getmtime(fp32_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        logging.info(f"Quantized {fp32_path} -> {int8_path}")
+    return int8_path
@@ -0,0 +1,132 @@
+import logging
+import os
+from typing import Iterable, Optional
+from qdrant_client.http.models import (
+    Distance, HnswConfigDiff, OptimizersConfigDiff, PayloadSchemaType, QuantizationSearchParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams,
+    VectorParams, VectorParamsDiff,
+)
+
+# Declarative storage/search settings for a Qdrant collection. Keys left out
+# fall back to Qdrant's defaults. QDRANT_PROFILE selects one by name.
+PROFILES = {
+    # Qdrant defaults: float32 vectors and HNSW graph in RAM
+    "default": {},
+    # Memory-bound tiers: int8 copies in RAM for HNSW traversal, float32
+    # originals on disk and only read to rescore the oversampled candidates
+    "compact": {
+        "hnsw": {"m": 16, "ef_construct": 100},
+        "on_disk": True,
+        "quantization": {"quantile": 0.99, "always_ram": True},
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 2.0},
+        "optimizers": {"indexing_threshold": 20000, "memmap_threshold": 20000},
+    },
+    # Smallest footprint: the HNSW graph moves to disk as well
+    "compact_lowmem": {
+        "hnsw": {"m": 16, "ef_construct": 100, "on_disk": True},
+        "on_disk": True,
+        "quantization": {"quantile": 0.99, "always_ram": True},
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 3.0},
+        "optimizers": {"indexing_threshold": 20000, "memmap_threshold": 20000},
+    },
+    # Denser graph and wider search for recall over memory
+    "accurate": {
+        "hnsw": {"m": 32, "ef_construct": 256},
+        "search": {"hnsw_ef": 256},
+    },
+}
+
+def get_profile(name: str = None) -> dict:
+    name = (name or os.getenv("QDRANT_PROFILE", "default")).lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown QDRANT_PROFILE '{name}', expected one of {sorted(PROFILES)}")
+    return PROFILES[name]
+
+def _quantization_config(profile: dict) -> Optional[ScalarQuantization]:
+    quantization = profile.get("quantization")
+    if not quantization:
+        return None
+    return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, **quantization))
+
+def create_collection_kwargs(profile: dict, vector_size: int) -> dict:
+    """Arguments for create_collection that build the collection with this profile."""
+    kwargs = {"vectors_config": VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=profile.get("on_disk"))}
+    if profile.get("hnsw"):
+        kwargs["hnsw_config"] = HnswConfigDiff(**profile["hnsw"])
+    if profile.get("optimizers"):
+        kwargs["optimizers_config"] = OptimizersConfigDiff(**profile["optimizers"])
+    if profile.get("quantization"):
+        kwargs["quantization_config"] = _quantization_config(profile)
+    return kwargs
+
+def search_params(profile: dict) -> Optional[SearchParams]:
+    """Per-query params matching the profile (ef, rescoring of quantized candidates)."""
+    search = dict(profile.get("search") or {})
+    if not search:
+        return None
+    quantization = None
+    if "rescore" in search or "oversampling" in search:
+        quantization = QuantizationSearchParams(rescore=search.pop("rescore", True), oversampling=search.pop("oversampling", None))
+    return SearchParams(quantization=quantization, **search)
+
+def migrate_collection(client, collection_name: str, profile: dict) -> bool:
+    """
+    Bring an existing Qdrant collection's storage settings in line with the
+    profile. Only differing settings are sent, so calling this on every
+    startup does not trigger needless re-optimization. Returns True if
+    anything changed.
+    """
+    if not hasattr(client, "get_collection"):
+        # The local index has no tunable storage
+        return False
+    config = client.get_collection(collection_name).config
+    updates = {}
+
+    hnsw = profile.get("hnsw") or {}
+    if any(getattr(config.hnsw_config, key, None) != value for key, value in hnsw.items()):
+        updates["hnsw_config"] = HnswConfigDiff(**hnsw)
+
+    optimizers = profile.get("optimizers") or {}
+    if any(getattr(config.optimizer_config, key, None) != value for key, value in optimizers.items()):
+        updates["optimizers_config"] = OptimizersConfigDiff(**optimizers)
+
+    if "on_disk" in profile and bool(getattr(config.params.vectors, "on_disk", False)) != profile["on_disk"]:
+        updates["vectors_config"] = {"": VectorParamsDiff(on_disk=profile["on_disk"])}
+
+    quantization = _quantization_config(profile)
+    current = config.quantization_config
+    if quantization is not None and (current is None or getattr(current, "scalar", None) != quantization.scalar):
+        updates["quantization_config"] = quantization
+
+    if not updates:
+        return False
+    client.update_collection(collection_name=collection_name, **updates)
+    logging.info(f"Migrated collection {collection_name}: {sorted(updates)}")
+    return True
+
+def ensure_payload_indexes(client, collection_name: str, fields: Iterable[str]) -> list:
+    """
+    Create a keyword payload index for each field the collection does not
+    index yet, so fields added to the filters later also reach collections
+    created before them. Existing indexes are left alone. Returns the
+    fields that were created.
+    """
+    # The local index filters in Python and reports no schema
+    existing = set(client.get_collection(collection_name).payload_schema or {}) if hasattr(client, "get_collection") else set()
+    created = []
+    for field in fields:
+        if field in existing:
+            continue
+        try:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=PayloadSchemaType.KEYWORD,
+                wait=True
+            )
+            created.append(field)
+        except Exception as e:
+            logging.error(f"Failed to create index for {field}: {e}")
+    if created and existing:
+        logging.info(f"Added payload indexes to {collection_name}: {created}")
+    return created
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+from PIL import Image
+
+from .image_processor import ImageProcessor
+from .inference_executor import InferenceExecutor
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into a single CLIP forward pass.
+
+    Requests are queued and flushed either when max_batch_size images are waiting
+    or when the oldest request has waited max_wait_ms, whichever comes first.
+    """
+    def __init__(self, image_processor: ImageProcessor, executor: InferenceExecutor, max_batch_size: int = 16, max_wait_ms: float = 10.0):
+        self.image_processor = image_processor
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self):
+        # The queue and worker task must belong to the running event loop
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def embed(self, image: Image.Image) -> List[float]:
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future))
+        return await future
+
+    async def _collect_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # Drop requests whose caller has already gone away
+            batch = [(image, future) for image, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            images = [image for image, _ in batch]
+            try:
+                vectors = await self.executor.run(self.image_processor.get_embeddings, images)
+            except Exception as e:
+                logging.error(f"Batched embedding failed ({len(images)} images): {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, "embedding_cache.db")
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+class EmbeddingCache:
+    """
+    Content-addressed store of CLIP vectors, keyed by (sha256 of image bytes, model id).
+
+    Vectors are kept as float16 blobs in SQLite, so a reseed only runs inference
+    for images whose bytes have never been embedded by this model before.
+    """
+    def __init__(self, model_id: str, path: str = None):
+        self.model_id = model_id
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS Embedding (
+                hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (hash, model)
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, hash_: str) -> Optional[List[float]]:
+        return self.get_many([hash_]).get(hash_)
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        hashes = list(set(hashes))
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM Embedding WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_id, *chunk]
+                ).fetchall()
+            for hash_, blob in rows:
+                found[hash_] = np.frombuffer(blob, dtype=np.float16).astype(np.float32).tolist()
+        return found
+
+    def put(self, hash_: str, vector: List[float]):
+        self.put_many({hash_: vector})
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        rows = [
+            (hash_, self.model_id, np.asarray(vector, dtype=np.float16).tobytes())
+            for hash_, vector in vectors.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO Embedding (hash, model, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,112 @@
+import io
+from typing import List, Tuple, Union
+import numpy as np
+import torch
+from PIL import Image
+
+CLIP_INPUT_SIZE = 224
+# Normalization constants from openai/clip-vit-base-patch32's preprocessor_config.json
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+_SCALE = (1.0 / (255.0 * CLIP_STD))[:, None, None]
+_SHIFT = (CLIP_MEAN / CLIP_STD)[:, None, None]
+
+def _flatten_alpha(img: Image.Image) -> Image.Image:
+    # Composite transparent images onto white so RGBA/LA/P inputs embed like the UI shows them
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[3])
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+def resize_and_crop(img: Image.Image, size: int = CLIP_INPUT_SIZE, extent: Tuple[float, float] = None) -> Image.Image:
+    """
+    Equivalent of CLIP's shortest-side resize followed by a center crop, done
+    as one resample of the source region the crop covers. The region uses
+    CLIPProcessor's rounding (long side truncated, crop offset floored) so
+    both sample the same grid. reducing_gap lets PIL box-reduce large images
+    cheaply before the bicubic pass.
+
+    extent is the (width, height) the original image spans in img's pixels
+    when img is a draft-mode decode, whose size is rounded up.
+    """
+    w, h = extent or img.size
+    if (w, h) == (size, size):
+        return img
+    long_side = int(size * max(w, h) / min(w, h))
+    new_w, new_h = (size, long_side) if w <= h else (long_side, size)
+    left, top = (new_w - size) // 2, (new_h - size) // 2
+    scale_x, scale_y = w / new_w, h / new_h
+    box = (left * scale_x, top * scale_y, (left + size) * scale_x, (top + size) * scale_y)
+    return img.resize((size, size), Image.BICUBIC, box=box, reducing_gap=3.0)
+
+def cache_model_id(model_id: str) -> str:
+    """
+    Embedding cache key for vectors computed from this module's pixels. They
+    are close to CLIPProcessor's but not identical, so the two are cached apart.
+    """
+    return f"{model_id}:fastpre"
+
+def load_image(data: Union[bytes, str], size: int = CLIP_INPUT_SIZE) -> Image.Image:
+    """
+    Decode an upload or file straight to a size x size RGB image.
+
+    JPEGs are decoded in draft mode, so the DCT is scaled down to the smallest
+    size that still covers twice the crop: scaling all the way down aliases
+    visibly. Animated images use their first frame.
+    """
+    img = Image.open(io.BytesIO(data) if isinstance(data, bytes) else data)
+    if getattr(img, "is_animated", False):
+        img.seek(0)
+    extent = None
+    if img.format == "JPEG":
+        drafted = img.draft("RGB", (2 * size, 2 * size))
+        if drafted:
+            extent = drafted[1][2:]
+    return resize_and_crop(_flatten_alpha(img), size, extent)
+
+def open_frame(data: Union[bytes, str], max_side: int) -> Image.Image:
+    """
+    Decode an upload to an RGB frame whose longer side is at most max_side,
+    for detection and cropping. Same first-frame, alpha and JPEG draft
+    handling as load_image, without the square crop.
+    """
+    img = Image.open(io.BytesIO(data) if isinstance(data, bytes) else data)
+    if getattr(img, "is_animated", False):
+        img.seek(0)
+    if img.format == "JPEG":
+        img.draft("RGB", (max_side, max_side))
+    img = _flatten_alpha(img)
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.BICUBIC, reducing_gap=3.0)
+    return img
+
+def square_crop(img: Image.Image, box, margin: float = 0.1) -> Image.Image:
+    """
+    Crop a normalized (x1, y1, x2, y2) box grown by `margin` and widened to a
+    square, so CLIP's center crop does not cut off a tall or wide garment.
+    Parts of the square outside the frame are filled with white.
+    """
+    w, h = img.size
+    x1, y1, x2, y2 = box[0] * w, box[1] * h, box[2] * w, box[3] * h
+    side = max(x2 - x1, y2 - y1) * (1 + 2 * margin)
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    left, top = int(round(cx - side / 2)), int(round(cy - side / 2))
+    size = max(1, int(round(side)))
+    crop = Image.new("RGB", (size, size), (255, 255, 255))
+    region = img.crop((max(left, 0), max(top, 0), min(left + size, w), min(top + size, h)))
+    crop.paste(region, (max(-left, 0), max(-top, 0)))
+    return crop
+
+def to_pixel_values(images: List[Image.Image], size: int = CLIP_INPUT_SIZE) -> torch.Tensor:
+    """
+    Batch of images -> normalized (N, 3, size, size) float32 tensor, pinned when CUDA is available.
+    """
+    batch = np.stack([np.asarray(resize_and_crop(_flatten_alpha(img), size), dtype=np.uint8) for img in images])
+    out = torch.empty((len(images), 3, size, size), dtype=torch.float32, pin_memory=torch.cuda.is_available())
+    # (x / 255 - mean) / std, fused into one multiply-subtract written straight into the tensor
+    view = out.numpy()
+    np.multiply(batch.transpose(0, 3, 1, 2), _SCALE, out=view)
+    view -= _SHIFT
+    return out
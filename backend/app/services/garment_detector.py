@@ -0,0 +1,225 @@
+import ast
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_ONNX_DIR = os.path.join(BASE_DIR, "models", "yolo")
+# Gray padding ultralytics letterboxes with during training
+LETTERBOX_FILL = 114
+
+def find_best_model() -> Optional[str]:
+    """
+    YOLO_MODEL_PATH if set (best.pt or an exported .onnx), otherwise the most
+    recently written runs/detect/*/weights/best.pt under backend/ or the repo root.
+    """
+    if os.getenv("YOLO_MODEL_PATH"):
+        return os.getenv("YOLO_MODEL_PATH")
+    candidates = []
+    for root in (BASE_DIR, os.path.dirname(BASE_DIR)):
+        candidates.extend(glob.glob(os.path.join(root, "runs", "detect", "*", "weights", "best.pt")))
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def export_onnx(weights_path: str, imgsz: int, cache_dir: str = DEFAULT_ONNX_DIR) -> str:
+    """
+    Export a trained best.pt to ONNX with a dynamic batch axis, once per
+    distinct weights file: the graph is cached as <sha256>_<imgsz>.onnx, so
+    retraining into the same path re-exports and restarts reuse the cache.
+    """
+    onnx_path = os.path.join(cache_dir, f"{file_checksum(weights_path)[:16]}_{imgsz}.onnx")
+    if os.path.exists(onnx_path):
+        return onnx_path
+    from ultralytics import YOLO
+    logging.info(f"Exporting {weights_path} to ONNX")
+    exported = YOLO(weights_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=False)
+    os.makedirs(cache_dir, exist_ok=True)
+    # ultralytics writes next to the weights; move into the cache atomically
+    shutil.move(exported, onnx_path + ".tmp")
+    os.replace(onnx_path + ".tmp", onnx_path)
+    return onnx_path
+
+def letterbox_batch(images: List[Image.Image], size: int):
+    """
+    Resize each image to fit size x size keeping its aspect ratio, center it
+    on gray padding and stack into one float32 (N, 3, size, size) batch.
+    Also returns each image's scale (N,) and left/top padding (N, 2) for
+    mapping boxes back.
+    """
+    batch = np.full((len(images), size, size, 3), LETTERBOX_FILL, dtype=np.uint8)
+    scales = np.empty(len(images), dtype=np.float32)
+    pads = np.empty((len(images), 2), dtype=np.float32)
+    for i, image in enumerate(images):
+        w, h = image.size
+        scale = min(size / w, size / h)
+        new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+        left, top = (size - new_w) // 2, (size - new_h) // 2
+        batch[i, top:top + new_h, left:left + new_w] = np.asarray(image.convert("RGB").resize((new_w, new_h), Image.BILINEAR))
+        scales[i] = scale
+        pads[i] = (left, top)
+    # One conversion for the whole batch: NHWC uint8 -> NCHW float in [0, 1]
+    pixels = np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32)
+    pixels *= 1 / 255
+    return pixels, scales, pads
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy non-maximum suppression over xyxy boxes; indices of kept boxes, best first."""
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        order = rest[inter / (areas[best] + areas[rest] - inter + 1e-9) <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+class YoloOnnxModel:
+    """
+    An exported YOLO detection graph on ONNX Runtime (CPU). Class names come
+    from the metadata ultralytics embeds at export time.
+    """
+    def __init__(self, path: str, intra_op_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+
+    def run(self, pixels: np.ndarray) -> np.ndarray:
+        """(N, 4 + classes, anchors) raw predictions: center xywh in input pixels, then class scores."""
+        return self.session.run(None, {self.input_name: pixels})[0]
+
+class GarmentDetector:
+    """
+    Trained YOLO model for garments and accessories (scripts/train_yolo_v4.py),
+    served from a cached ONNX export on ONNX Runtime.
+
+    Images are letterboxed and run in batches of YOLO_BATCH_SIZE. Every
+    YOLO_RELOAD_INTERVAL seconds a background check looks for a newer
+    best.pt; when one appears it is exported and swapped in while requests
+    keep using the previous model. available is False when no model can be
+    loaded (no weights, or a best.pt without ultralytics to export it), so
+    callers can fall back to whole-image search. YOLO_CONFIDENCE,
+    YOLO_IOU and YOLO_MAX_DETECTIONS bound what is returned.
+    """
+    def __init__(self, model_path: str = None, confidence: float = None):
+        # A pinned path is still reloaded when the file itself is replaced
+        self.model_path = model_path
+        self.confidence = confidence if confidence is not None else float(os.getenv("YOLO_CONFIDENCE", "0.35"))
+        self.iou = float(os.getenv("YOLO_IOU", "0.7"))
+        self.max_detections = int(os.getenv("YOLO_MAX_DETECTIONS", "6"))
+        self.imgsz = int(os.getenv("YOLO_IMGSZ", "1024"))
+        self.batch_size = int(os.getenv("YOLO_BATCH_SIZE", "8"))
+        self.reload_interval = float(os.getenv("YOLO_RELOAD_INTERVAL", "60"))
+        self.intra_op_threads = int(os.getenv("YOLO_INTRA_OP_THREADS", "0"))
+        self._refresh_lock = threading.Lock()
+        self._model: Optional[YoloOnnxModel] = None
+        self._source = None
+        self._checked_at = 0.0
+
+    def refresh(self) -> bool:
+        """
+        Load the current best model if it differs from the one being served.
+        Returns True when a new model was swapped in. Blocking (may export).
+        """
+        with self._refresh_lock:
+            self._checked_at = time.monotonic()
+            path = self.model_path or find_best_model()
+            if not path or not os.path.exists(path):
+                return False
+            mtime = os.path.getmtime(path)
+            # Training rewrites best.pt every improving epoch; wait until it settles
+            if self._model is not None and time.time() - mtime < 5:
+                return False
+            if (path, mtime) == self._source:
+                return False
+            # Recorded before loading so a broken file is not retried until it changes
+            self._source = (path, mtime)
+            try:
+                onnx_path = path if path.endswith(".onnx") else export_onnx(path, self.imgsz)
+                model = YoloOnnxModel(onnx_path, self.intra_op_threads)
+            except Exception as e:
+                logging.warning(f"YOLO model {path} could not be loaded: {e}")
+                return False
+            logging.info(f"Serving YOLO model {path} ({onnx_path})")
+            self._model = model
+            return True
+
+    def _current(self) -> Optional[YoloOnnxModel]:
+        if self._model is None and not self._checked_at:
+            # First use loads synchronously; later checks never block a request
+            self.refresh()
+        elif time.monotonic() - self._checked_at > self.reload_interval and not self._refresh_lock.locked():
+            self._checked_at = time.monotonic()
+            threading.Thread(target=self.refresh, name="yolo-reload", daemon=True).start()
+        return self._model
+
+    @property
+    def available(self) -> bool:
+        return self._current() is not None
+
+    def detect(self, image: Image.Image) -> List[Dict]:
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images: List[Image.Image]) -> List[List[Dict]]:
+        """
+        Detections per image as {"class_id", "label", "confidence", "box"},
+        best first, with the box as normalized (x1, y1, x2, y2). Blocking.
+        """
+        model = self._current()
+        if model is None:
+            raise RuntimeError("No YOLO model available")
+        detections = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            pixels, scales, pads = letterbox_batch(chunk, self.imgsz)
+            output = model.run(pixels)
+            for image, prediction, scale, pad in zip(chunk, output, scales, pads):
+                detections.append(self._decode(model, prediction.T, image.size, scale, pad))
+        return detections
+
+    def _decode(self, model: YoloOnnxModel, prediction: np.ndarray, size, scale: float, pad: np.ndarray) -> List[Dict]:
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+        keep = scores >= self.confidence
+        centers, extents, class_ids, scores = prediction[keep, :2], prediction[keep, 2:4], class_ids[keep], scores[keep]
+        boxes = np.concatenate([centers - extents / 2, centers + extents / 2], axis=1)
+        # Offset boxes per class so suppression only happens within a class
+        kept = nms(boxes + class_ids[:, None] * (2 * self.imgsz), scores, self.iou)[:self.max_detections]
+        w, h = size
+        boxes = (boxes[kept] - np.tile(pad, 2)) / scale / np.array([w, h, w, h], dtype=np.float32)
+        boxes = np.clip(boxes, 0, 1)
+        return [
+            {
+                "class_id": int(class_id),
+                "label": model.names.get(int(class_id), str(int(class_id))),
+                "confidence": float(score),
+                "box": [round(float(v), 4) for v in box],
+            }
+            for class_id, score, box in zip(class_ids[kept], scores[kept], boxes)
+        ]
@@ -1,67 +1,137 @@
 from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
+from typing import List
 import torch
-import io
+import os
+import logging
+import threading
+
+from .onnx_encoder import DEFAULT_ONNX_PATH, OnnxImageEncoder, export_vision_onnx
+from .clip_quantization import quantize_torch_model, quantize_onnx_model
+from .fast_preprocess import cache_model_id, to_pixel_values
+
+CLIP_MODEL_ID = "openai/clip-vit-base-patch32"
 
 class ImageProcessor:
-    def __init__(self):
-        # Initialize CLIP
+    """
+    CLIP embeddings for images and text.
+
+    CLIP_RUNTIME selects the image encoder: "torch" (default) runs the full
+    transformers model eagerly, "onnx" serves a vision-only ONNX graph on
+    ONNX Runtime (exported to CLIP_ONNX_PATH on first use) with
+    CLIP_INTRA_OP_THREADS threads. In onnx mode the PyTorch model is only
+    loaded if a text embedding is requested.
+
+    CLIP_QUANTIZE=int8 swaps in a dynamically INT8-quantized image encoder on
+    either runtime. Its vectors differ slightly from fp32, so model_id changes
+    and the embedding cache and index manifest keep them apart. Check recall
+    with scripts/benchmark_quantized_clip.py before enabling it.
+
+    Images are preprocessed by fast_preprocess (single resample + NumPy
+    normalization) unless CLIP_FAST_PREPROCESS=0 selects CLIPProcessor.
+    The two give slightly different vectors, so cache_id keys the embedding
+    cache per preprocessing path (scripts/test_preprocess_parity.py checks
+    the gap).
+    """
+    def __init__(self, runtime: str = None, quantize: str = None):
+        self.runtime = (runtime or os.getenv("CLIP_RUNTIME", "torch")).lower()
+        self.quantize = (quantize or os.getenv("CLIP_QUANTIZE", "none")).lower()
+        self.model_id = CLIP_MODEL_ID if self.quantize == "none" else f"{CLIP_MODEL_ID}:{self.quantize}"
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(self.device)
-        self.clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        if self.quantize == "int8":
+            # Dynamic quantization kernels are CPU-only
+            self.device = "cpu"
+        self.clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID)
+        self.fast_preprocess = os.getenv("CLIP_FAST_PREPROCESS", "1") != "0"
+        # The preprocessing path is part of the embedding cache key, not of model_id
+        self.cache_id = cache_model_id(self.model_id) if self.fast_preprocess else self.model_id
+        self.clip_model = None
+        self._load_lock = threading.Lock()
+        self.onnx_encoder = None
 
-    def get_embedding(self, image: Image.Image):
-        inputs = self.clip_processor(images=image, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            outputs = self.clip_model.get_image_features(**inputs)
-        
+        if self.runtime == "onnx":
+            onnx_path = os.getenv("CLIP_ONNX_PATH", DEFAULT_ONNX_PATH)
+            if not os.path.exists(onnx_path):
+                export_vision_onnx(CLIP_MODEL_ID, onnx_path)
+            if self.quantize == "int8":
+                onnx_path = quantize_onnx_model(onnx_path)
+            self.onnx_encoder = OnnxImageEncoder(onnx_path, intra_op_threads=int(os.getenv("CLIP_INTRA_OP_THREADS", "0")))
+            logging.info(f"CLIP image encoder: ONNX Runtime ({onnx_path})")
+        else:
+            self._load_torch_model()
+            if self.quantize == "int8":
+                self.clip_model = quantize_torch_model(self.clip_model)
+                logging.info("CLIP image encoder: PyTorch dynamic INT8")
+
+    def _load_torch_model(self):
+        # Under onnx the first text queries may arrive together; load the model once
+        if self.clip_model is None:
+            with self._load_lock:
+                if self.clip_model is None:
+                    self.clip_model = CLIPModel.from_pretrained(CLIP_MODEL_ID).to(self.device)
+        return self.clip_model
+
+    def _extract_features(self, outputs, embeds_attr: str):
         # Robustly handle different CLIP output formats
-        if hasattr(outputs, "image_embeds"):
-            image_features = outputs.image_embeds
+        if hasattr(outputs, embeds_attr):
+            features = getattr(outputs, embeds_attr)
         elif hasattr(outputs, "pooler_output"):
-            image_features = outputs.pooler_output
+            features = outputs.pooler_output
         elif isinstance(outputs, (list, tuple)):
-            image_features = outputs[0]
+            features = outputs[0]
         else:
-            image_features = outputs
+            features = outputs
 
         # Final check: must be a tensor
-        if not isinstance(image_features, torch.Tensor):
+        if not isinstance(features, torch.Tensor):
             try:
-                image_features = outputs[0]
+                features = outputs[0]
             except:
                 raise Exception(f"Failed to extract tensor from {type(outputs)}")
-            
+
         # Normalize
-        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
-        return image_features.cpu().numpy()[0].tolist()
+        return features / features.norm(p=2, dim=-1, keepdim=True)
 
-    def get_text_embedding(self, text: str):
+    def get_embeddings(self, images: List[Image.Image]) -> List[List[float]]:
         """
-        Generate embedding for text query.
+        Generate embeddings for several images in a single forward pass.
         """
-        inputs = self.clip_processor(text=text, return_tensors="pt", padding=True, truncation=True).to(self.device)
-        with torch.no_grad():
-            outputs = self.clip_model.get_text_features(**inputs)
-            
-        # Robustly handle different CLIP output formats
-        if hasattr(outputs, "text_embeds"):
-            text_features = outputs.text_embeds
-        elif hasattr(outputs, "pooler_output"):
-            text_features = outputs.pooler_output
-        elif isinstance(outputs, (list, tuple)):
-            text_features = outputs[0]
+        if not images:
+            return []
+        if self.fast_preprocess:
+            pixel_values = to_pixel_values(images)
         else:
-            text_features = outputs
+            pixel_values = self.clip_processor(images=images, return_tensors="pt")["pixel_values"]
 
-        # Final check: must be a tensor
-        if not isinstance(text_features, torch.Tensor):
-            try:
-                text_features = outputs[0]
-            except:
-                raise Exception(f"Failed to extract tensor from {type(outputs)}")
-            
-        # Normalize
-        text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
-        return text_features.cpu().numpy()[0].tolist()
+        if self.onnx_encoder is not None:
+            # The exported graph already normalizes its output
+            return self.onnx_encoder.encode(pixel_values.numpy()).tolist()
+
+        with torch.no_grad():
+            outputs = self.clip_model.get_image_features(pixel_values=pixel_values.to(self.device, non_blocking=True))
+
+        image_features = self._extract_features(outputs, "image_embeds")
+        return image_features.cpu().numpy().tolist()
+
+    def get_embedding(self, image: Image.Image):
+        return self.get_embeddings([image])[0]
 
+    def get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for several text queries in a single forward pass.
+        """
+        if not texts:
+            return []
+        clip_model = self._load_torch_model()
+        inputs = self.clip_processor(text=texts, return_tensors="pt", padding=True, truncation=True).to(self.device)
+        with torch.no_grad():
+            outputs = clip_model.get_text_features(**inputs)
+
+        text_features = self._extract_features(outputs, "text_embeds")
+        return text_features.cpu().numpy().tolist()
+
+    def get_text_embedding(self, text: str):
+        """
+        Generate embedding for text query.
+        """
+        return self.get_text_embeddings([text])[0]
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_MANIFEST_PATH = os.path.join(BASE_DIR, "index_manifest.db")
+
+class IndexManifest:
+    """
+    Durable record of what has been indexed into a collection: one row per
+    point with its source image, content hash, model id and indexed-at time.
+
+    seed_data diffs the metadata JSONL against this table instead of scrolling
+    every point ID out of the vector store on each run.
+    """
+    def __init__(self, collection_name: str, path: str = None):
+        self.collection_name = collection_name
+        self.path = path or os.getenv("INDEX_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS IndexedPoint (
+                collection TEXT NOT NULL,
+                pointId TEXT NOT NULL,
+                source TEXT,
+                contentHash TEXT,
+                model TEXT,
+                indexedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (collection, pointId)
+            )
+        ''')
+        self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM IndexedPoint WHERE collection = ?", (self.collection_name,)).fetchone()[0]
+
+    def indexed_ids(self, model: str = None) -> set:
+        """Point IDs already indexed (by the given model, if set)."""
+        query = "SELECT pointId FROM IndexedPoint WHERE collection = ?"
+        params = [self.collection_name]
+        if model:
+            query += " AND model = ?"
+            params.append(model)
+        with self._lock:
+            return {row[0] for row in self._conn.execute(query, params)}
+
+    def record(self, entries: Iterable[Tuple[str, str, str, str]]):
+        """Store (point_id, source, content_hash, model) rows for freshly indexed points."""
+        rows = [(self.collection_name, *entry) for entry in entries]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO IndexedPoint (collection, pointId, source, contentHash, model, indexedAt) VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                rows
+            )
+            self._conn.commit()
+
+    def remove(self, point_ids: List[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM IndexedPoint WHERE collection = ? AND pointId = ?",
+                [(self.collection_name, str(point_id)) for point_id in point_ids]
+            )
+            self._conn.commit()
+
+    def reset(self, point_ids: Iterable[str] = (), model: str = None):
+        """Replace the manifest with the given IDs, e.g. after reconciling with the collection."""
+        with self._lock:
+            self._conn.execute("DELETE FROM IndexedPoint WHERE collection = ?", (self.collection_name,))
+            self._conn.executemany(
+                "INSERT INTO IndexedPoint (collection, pointId, model) VALUES (?, ?, ?)",
+                [(self.collection_name, str(point_id), model) for point_id in point_ids]
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
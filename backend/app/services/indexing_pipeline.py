@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from PIL import Image
+import httpx
+from qdrant_client.http.models import PointStruct
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from .image_processor import ImageProcessor
+from .embedding_cache import EmbeddingCache, content_hash
+from .index_manifest import IndexManifest
+from .vector_index import AsyncVectorIndex
+from .fast_preprocess import load_image
+
+STAGES = ("fetched", "cached", "decoded", "embedded", "upserted", "failed")
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+async def fetch_image_bytes(http_client: httpx.AsyncClient, url: str) -> bytes:
+    resp = await http_client.get(url)
+    resp.raise_for_status()
+    return resp.content
+
+def read_file_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def decode_image(content: bytes) -> Image.Image:
+    return load_image(content)
+
+def lookup_or_decode(cache: Optional[EmbeddingCache], content: bytes):
+    # Returns (hash, cached vector, None) on a cache hit, else (hash, None, decoded image)
+    hash_ = content_hash(content)
+    if cache is not None:
+        vector = cache.get(hash_)
+        if vector is not None:
+            return hash_, vector, None
+    return hash_, None, decode_image(content)
+
+class IndexingPipeline:
+    """
+    Staged seeding pipeline: fetch -> decode -> embed -> upsert.
+
+    Each stage runs its own workers and hands jobs to the next through a bounded
+    asyncio.Queue, so network round-trips, JPEG decoding, CLIP inference and
+    Qdrant writes all overlap. A job is a dict with point_id, source (URL or
+    local path), is_url, title and payload.
+
+    When an EmbeddingCache is given, images whose bytes were embedded before
+    skip decoding and inference and go straight to the upserter. When an
+    IndexManifest is given, every successfully upserted point is recorded in it.
+    """
+    def __init__(
+        self,
+        client: AsyncVectorIndex,
+        collection_name: str,
+        image_processor: ImageProcessor,
+        status: Dict,
+        cache: Optional[EmbeddingCache] = None,
+        manifest: Optional[IndexManifest] = None,
+        fetch_concurrency: int = None,
+        decode_workers: int = None,
+        embed_batch_size: int = None,
+        upsert_batch_size: int = None,
+        upsert_parallelism: int = None,
+        queue_size: int = None,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.image_processor = image_processor
+        self.status = status
+        self.cache = cache
+        self.manifest = manifest
+        self.fetch_concurrency = fetch_concurrency or int(os.getenv("SEED_FETCH_CONCURRENCY", "16"))
+        self.decode_workers = decode_workers or int(os.getenv("SEED_DECODE_WORKERS", "4"))
+        self.embed_batch_size = embed_batch_size or int(os.getenv("SEED_EMBED_BATCH_SIZE", "32"))
+        self.upsert_batch_size = upsert_batch_size or int(os.getenv("SEED_UPSERT_BATCH_SIZE", "50"))
+        self.upsert_parallelism = upsert_parallelism or int(os.getenv("SEED_UPSERT_PARALLELISM", "2"))
+        self.queue_size = queue_size or int(os.getenv("SEED_QUEUE_SIZE", "256"))
+        self._started_at = None
+
+    def _reset_counters(self):
+        self._started_at = time.monotonic()
+        self.status["stages"] = {stage: {"count": 0, "per_sec": 0.0} for stage in STAGES}
+
+    def _count(self, stage: str, n: int = 1):
+        counter = self.status["stages"][stage]
+        counter["count"] += n
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        counter["per_sec"] = round(counter["count"] / elapsed, 2)
+        if stage in ("upserted", "failed"):
+            stages = self.status["stages"]
+            self.status["current"] = stages["upserted"]["count"] + stages["failed"]["count"]
+
+    async def run(self, jobs: List[Dict]) -> int:
+        self._reset_counters()
+        if not jobs:
+            return 0
+
+        fetch_q = asyncio.Queue(maxsize=self.queue_size)
+        decode_q = asyncio.Queue(maxsize=self.queue_size)
+        embed_q = asyncio.Queue(maxsize=self.queue_size)
+        upsert_q = asyncio.Queue(maxsize=self.queue_size)
+
+        decode_pool = ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="seed-decode")
+        # A single inference thread; torch already parallelizes inside the forward pass
+        embed_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="seed-embed")
+
+        try:
+            async with httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_connections=self.fetch_concurrency)) as http_client:
+                producer = asyncio.create_task(self._produce(jobs, fetch_q))
+                fetchers = [asyncio.create_task(self._fetch_worker(http_client, fetch_q, decode_q)) for _ in range(self.fetch_concurrency)]
+                decoders = [asyncio.create_task(self._decode_worker(decode_pool, decode_q, embed_q, upsert_q)) for _ in range(self.decode_workers)]
+                embedder = asyncio.create_task(self._embed_worker(embed_pool, embed_q, upsert_q))
+                upserters = [asyncio.create_task(self._upsert_worker(upsert_q)) for _ in range(self.upsert_parallelism)]
+
+                # Drain stage by stage, sending one sentinel per downstream worker
+                await producer
+                await self._close(fetch_q, fetchers)
+                await self._close(decode_q, decoders)
+                await self._close(embed_q, [embedder])
+                await self._close(upsert_q, upserters)
+        finally:
+            decode_pool.shutdown(wait=False)
+            embed_pool.shutdown(wait=False)
+
+        return self.status["stages"]["upserted"]["count"]
+
+    async def _close(self, queue: asyncio.Queue, workers: List[asyncio.Task]):
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    async def _produce(self, jobs: List[Dict], fetch_q: asyncio.Queue):
+        for job in jobs:
+            await fetch_q.put(job)
+
+    async def _fetch_worker(self, http_client: httpx.AsyncClient, fetch_q: asyncio.Queue, decode_q: asyncio.Queue):
+        while True:
+            job = await fetch_q.get()
+            if job is None:
+                return
+            try:
+                if job["is_url"]:
+                    job["content"] = await fetch_image_bytes(http_client, job["source"])
+                else:
+                    job["content"] = await asyncio.get_running_loop().run_in_executor(None, read_file_bytes, job["source"])
+                self._count("fetched")
+                await decode_q.put(job)
+            except Exception as e:
+                logging.error(f"Error fetching image {job['source']}: {e}")
+                self._count("failed")
+
+    async def _decode_worker(self, decode_pool: ThreadPoolExecutor, decode_q: asyncio.Queue, embed_q: asyncio.Queue, upsert_q: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await decode_q.get()
+            if job is None:
+                return
+            try:
+                hash_, vector, image = await loop.run_in_executor(decode_pool, lookup_or_decode, self.cache, job.pop("content"))
+                job["content_hash"] = hash_
+                if vector is not None:
+                    self._count("cached")
+                    await upsert_q.put((job, PointStruct(id=job["point_id"], vector=vector, payload=job["payload"])))
+                    continue
+                job["image"] = image
+                self._count("decoded")
+                await embed_q.put(job)
+            except Exception as e:
+                logging.error(f"Error decoding image {job['source']}: {e}")
+                self._count("failed")
+
+    async def _embed_worker(self, embed_pool: ThreadPoolExecutor, embed_q: asyncio.Queue, upsert_q: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            # Block for the first job, then take whatever else is already queued
+            batch = []
+            job = await embed_q.get()
+            if job is None:
+                break
+            batch.append(job)
+            while len(batch) < self.embed_batch_size and not embed_q.empty():
+                job = embed_q.get_nowait()
+                if job is None:
+                    done = True
+                    break
+                batch.append(job)
+
+            images = [job.pop("image") for job in batch]
+            try:
+                vectors = await loop.run_in_executor(embed_pool, self.image_processor.get_embeddings, images)
+            except Exception as e:
+                logging.error(f"Error embedding batch of {len(batch)} images: {e}")
+                self._count("failed", len(batch))
+                continue
+
+            self._count("embedded", len(batch))
+            if self.cache is not None:
+                await loop.run_in_executor(None, self.cache.put_many, {job["content_hash"]: vector for job, vector in zip(batch, vectors)})
+            for job, vector in zip(batch, vectors):
+                await upsert_q.put((job, PointStruct(id=job["point_id"], vector=vector, payload=job["payload"])))
+
+    async def _upsert_worker(self, upsert_q: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        batch = []
+        while True:
+            entry = await upsert_q.get()
+            if entry is not None:
+                batch.append(entry)
+            if batch and (entry is None or len(batch) >= self.upsert_batch_size):
+                points = [point for _, point in batch]
+                try:
+                    await self.client.upsert(collection_name=self.collection_name, points=points)
+                    self._count("upserted", len(points))
+                    if self.manifest is not None:
+                        entries = [(job["point_id"], job["source"], job.get("content_hash"), self.image_processor.model_id) for job, _ in batch]
+                        await loop.run_in_executor(None, self.manifest.record, entries)
+                    self.status["last_item"] = batch[-1][0]["title"]
+                    logging.info(f"--- [VectorDB] Batch upserted: {len(points)} points ---")
+                except Exception as e:
+                    logging.error(f"Error upserting batch of {len(points)} points: {e}")
+                    self._count("failed", len(points))
+                batch = []
+            if entry is None:
+                return
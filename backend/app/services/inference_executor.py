@@ -0,0 +1,43 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for blocking work (image decoding, CLIP forward passes,
+    synchronous Qdrant calls) so it never runs on the asyncio event loop.
+
+    Requests must hold a slot from reserve() while they use the pool. Once
+    max_queue_depth requests are in flight, new ones are rejected with a 503
+    instead of piling up behind the model.
+    """
+    def __init__(self, max_workers: int = None, max_queue_depth: int = None):
+        self.max_workers = max_workers or int(os.getenv("INFERENCE_WORKERS", "2"))
+        self.max_queue_depth = max_queue_depth or int(os.getenv("INFERENCE_MAX_QUEUE", "32"))
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        # Only touched from the event loop thread, so a plain counter is enough
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def reserve(self):
+        if self._in_flight >= self.max_queue_depth:
+            raise HTTPException(status_code=503, detail="Search is busy. Please retry in a moment.", headers={"Retry-After": "1"})
+        self._in_flight += 1
+        try:
+            yield self
+        finally:
+            self._in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from qdrant_client.http.models import Filter, ScoredPoint
+
+from .opt_out_enforcer import build_exclusion_conditions
+from .product_index import pool_vectors, scan_products
+from .vector_index import VectorIndex, _compile_filter
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_GRAPH_PATH = os.path.join(BASE_DIR, "knn_graph.npz")
+
+def product_fingerprint(point_ids: List[str]) -> str:
+    """Changes when a product gains or loses images, i.e. when its vector changes."""
+    return hashlib.md5(",".join(sorted(point_ids)).encode("utf-8")).hexdigest()[:16]
+
+def shop_codes(shops: List[Optional[str]]) -> np.ndarray:
+    """Integer code per shop name; products without one never count as the same shop."""
+    codes = {}
+    return np.asarray([
+        codes.setdefault(shop, len(codes)) if shop and shop != "Unknown" else -(i + 1)
+        for i, shop in enumerate(shops)
+    ], dtype=np.int64)
+
+def top_k_neighbors(queries: np.ndarray, query_shops: np.ndarray, matrix: np.ndarray, shops: np.ndarray, k: int, block_size: int = 1024, duplicate_threshold: float = 0.9, query_rows: np.ndarray = None):
+    """
+    The k most similar rows of `matrix` for every query (all unit vectors),
+    block_size queries per matrix multiply so memory stays at block_size x n.
+    Rows from the query's shop scoring at least duplicate_threshold are
+    treated as variants of the same item and skipped, as is query_rows (the
+    query's own row in `matrix`, if it has one). Returns (rows int32 (m, k)
+    padded with -1, scores float32 (m, k)), best first.
+    """
+    rows = np.full((len(queries), k), -1, dtype=np.int32)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    kk = min(k, len(matrix))
+    if kk == 0:
+        return rows, scores
+    for start in range(0, len(queries), block_size):
+        stop = min(start + block_size, len(queries))
+        sims = queries[start:stop] @ matrix.T
+        sims[(query_shops[start:stop, None] == shops[None, :]) & (sims >= duplicate_threshold)] = -np.inf
+        if query_rows is not None:
+            sims[np.arange(stop - start), query_rows[start:stop]] = -np.inf
+        top = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        valid = np.isfinite(top_scores)
+        rows[start:stop, :kk] = np.where(valid, top, -1)
+        scores[start:stop, :kk] = np.where(valid, top_scores, 0)
+    return rows, scores
+
+def merge_neighbors(rows_a: np.ndarray, scores_a: np.ndarray, rows_b: np.ndarray, scores_b: np.ndarray, k: int):
+    """Best k of two disjoint neighbor lists per row."""
+    rows = np.concatenate([rows_a, rows_b], axis=1)
+    scores = np.where(rows >= 0, np.concatenate([scores_a, scores_b], axis=1), -np.inf)
+    order = np.argsort(-scores, axis=1)[:, :k]
+    rows, scores = np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+    return np.where(np.isfinite(scores), rows, -1).astype(np.int32), np.where(np.isfinite(scores), scores, 0).astype(np.float32)
+
+def write_knn_graph(path: str, rows: np.ndarray, scores: np.ndarray, table: List[Dict], truncated: np.ndarray = None):
+    # Written beside the target and renamed, so readers never see a partial table
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        rows=rows,
+        scores=scores.astype(np.float16),
+        truncated=truncated if truncated is not None else np.zeros(len(rows), dtype=bool),
+        products=np.array(json.dumps(table, ensure_ascii=False))
+    )
+    os.replace(tmp_path, path)
+
+def build_knn_graph(client: VectorIndex, image_collection: str, path: str = None, k: int = None, block_size: int = None, duplicate_threshold: float = None, full: bool = False) -> Dict:
+    """
+    Precompute the top-k similar products of every product into the lookup
+    table at `path` (KNN_GRAPH_PATH). Products are pooled the same way as the
+    product index. Unless `full`, an existing table with the same k is
+    updated incrementally: only new or changed products are scored against
+    everything, and unchanged products only against those, except rows that
+    lost a neighbor, which are recomputed. Run with full=True after
+    re-embedding the collection with another model or changing
+    KNN_DUPLICATE_THRESHOLD / PRODUCT_POOLING. Blocking.
+    """
+    path = path or os.getenv("KNN_GRAPH_PATH", DEFAULT_GRAPH_PATH)
+    k = k or int(os.getenv("KNN_GRAPH_K", "32"))
+    block_size = block_size or int(os.getenv("KNN_GRAPH_BLOCK_SIZE", "1024"))
+    duplicate_threshold = duplicate_threshold if duplicate_threshold is not None else float(os.getenv("KNN_DUPLICATE_THRESHOLD", "0.9"))
+    pooling = os.getenv("PRODUCT_POOLING", "mean").lower()
+
+    products = scan_products(client, image_collection)
+    keys = sorted(products)
+    n = len(keys)
+    matrix = np.asarray([pool_vectors(products[key]["vectors"], pooling) for key in keys], dtype=np.float32) if n else np.zeros((0, 1), dtype=np.float32)
+    shops = shop_codes([products[key]["payload"].get("shopName") for key in keys])
+    fingerprints = [product_fingerprint(products[key]["pointIds"]) for key in keys]
+
+    rows = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    recompute = np.arange(n)
+    previous = None if full else KnnGraph.read(path)
+    if previous is not None and previous["rows"].shape[1] == k:
+        old_row_of = {p["key"]: i for i, p in enumerate(previous["products"])}
+        # Old row -> new row for products whose vector is unchanged, else -1
+        remap = np.full(len(previous["products"]) + 1, -1, dtype=np.int32)
+        unchanged = []
+        for i, (key, fingerprint) in enumerate(zip(keys, fingerprints)):
+            old = old_row_of.get(key)
+            if old is not None and previous["products"][old]["fingerprint"] == fingerprint:
+                remap[old] = i
+                unchanged.append((i, old))
+        changed = np.asarray(sorted(set(range(n)) - {i for i, _ in unchanged}), dtype=np.int64)
+
+        new_rows, old_rows = np.asarray([i for i, _ in unchanged], dtype=np.int64), np.asarray([o for _, o in unchanged], dtype=np.int64)
+        # Padding (-1) indexes the extra last slot of remap and stays -1
+        kept = remap[previous["rows"][old_rows]] if len(old_rows) else np.zeros((0, k), dtype=np.int32)
+        lost = ((previous["rows"][old_rows] >= 0) & (kept < 0)).any(axis=1) if len(old_rows) else np.zeros(0, dtype=bool)
+        # Rows that lost neighbors to remove_products() since the last build
+        lost |= previous["truncated"][old_rows]
+
+        merge = new_rows[~lost]
+        if len(merge) and not len(changed):
+            # Nothing new to score against (no-op or deletion-only run)
+            rows[merge] = kept[~lost]
+            scores[merge] = previous["scores"][old_rows[~lost]].astype(np.float32)
+        elif len(merge):
+            candidate_rows, candidate_scores = top_k_neighbors(matrix[merge], shops[merge], matrix[changed], shops[changed], k, block_size, duplicate_threshold)
+            candidate_rows = np.where(candidate_rows >= 0, changed[np.maximum(candidate_rows, 0)], -1)
+            rows[merge], scores[merge] = merge_neighbors(
+                kept[~lost], previous["scores"][old_rows[~lost]].astype(np.float32),
+                candidate_rows, candidate_scores, k
+            )
+        recompute = np.concatenate([changed, new_rows[lost]]).astype(np.int64)
+        logging.info(f"k-NN graph: {len(changed)} new or changed products, {int(lost.sum())} rows lost a neighbor, {len(merge)} merged")
+
+    if len(recompute):
+        rows[recompute], scores[recompute] = top_k_neighbors(matrix[recompute], shops[recompute], matrix, shops, k, block_size, duplicate_threshold, query_rows=recompute)
+
+    table = [
+        {"key": key, "pointId": products[key]["pointIds"][0], "fingerprint": fingerprint, "payload": products[key]["payload"]}
+        for key, fingerprint in zip(keys, fingerprints)
+    ]
+    write_knn_graph(path, rows, scores, table)
+    return {"products": n, "recomputed": len(recompute), "k": k, "path": path}
+
+class KnnGraph:
+    """
+    Read side of the precomputed k-NN table (scripts/build_knn_graph.py):
+    neighbors(key) is a dict lookup plus a slice of two small arrays, no
+    vector search. Keys are a product's boothUrl, BOOTH item ID or
+    representative point ID. The file is reloaded when the build job
+    replaces it.
+    """
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("KNN_GRAPH_PATH", DEFAULT_GRAPH_PATH)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._table = None
+
+    @staticmethod
+    def read(path: str) -> Optional[Dict]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {
+                "rows": data["rows"],
+                "scores": data["scores"],
+                # Tables written before truncated existed had no removals
+                "truncated": data["truncated"] if "truncated" in data.files else np.zeros(len(data["rows"]), dtype=bool),
+                "products": json.loads(str(data["products"])),
+            }
+
+    def _current(self) -> Optional[Dict]:
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    table = self.read(self.path) if mtime is not None else None
+                    if table is not None:
+                        row_of = {}
+                        for i, product in enumerate(table["products"]):
+                            row_of[product["key"]] = i
+                            row_of[product["pointId"]] = i
+                            if product["payload"].get("itemId"):
+                                row_of[str(product["payload"]["itemId"])] = i
+                        table["row_of"] = row_of
+                        logging.info(f"Loaded k-NN graph: {len(table['products'])} products from {self.path}")
+                    self._table, self._mtime = table, mtime
+        return self._table
+
+    def __contains__(self, key: str) -> bool:
+        table = self._current()
+        return table is not None and key in table["row_of"]
+
+    def neighbors(self, key: str, limit: int = 10, query_filter: Filter = None) -> Optional[List[ScoredPoint]]:
+        """
+        Up to `limit` precomputed neighbors of the product passing query_filter
+        (opt-outs, category, ...). None when the key is unknown, or when the
+        filter left fewer than `limit` of a full row, as better matches may
+        lie beyond the stored k; callers then fall back to a vector search.
+        """
+        table = self._current()
+        if table is None or key not in table["row_of"]:
+            return None
+        row = table["row_of"][key]
+        matches = _compile_filter(query_filter) if query_filter is not None else None
+        results = []
+        for neighbor, score in zip(table["rows"][row], table["scores"][row]):
+            if neighbor < 0:
+                break
+            product = table["products"][neighbor]
+            if matches is not None and not matches(product["pointId"], product["payload"]):
+                continue
+            results.append(ScoredPoint(id=product["pointId"], version=0, score=float(score), payload=product["payload"]))
+            if len(results) >= limit:
+                return results
+        if table["rows"][row][-1] >= 0 or table["truncated"][row]:
+            return None
+        return results
+
+    def remove_products(self, identifiers) -> int:
+        """
+        Drop the products of opted-out shops/items (same matching as
+        OptOutEnforcer) from the table on disk, so no process serves them
+        once the query-time filter stops covering them. Rows that lose a
+        neighbor are marked truncated: reads fall back to a vector search
+        when they run short, and the next build recomputes them. Blocking.
+        """
+        conditions = build_exclusion_conditions(identifiers)
+        with self._lock:
+            table = self.read(self.path)
+            if table is None or not conditions:
+                return 0
+            matches = _compile_filter(Filter(should=conditions))
+            keep = np.asarray([not matches(p["pointId"], p["payload"]) for p in table["products"]], dtype=bool)
+            if keep.all():
+                return 0
+
+            # Old row -> new row, -1 for removed products; the extra slot maps padding
+            remap = np.full(len(keep) + 1, -1, dtype=np.int32)
+            remap[np.flatnonzero(keep)] = np.arange(int(keep.sum()), dtype=np.int32)
+            old_rows, scores = table["rows"][keep], table["scores"][keep].astype(np.float32)
+            rows = remap[old_rows]
+            truncated = table["truncated"][keep] | ((old_rows >= 0) & (rows < 0)).any(axis=1)
+            # Close the gaps so each row stays best first with -1 padding at the end
+            order = np.argsort(rows < 0, axis=1, kind="stable")
+            rows, scores = np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+            scores[rows < 0] = 0
+            write_knn_graph(self.path, rows, scores, [p for p, k in zip(table["products"], keep) if k], truncated)
+            # Force a reload on the next read even if the mtime resolution hides the rewrite
+            self._mtime = None
+        removed = int((~keep).sum())
+        logging.info(f"k-NN graph: removed {removed} opted-out products, {int(truncated.sum())} rows truncated")
+        return removed
@@ -0,0 +1,71 @@
+import inspect
+import logging
+import os
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_ONNX_PATH = os.path.join(BASE_DIR, "models", "clip_vision.onnx")
+
+def export_vision_onnx(model_id: str, output_path: str = DEFAULT_ONNX_PATH, opset: int = 14) -> str:
+    """
+    Export CLIP's vision tower plus projection as a standalone ONNX graph that
+    maps pixel_values (N, 3, 224, 224) to L2-normalized image embeddings (N, 512).
+    """
+    import torch
+    from transformers import CLIPModel
+
+    class VisionEncoder(torch.nn.Module):
+        def __init__(self, clip_model):
+            super().__init__()
+            self.vision_model = clip_model.vision_model
+            self.visual_projection = clip_model.visual_projection
+
+        def forward(self, pixel_values):
+            pooled = self.vision_model(pixel_values=pixel_values).pooler_output
+            embeds = self.visual_projection(pooled)
+            return embeds / embeds.norm(p=2, dim=-1, keepdim=True)
+
+    clip_model = CLIPModel.from_pretrained(model_id).eval()
+    encoder = VisionEncoder(clip_model).eval()
+    size = clip_model.config.vision_config.image_size
+    dummy = torch.randn(1, 3, size, size)
+
+    export_kwargs = {}
+    # Newer torch defaults to the dynamo exporter; stay on the TorchScript-based one
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder,
+            (dummy,),
+            output_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=opset,
+            do_constant_folding=True,
+            **export_kwargs,
+        )
+    logging.info(f"Exported CLIP vision encoder to {output_path}")
+    return output_path
+
+class OnnxImageEncoder:
+    """
+    CLIP vision encoder served by ONNX Runtime with full graph optimizations.
+    Only the vision graph is loaded, so the text tower's weights never hit memory.
+    """
+    def __init__(self, path: str = DEFAULT_ONNX_PATH, intra_op_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets ONNX Runtime use one thread per physical core
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def encode(self, pixel_values: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: pixel_values.astype(np.float32, copy=False)})[0]
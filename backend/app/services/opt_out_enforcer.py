@@ -0,0 +1,131 @@
+import logging
+import re
+from typing import Iterable, List, Set
+from qdrant_client.http.models import Filter, FieldCondition, MatchAny, PointIdsList
+
+BOOTH_LANGS = ("ja", "en", "ko", "zh-cn", "zh-tw")
+DELETE_BATCH_SIZE = 1000
+
+def get_booth_identifiers(text: str):
+    """
+    Extracts stable identifiers (Shop Subdomain, Item ID) from BOOTH URLs or text.
+    Returns a set of normalized strings.
+    """
+    ids = set()
+    text = text.strip()
+    if not text:
+        return ids
+
+    # 1. Direct Shop Subdomain (e.g. mame-shop.booth.pm)
+    shop_match = re.search(r'https?://([\w-]+)\.booth\.pm', text)
+    if shop_match:
+        sub = shop_match.group(1).lower()
+        if sub not in ('www', 'manage', 'accounts', 'pixiv', 'checkout'):
+            ids.add(sub)
+
+    # 2. Item ID from path (e.g. booth.pm/ja/items/12345 or shop.booth.pm/items/12345)
+    item_match = re.search(r'/items/(\d+)', text)
+    if item_match:
+        ids.add(item_match.group(1))
+
+    # 3. Simple numeric ID
+    if text.isdigit():
+        ids.add(text)
+
+    # 4. Fallback: if it's a slug or name part (lowercase)
+    if not text.startswith("http"):
+        ids.add(text.lower())
+
+    return ids
+
+def get_item_payload_ids(item: dict) -> dict:
+    """
+    Payload fields the opt-out pipeline matches on: the numeric item ID and the shop subdomain.
+    """
+    item_match = re.search(r'/items/(\d+)', item.get("url", ""))
+    shop_match = re.search(r'https?://([\w-]+)\.booth\.pm', item.get("shop_url", ""))
+    item_id = item.get("item_id") or (item_match.group(1) if item_match else None)
+    return {
+        # The scraper may write item_id as a number; filters match it as a string
+        "itemId": str(item_id) if item_id is not None else None,
+        "shopSubdomain": shop_match.group(1).lower() if shop_match else None,
+    }
+
+def booth_item_urls(item_id: str) -> List[str]:
+    """Every boothUrl an item can be stored under, one per BOOTH language path."""
+    return [f"https://booth.pm/{lang}/items/{item_id}" for lang in BOOTH_LANGS]
+
+def is_item_excluded(item: dict, identifiers: Iterable[str]) -> bool:
+    """
+    Whether a scraped item (url, shop, shop_url) belongs to any of the given
+    opted-out identifiers. Seeders check this before embedding anything.
+    """
+    item_ids = get_booth_identifiers(item.get("url", ""))
+    if item.get("shop_url"):
+        item_ids.update(get_booth_identifiers(item["shop_url"]))
+    if item.get("shop"):
+        item_ids.add(item["shop"])
+        item_ids.add(item["shop"].lower())
+    return not item_ids.isdisjoint(identifiers)
+
+def build_exclusion_conditions(identifiers: Iterable[str]) -> List[FieldCondition]:
+    """
+    Conditions matching any point owned by the given identifiers, by shop name,
+    shop subdomain, item ID, or (for points indexed before itemId existed) booth URL.
+    """
+    identifiers = sorted(set(i for i in identifiers if i))
+    if not identifiers:
+        return []
+    item_ids = [i for i in identifiers if i.isdigit()]
+    conditions = [
+        FieldCondition(key="shopName", match=MatchAny(any=identifiers)),
+        FieldCondition(key="shopSubdomain", match=MatchAny(any=identifiers)),
+    ]
+    if item_ids:
+        conditions.append(FieldCondition(key="itemId", match=MatchAny(any=item_ids)))
+        urls = [url for item_id in item_ids for url in booth_item_urls(item_id)]
+        conditions.append(FieldCondition(key="boothUrl", match=MatchAny(any=urls)))
+    return conditions
+
+class OptOutEnforcer:
+    """
+    Removes opted-out shops and items from the index itself, so the query-time
+    filter only has to cover requests that have not been enforced yet.
+    """
+    def __init__(self, client, collection_name: str):
+        self.client = client
+        self.collection_name = collection_name
+
+    def resolve_point_ids(self, identifiers: Set[str]) -> List:
+        conditions = build_exclusion_conditions(identifiers)
+        if not conditions:
+            return []
+
+        point_ids = []
+        next_page = None
+        while True:
+            records, next_page = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(should=conditions),
+                limit=1000,
+                with_payload=False,
+                with_vectors=False,
+                offset=next_page
+            )
+            point_ids.extend(r.id for r in records)
+            if next_page is None: break
+        return point_ids
+
+    def delete_points(self, point_ids: List):
+        for i in range(0, len(point_ids), DELETE_BATCH_SIZE):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=point_ids[i:i + DELETE_BATCH_SIZE]),
+                wait=True
+            )
+
+    def enforce(self, identifiers: Set[str]) -> int:
+        point_ids = self.resolve_point_ids(identifiers)
+        self.delete_points(point_ids)
+        logging.info(f"Opt-out enforced for {sorted(identifiers)}: {len(point_ids)} points deleted")
+        return len(point_ids)
@@ -0,0 +1,70 @@
+import logging
+import threading
+from typing import FrozenSet, List
+from qdrant_client.http.models import FieldCondition
+
+from ..db import get_db_connection
+from .opt_out_enforcer import get_booth_identifiers, build_exclusion_conditions
+
+class OptOutRegistry:
+    """
+    In-process view of opted-out shops and items.
+
+    Opted-out points are deleted from the index by OptOutEnforcer; until that
+    has happened (purgedAt is NULL) the request's identifiers are compiled into
+    a handful of MatchAny conditions that search_similar puts under must_not.
+    Call refresh() after writing to the Shop table; version increases on every
+    reload so caches can key off it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._identifiers: FrozenSet[str] = frozenset()
+        self._conditions: List[FieldCondition] = []
+        self._loaded = False
+        self.version = 0
+
+    def refresh(self):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, url, purgedAt FROM Shop WHERE optOut = 1")
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        identifiers = set()
+        pending = set()
+        for row in rows:
+            row_ids = get_booth_identifiers(row['url'] or "")
+            if row['name']:
+                row_ids.add(row['name'])
+            identifiers.update(row_ids)
+            if row['purgedAt'] is None:
+                pending.update(row_ids)
+
+        conditions = build_exclusion_conditions(pending)
+        with self._lock:
+            self._identifiers = frozenset(identifiers)
+            self._conditions = conditions
+            self._loaded = True
+            self.version += 1
+        logging.info(f"Opt-out registry loaded: {len(rows)} shops ({len(pending)} identifiers pending enforcement)")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                loaded = self._loaded
+            if not loaded:
+                self.refresh()
+
+    @property
+    def identifiers(self) -> FrozenSet[str]:
+        """Every opted-out identifier, enforced or not. Seeders skip these."""
+        self._ensure_loaded()
+        return self._identifiers
+
+    @property
+    def conditions(self) -> List[FieldCondition]:
+        """must_not conditions for opt-outs still inside the propagation window."""
+        self._ensure_loaded()
+        return self._conditions
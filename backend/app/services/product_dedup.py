@@ -0,0 +1,87 @@
+import math
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+class _FetchState:
+    """Progress of one query through the ranking; shared by the sync and async loops."""
+    def __init__(self, fetcher: "DistinctProductFetcher", limit: int):
+        self.fetcher = fetcher
+        self.limit = limit
+        self.results = []
+        self.seen = set()
+        self.offset = 0
+        self.consumed = 0
+
+    def first_count(self) -> int:
+        return min(self.fetcher.max_candidates, max(self.limit, math.ceil(self.limit * self.fetcher.ratio)))
+
+    def consume(self, hits: List, count: int) -> Optional[int]:
+        """Take the new hits; returns the size of the next page, or None when done."""
+        for position, hit in enumerate(hits, start=self.offset + 1):
+            product = (hit.payload or {}).get(self.fetcher.key)
+            if product in self.seen:
+                continue
+            self.seen.add(product)
+            self.results.append(hit)
+            self.consumed = position
+            if len(self.results) >= self.limit:
+                break
+        self.offset += len(hits)
+        if len(self.results) >= self.limit or len(hits) < count or self.offset >= self.fetcher.max_candidates:
+            return None
+        # Size the next page from this query's own duplication rate, with some slack
+        observed = self.offset / max(len(self.results), 1)
+        return min(self.fetcher.max_candidates - self.offset, max(self.limit, math.ceil((self.limit - len(self.results)) * observed * 1.25)))
+
+    def finish(self) -> List:
+        if self.results:
+            self.fetcher.ratio = min(20.0, max(1.0, 0.8 * self.fetcher.ratio + 0.2 * self.consumed / len(self.results)))
+        return self.results
+
+class DistinctProductFetcher:
+    """
+    Collects `limit` distinct products (by a payload key, boothUrl by default)
+    from a per-image ranking, fetching in pages until the page is full.
+
+    Products with many near-identical gallery images can occupy dozens of
+    consecutive ranks, so a fixed overfetch either wastes work or returns a
+    short page. The first request is sized from a running estimate of ranks
+    consumed per distinct product; follow-up requests are sized from what the
+    current query has shown so far. SEARCH_MAX_CANDIDATES caps how many ranked
+    points one query may read.
+    """
+    def __init__(self, key: str = "boothUrl", max_candidates: int = None, initial_ratio: float = 3.0):
+        self.key = key
+        self.max_candidates = max_candidates or int(os.getenv("SEARCH_MAX_CANDIDATES", "500"))
+        # Ranks consumed per distinct product, smoothed across queries
+        self.ratio = initial_ratio
+
+    def fetch(self, query_page: Callable[[int, int], List], limit: int) -> List:
+        """
+        query_page(offset, count) returns the next `count` hits of the ranking
+        starting at `offset`, best first. Returns at most `limit` hits, the best
+        one per product.
+        """
+        state = _FetchState(self, limit)
+        count = state.first_count()
+        while count:
+            count = state.consume(query_page(state.offset, count), count)
+        return state.finish()
+
+    def first_page_size(self, limit: int) -> int:
+        """How many hits fetch() would request first, for callers that batch first pages."""
+        return _FetchState(self, limit).first_count()
+
+    async def fetch_async(self, query_page: Callable[[int, int], Awaitable[List]], limit: int, first_page: Tuple[List, int] = None) -> List:
+        """
+        fetch() for a coroutine query_page. first_page=(hits, count) hands in
+        a first page already fetched (e.g. by a batched query) for `count`.
+        """
+        state = _FetchState(self, limit)
+        count = state.first_count()
+        if first_page is not None:
+            hits, count = first_page
+            count = state.consume(hits, count)
+        while count:
+            count = state.consume(await query_page(state.offset, count), count)
+        return state.finish()
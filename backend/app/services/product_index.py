@@ -0,0 +1,177 @@
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List
+import numpy as np
+from qdrant_client.http.models import Filter, PointIdsList, PointStruct, ScoredPoint
+
+from .vector_index import AsyncVectorIndex, VectorIndex
+from .collection_profile import create_collection_kwargs, ensure_payload_indexes, migrate_collection, search_params
+
+PRODUCT_FIELDS = ("title", "price", "shopName", "boothUrl", "thumbnailUrl", "category", "avatars", "colors", "itemId", "shopSubdomain")
+UPSERT_BATCH_SIZE = 256
+
+def pool_vectors(vectors: np.ndarray, pooling: str = "mean") -> np.ndarray:
+    """
+    One unit vector for a product's images: the renormalized mean, or the
+    medoid (the image most similar to all the others) for products whose
+    gallery mixes unrelated shots.
+    """
+    if pooling == "medoid" and len(vectors) > 2:
+        pooled = vectors[int(np.argmax((vectors @ vectors.T).sum(axis=1)))]
+    else:
+        pooled = vectors.mean(axis=0)
+    return pooled / max(np.linalg.norm(pooled), 1e-12)
+
+def scan_products(client: VectorIndex, image_collection: str) -> Dict[str, dict]:
+    """
+    Group every image point by product (boothUrl) in one full scroll:
+    {url: {"vectors": unit vectors (n, d), "pointIds", "payload"}}. Blocking.
+    """
+    vectors: Dict[str, List] = defaultdict(list)
+    point_ids: Dict[str, List[str]] = defaultdict(list)
+    payloads: Dict[str, dict] = {}
+    next_page = None
+    while True:
+        records, next_page = client.scroll(
+            collection_name=image_collection,
+            limit=1000,
+            with_payload=True,
+            with_vectors=True,
+            offset=next_page
+        )
+        for record in records:
+            url = (record.payload or {}).get("boothUrl")
+            if not url:
+                continue
+            vectors[url].append(record.vector)
+            point_ids[url].append(str(record.id))
+            payloads.setdefault(url, {k: record.payload.get(k) for k in PRODUCT_FIELDS})
+        if next_page is None: break
+
+    products = {}
+    for url, vecs in vectors.items():
+        vecs = np.asarray(vecs, dtype=np.float32)
+        vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        products[url] = {"vectors": vecs, "pointIds": point_ids[url], "payload": payloads[url]}
+    return products
+
+class ProductIndex:
+    """
+    Second collection holding one aggregate vector per product (boothUrl),
+    built from the per-image points of the main collection.
+
+    search() is two-stage: rank products by their aggregate vector, then
+    rerank the top limit * PRODUCT_CANDIDATE_FACTOR by the best score of any
+    of their images, so results match per-image search at a fraction of the
+    index size and need no deduplication. Enabled with PRODUCT_VECTORS=1;
+    PRODUCT_POOLING selects mean (default) or medoid aggregation.
+    """
+    def __init__(self, client: VectorIndex, aclient: AsyncVectorIndex, image_collection: str, collection_name: str = None, vector_size: int = 512, profile: dict = None):
+        self.client = client
+        self.aclient = aclient
+        self.image_collection = image_collection
+        self.collection_name = collection_name or f"{image_collection}_products"
+        self.vector_size = vector_size
+        self.pooling = os.getenv("PRODUCT_POOLING", "mean").lower()
+        self.candidate_factor = int(os.getenv("PRODUCT_CANDIDATE_FACTOR", "3"))
+        self._ready = False
+        self.profile = profile or {}
+        self.search_params = search_params(self.profile)
+        self.ensure_collection()
+
+    def ensure_collection(self):
+        if self.client.collection_exists(self.collection_name):
+            migrate_collection(self.client, self.collection_name, self.profile)
+        else:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                **create_collection_kwargs(self.profile, self.vector_size)
+            )
+        ensure_payload_indexes(self.client, self.collection_name, ["shopName", "shopSubdomain", "itemId", "category", "avatars", "colors", "boothUrl"])
+
+    def is_ready(self) -> bool:
+        # Once built the collection stays populated, so stop asking the server
+        if not self._ready:
+            self._ready = self.client.count(self.collection_name).count > 0
+        return self._ready
+
+    def build(self) -> int:
+        """
+        (Re)compute every product vector from the image collection and drop
+        products that no longer have images. Blocking; one full scroll.
+        """
+        from .vector_db import get_stable_uuid
+
+        points = [
+            PointStruct(
+                id=get_stable_uuid(url),
+                vector=pool_vectors(product["vectors"], self.pooling).tolist(),
+                payload={**product["payload"], "pointIds": product["pointIds"]}
+            )
+            for url, product in scan_products(self.client, self.image_collection).items()
+        ]
+        for i in range(0, len(points), UPSERT_BATCH_SIZE):
+            self.client.upsert(collection_name=self.collection_name, points=points[i:i + UPSERT_BATCH_SIZE], wait=True)
+
+        # Products whose images were all deleted (opt-outs, delisted items)
+        live = {p.id for p in points}
+        stale = []
+        next_page = None
+        while True:
+            records, next_page = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=1000,
+                with_payload=False,
+                with_vectors=False,
+                offset=next_page
+            )
+            stale.extend(r.id for r in records if str(r.id) not in live)
+            if next_page is None: break
+        if stale:
+            self.client.delete(collection_name=self.collection_name, points_selector=PointIdsList(points=stale), wait=True)
+        self.client.flush()
+        self._ready = bool(points)
+
+        logging.info(f"Product index built: {len(points)} products from {sum(len(p.payload['pointIds']) for p in points)} images ({len(stale)} removed)")
+        return len(points)
+
+    async def search(self, vector: List[float], query_filter: Filter = None, limit: int = 10) -> List[ScoredPoint]:
+        """Best-matching image of each of the top `limit` products."""
+        response = await self.aclient.query_points(
+            collection_name=self.collection_name,
+            query=vector,
+            query_filter=query_filter,
+            limit=limit * self.candidate_factor,
+            with_payload=["pointIds"],
+            search_params=self.search_params
+        )
+        candidates = response.points
+        if not candidates:
+            return []
+
+        # Stage two: exact per-image scores for the candidates' images
+        image_ids = [pid for c in candidates for pid in c.payload.get("pointIds", [])]
+        records = await self.aclient.retrieve(
+            collection_name=self.image_collection,
+            ids=image_ids,
+            with_payload=True,
+            with_vectors=True
+        )
+        if not records:
+            return []
+        q = np.asarray(vector, dtype=np.float32)
+        q /= max(np.linalg.norm(q), 1e-12)
+        matrix = np.asarray([r.vector for r in records], dtype=np.float32)
+        scores = (matrix @ q) / np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)
+
+        best = {}
+        for record, score in zip(records, scores):
+            url = record.payload.get("boothUrl")
+            if url not in best or score > best[url][1]:
+                best[url] = (record, float(score))
+        ranked = sorted(best.values(), key=lambda pair: pair[1], reverse=True)[:limit]
+        return [
+            ScoredPoint(id=record.id, version=0, score=score, payload=record.payload)
+            for record, score in ranked
+        ]
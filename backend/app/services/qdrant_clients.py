@@ -0,0 +1,45 @@
+import logging
+import os
+from functools import lru_cache
+from typing import Optional
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+def _server_settings() -> Optional[dict]:
+    """
+    Connection settings for Qdrant Cloud, or None for the in-process :memory:
+    store. QDRANT_PREFER_GRPC (default on) sends data-plane calls over one
+    multiplexed gRPC channel instead of pooled HTTP/1.1 connections.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    url = os.getenv("QDRANT_CLOUD_URL")
+    api_key = os.getenv("QDRANT_CLOUD_API_KEY")
+    if not (url and api_key):
+        return None
+    return {
+        "url": url,
+        "api_key": api_key,
+        "prefer_grpc": os.getenv("QDRANT_PREFER_GRPC", "1") == "1",
+        "timeout": int(os.getenv("QDRANT_TIMEOUT", "30")),
+    }
+
+@lru_cache()
+def get_qdrant_client() -> QdrantClient:
+    """The process-wide blocking client (seeding scripts, admin jobs, the local :memory: store)."""
+    settings = _server_settings()
+    if settings is None:
+        logging.info("Connected to Local Qdrant (:memory:).")
+        return QdrantClient(":memory:")
+    logging.info(f"Connected to Qdrant Cloud (gRPC preferred: {settings['prefer_grpc']}).")
+    return QdrantClient(**settings)
+
+@lru_cache()
+def get_async_qdrant_client() -> Optional[AsyncQdrantClient]:
+    """
+    The process-wide asyncio client for request handling. None without a
+    server: an async :memory: client would be a separate, empty store.
+    """
+    settings = _server_settings()
+    if settings is None:
+        return None
+    return AsyncQdrantClient(**settings)
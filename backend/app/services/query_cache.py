@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+from PIL import Image
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    64-bit difference hash: sign of horizontal gradients on a 9x8 grayscale
+    thumbnail. Stable across re-encoding, mild rescaling and recompression.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def filter_signature(**filters) -> Tuple:
+    """Order-insensitive, hashable form of search filters for use in cache keys."""
+    signature = []
+    for key in sorted(filters):
+        value = filters[key]
+        if value is None or value == []:
+            continue
+        if isinstance(value, (list, tuple, set, frozenset)):
+            value = tuple(sorted(value))
+        signature.append((key, value))
+    return tuple(signature)
+
+class TTLCache:
+    """Thread-safe LRU with a per-entry time to live."""
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class QueryCache:
+    """
+    Two-level cache for image search.
+
+    Level one maps an upload to its CLIP vector: first by SHA-256 of the raw
+    bytes, then by perceptual hash (dHash of the decoded 224x224 crop), so a
+    re-encoded copy of a screenshot with the same dHash still skips the model. Level two
+    maps (perceptual hash, filter signature, generation) to the serialized
+    result list. Callers pass the generation, e.g. the opt-out registry
+    version plus the collection version, so any opt-out or reindex makes old
+    results unreachable; entries also expire after QUERY_CACHE_TTL seconds.
+
+    QUERY_CACHE_PHASH_DISTANCE is the largest Hamming distance between two
+    dHashes still treated as the same image. It defaults to 0 (exact dHash):
+    a different screenshot a few bits away would otherwise silently get
+    another upload's vector and results.
+    """
+    def __init__(self, max_size: int = None, ttl: float = None, max_distance: int = None):
+        max_size = max_size or int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+        ttl = ttl or float(os.getenv("QUERY_CACHE_TTL", "600"))
+        self.max_distance = max_distance if max_distance is not None else int(os.getenv("QUERY_CACHE_PHASH_DISTANCE", "0"))
+        self._by_content = TTLCache(max_size, ttl)
+        self._by_phash = TTLCache(max_size, ttl)
+        self._results = TTLCache(max_size, ttl)
+
+    def lookup_content(self, sha: str) -> Optional[Tuple[int, List[float]]]:
+        """(perceptual hash, vector) for bytes seen before, without decoding."""
+        return self._by_content.get(sha)
+
+    def lookup_perceptual(self, phash: int) -> Optional[Tuple[int, List[float]]]:
+        """(cached perceptual hash, vector) for the nearest cached image within max_distance."""
+        vector = self._by_phash.get(phash)
+        if vector is not None:
+            return phash, vector
+        if self.max_distance <= 0:
+            return None
+        best = None
+        for candidate in self._by_phash.keys():
+            distance = (candidate ^ phash).bit_count()
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, candidate)
+        if best is None:
+            return None
+        vector = self._by_phash.get(best[1])
+        return (best[1], vector) if vector is not None else None
+
+    def put_embedding(self, sha: str, phash: int, vector: List[float]):
+        self._by_content.put(sha, (phash, vector))
+        self._by_phash.put(phash, vector)
+
+    def get_results(self, phash: int, generation: Hashable, signature: Tuple = ()) -> Optional[List[dict]]:
+        return self._results.get((phash, generation, signature))
+
+    def put_results(self, phash: int, generation: Hashable, results: List[dict], signature: Tuple = ()):
+        self._results.put((phash, generation, signature), results)
+
+    def clear(self):
+        self._by_content.clear()
+        self._by_phash.clear()
+        self._results.clear()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from ..db import get_db_connection
+
+FREE_SEARCH_LIMIT = 3
+# Images one /api/search/batch request may hold, by plan; a batch counts as one search
+BATCH_IMAGE_LIMITS = {
+    "FREE": int(os.getenv("FREE_BATCH_MAX_IMAGES", "4")),
+    "PREMIUM": int(os.getenv("SEARCH_BATCH_MAX_IMAGES", "32")),
+}
+# The demo user by-passes the limit during development/testing
+UNLIMITED_USER_IDS = {"demo-user-id"}
+
+class QuotaCounter:
+    """
+    In-memory search quota with write-behind persistence.
+
+    Each user's row is read from SQLite the first time they search (preload()
+    does that on a worker thread, so request handlers await it first); after
+    that the check and increment happen under a lock in memory, and the
+    increments are written back in one batch every flush_interval seconds (and
+    on shutdown). Limits are exact within a process.
+    """
+    def __init__(self, flush_interval: float = None):
+        self.flush_interval = flush_interval or float(os.getenv("QUOTA_FLUSH_INTERVAL", "5"))
+        self._lock = threading.Lock()
+        # user_id -> {"user": row dict, "pending": increments not yet written}
+        self._users: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _load_user(self, user_id: str, email: str) -> Dict:
+        conn = get_db_connection()
+        try:
+            conn.execute("INSERT OR IGNORE INTO User (id, email, plan, searchCount) VALUES (?, ?, 'FREE', 0)", (user_id, email))
+            conn.commit()
+            return dict(conn.execute("SELECT * FROM User WHERE id = ?", (user_id,)).fetchone())
+        finally:
+            conn.close()
+
+    def _entry(self, user_id: str, email: str) -> Dict:
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is None:
+            user = self._load_user(user_id, email)
+            with self._lock:
+                entry = self._users.setdefault(user_id, {"user": user, "pending": 0})
+        return entry
+
+    async def preload(self, user_id: str, email: str):
+        """Load the user's row off the event loop unless it is cached already."""
+        with self._lock:
+            cached = user_id in self._users
+        if not cached:
+            await asyncio.get_running_loop().run_in_executor(None, self._entry, user_id, email)
+
+    def batch_limit(self, user_id: str, email: str) -> int:
+        """How many images the user's plan allows in one batch search."""
+        entry = self._entry(user_id, email)
+        with self._lock:
+            plan = entry["user"]["plan"]
+        if user_id in UNLIMITED_USER_IDS:
+            plan = "PREMIUM"
+        return BATCH_IMAGE_LIMITS.get(plan, BATCH_IMAGE_LIMITS["FREE"])
+
+    def try_consume(self, user_id: str, email: str) -> Optional[Dict]:
+        """
+        Count one search. Returns the user (with the updated searchCount), or None
+        if the FREE plan limit has been reached.
+        """
+        entry = self._entry(user_id, email)
+        with self._lock:
+            user = entry["user"]
+            if user["plan"] == "FREE" and user["searchCount"] >= FREE_SEARCH_LIMIT and user_id not in UNLIMITED_USER_IDS:
+                return None
+            user["searchCount"] += 1
+            entry["pending"] += 1
+            return dict(user)
+
+    def flush(self):
+        with self._lock:
+            updates = [(entry["pending"], user_id) for user_id, entry in self._users.items() if entry["pending"]]
+            for _, user_id in updates:
+                self._users[user_id]["pending"] = 0
+        if not updates:
+            return
+
+        conn = get_db_connection()
+        try:
+            conn.executemany("UPDATE User SET searchCount = searchCount + ? WHERE id = ?", updates)
+            conn.commit()
+        except Exception as e:
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                for pending, user_id in updates:
+                    if user_id in self._users:
+                        self._users[user_id]["pending"] += pending
+            logging.error(f"Quota flush failed: {e}")
+        finally:
+            conn.close()
+
+    def invalidate(self, user_id: str = None):
+        """Flush and forget cached rows, e.g. after a plan change. None drops every user."""
+        self.flush()
+        with self._lock:
+            if user_id is None:
+                self._users = {uid: entry for uid, entry in self._users.items() if entry["pending"]}
+            elif not self._users.get(user_id, {}).get("pending"):
+                self._users.pop(user_id, None)
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await loop.run_in_executor(None, self.flush)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+quota_counter = QuotaCounter()
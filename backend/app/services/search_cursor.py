@@ -0,0 +1,39 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import zlib
+from typing import List
+from fastapi import HTTPException
+
+# Without a configured secret, cursors only stay valid for this process's lifetime
+_SECRET = os.getenv("SEARCH_CURSOR_SECRET", "").encode() or os.urandom(32)
+_SIG_BYTES = 12
+
+def encode_cursor(query_key: str, seen_urls: List[str]) -> str:
+    """
+    Opaque, signed cursor for the next page of a search.
+
+    Pages are keyset-style: the cursor carries the products already returned,
+    which the next query excludes in the filter, so page N+1 is simply the top
+    of the remaining ranking and no product is repeated or skipped. query_key
+    binds the cursor to one query (the upload's SHA-256 content hash).
+    """
+    body = zlib.compress(json.dumps({"q": query_key, "seen": seen_urls}, separators=(",", ":")).encode())
+    sig = hmac.new(_SECRET, body, hashlib.sha256).digest()[:_SIG_BYTES]
+    return base64.urlsafe_b64encode(sig + body).decode().rstrip("=")
+
+def decode_cursor(cursor: str, query_key: str) -> List[str]:
+    """Products already returned for this query; raises 400 for a forged, stale or foreign cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sig, body = raw[:_SIG_BYTES], raw[_SIG_BYTES:]
+        if not hmac.compare_digest(sig, hmac.new(_SECRET, body, hashlib.sha256).digest()[:_SIG_BYTES]):
+            raise ValueError("bad signature")
+        data = json.loads(zlib.decompress(body))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid or expired cursor")
+    if data.get("q") != query_key:
+        raise HTTPException(status_code=400, detail="Cursor does not belong to this query")
+    return data["seen"]
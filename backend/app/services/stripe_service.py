@@ -1,6 +1,7 @@
 import stripe
 import os
 from ..db import get_db_connection
+from .quota_counter import quota_counter
 from fastapi import HTTPException
 # from prisma.enums import Plan
 
@@ -68,6 +69,8 @@ class StripeService:
             conn.commit()
         finally:
             conn.close()
+        # Drop the cached quota row so the new plan takes effect
+        quota_counter.invalidate(user_id)
 
     async def _downgrade_user_by_stripe_id(self, stripe_id: str):
         conn = get_db_connection()
@@ -77,3 +80,4 @@ class StripeService:
             conn.commit()
         finally:
             conn.close()
+        quota_counter.invalidate()
@@ -0,0 +1,65 @@
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from .image_processor import ImageProcessor
+
+WARMUP_BATCH_SIZE = 32
+
+def normalize_query(text: str) -> str:
+    # NFKC folds full-width/half-width variants (ＡＮＯＮ, ｶﾘﾝ) onto one key;
+    # CLIP's tokenizer lowercases anyway, so case is folded too
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+class TextEmbeddingCache:
+    """
+    LRU of CLIP text embeddings keyed by normalized query text.
+
+    Text vectors depend only on the query and the model, so entries never go
+    stale and need no TTL. warm_up() embeds a phrase list in batches (see
+    catalog_vocabulary.text_warmup_phrases) so avatar and color queries are
+    answered without touching the text tower.
+    """
+    def __init__(self, image_processor: ImageProcessor, max_size: int = None):
+        self.image_processor = image_processor
+        self.max_size = max_size or int(os.getenv("TEXT_EMBEDDING_CACHE_SIZE", "4096"))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def lookup(self, text: str) -> Optional[List[float]]:
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def _store(self, key: str, vector: List[float]):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, text: str) -> List[float]:
+        """Cached embedding for text, running the text tower on a miss. Blocking."""
+        vector = self.lookup(text)
+        if vector is None:
+            key = normalize_query(text)
+            vector = self.image_processor.get_text_embedding(key)
+            self._store(key, vector)
+        return vector
+
+    def warm_up(self, phrases: Iterable[str]) -> int:
+        """Embed every phrase not cached yet, WARMUP_BATCH_SIZE per forward pass. Blocking."""
+        with self._lock:
+            missing = list(dict.fromkeys(k for k in map(normalize_query, phrases) if k and k not in self._entries))
+        for i in range(0, len(missing), WARMUP_BATCH_SIZE):
+            batch = missing[i:i + WARMUP_BATCH_SIZE]
+            for key, vector in zip(batch, self.image_processor.get_text_embeddings(batch)):
+                self._store(key, vector)
+        logging.info(f"Text embedding cache warmed with {len(missing)} phrases")
+        return len(missing)
@@ -1,19 +1,24 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, MatchAny
+from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MatchAny, QueryRequest
 import os
 import json
 import asyncio
 import logging
 import hashlib
 import uuid
-import requests
-import io
+import numpy as np
 from typing import List, Optional
-from PIL import Image
-import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 from .image_processor import ImageProcessor
+from .indexing_pipeline import IndexingPipeline
+from .embedding_cache import EmbeddingCache
+from .vector_index import AsyncVectorIndex, VectorIndex, create_async_vector_index, create_vector_index
+from .index_manifest import IndexManifest
+from .opt_out_enforcer import OptOutEnforcer, booth_item_urls, get_item_payload_ids, is_item_excluded
+from .opt_out_registry import OptOutRegistry
+from .product_dedup import DistinctProductFetcher
+from .product_index import ProductIndex
+from .knn_graph import KnnGraph
+from .collection_profile import get_profile, create_collection_kwargs, ensure_payload_indexes, migrate_collection, search_params
 
 # Global helper for Stable UUID
 def get_stable_uuid(text: str):
@@ -24,59 +29,74 @@ class VectorDBService:
     def __init__(self):
         from dotenv import load_dotenv
         load_dotenv()
-        qdrant_url = os.getenv("QDRANT_CLOUD_URL")
-        qdrant_api_key = os.getenv("QDRANT_CLOUD_API_KEY")
-        
-        if qdrant_url and qdrant_api_key:
-            self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
-            logging.info("Connected to Qdrant Cloud.")
-        else:
-            self.client = QdrantClient(":memory:")
-            logging.info("Connected to Local Qdrant (:memory:).")
+        # Qdrant (Cloud or :memory:) or the local file index, see create_vector_index
+        self.client: VectorIndex = create_vector_index()
+        # Same collections for the request and seeding paths, without blocking the event loop
+        self.aclient: AsyncVectorIndex = create_async_vector_index(self.client)
             
         self.collection_name = "booth_items"
         self.vector_size = 512
+        # HNSW / quantization / on-disk settings, see collection_profile.PROFILES
+        self.profile = get_profile()
+        self.search_params = search_params(self.profile)
         self.ensure_collection()
+        # Optional one-vector-per-product collection for two-stage search
+        self.product_index = None
+        if os.getenv("PRODUCT_VECTORS", "0") == "1":
+            self.product_index = ProductIndex(self.client, self.aclient, self.collection_name, vector_size=self.vector_size, profile=self.profile)
         
         # Indexing state
         self.indexing_status = {
             "total": 0,
             "current": 0,
             "is_complete": False,
-            "last_item": None
+            "last_item": None,
+            "stages": {}
         }
+        # Bumped whenever points are deleted or a seed run finishes
+        self._generation = 0
+        # Per-product deduplication with adaptive overfetch
+        self.product_fetcher = DistinctProductFetcher()
+        # Precomputed neighbors for "more like this" (scripts/build_knn_graph.py)
+        self.knn_graph = KnnGraph()
         
         # Determine paths
         self.base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         self.metadata_path = os.path.join(self.base_dir, "scraper", "data", "popular_items_full.jsonl")
         self.scraper_dir = os.path.join(self.base_dir, "scraper")
 
+    @property
+    def collection_version(self):
+        """Changes whenever points are added or removed; result caches key off it."""
+        return (self._generation, self.indexing_status["current"])
+
     def ensure_collection(self):
-        from qdrant_client.http.models import PayloadSchemaType
-        if not self.client.collection_exists(self.collection_name):
+        if self.client.collection_exists(self.collection_name):
+            migrate_collection(self.client, self.collection_name, self.profile)
+        else:
             self.client.create_collection(
                 collection_name=self.collection_name,
-                vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE),
+                **create_collection_kwargs(self.profile, self.vector_size)
             )
-            # Create indices on initialization
-            fields = ["shopName", "category", "avatars", "colors"]
-            for field in fields:
-                try:
-                    self.client.create_payload_index(
-                        collection_name=self.collection_name,
-                        field_name=field,
-                        field_schema=PayloadSchemaType.KEYWORD,
-                        wait=True
-                    )
-                except Exception as e:
-                    logging.error(f"Failed to create index for {field}: {e}")
+        # Also on existing collections, so fields indexed later are added on the next
+        # startup (boothUrl backs the seen_urls exclusion and the pre-itemId opt-out match)
+        ensure_payload_indexes(self.client, self.collection_name, ["shopName", "shopSubdomain", "itemId", "category", "avatars", "colors", "boothUrl"])
 
-    async def seed_data(self, image_processor: ImageProcessor):
+    async def seed_data(self, image_processor: ImageProcessor, excluded_identifiers: set = None):
+        """
+        Index every metadata image not yet in the collection. Opted-out shops
+        and items are skipped: excluded_identifiers defaults to every opt-out
+        in the Shop table, enforced or not, so purged shops are never re-added.
+        """
         logging.info("--- [VectorDB] Starting background seeding ---")
         if not os.path.exists(self.metadata_path):
             logging.warning(f"--- [VectorDB] No metadata.jsonl found at {self.metadata_path} ---")
             self.indexing_status["is_complete"] = True
             return
+        if excluded_identifiers is None:
+            # No fallback to an empty set: a seed that cannot see the opt-outs must not run
+            excluded_identifiers = await asyncio.get_running_loop().run_in_executor(None, lambda: OptOutRegistry().identifiers)
+        logging.info(f"--- [VectorDB] Skipping {len(excluded_identifiers)} opted-out identifiers ---")
 
         # Deduplicate metadata in memory first to avoid redundant processing
         unique_items = {}
@@ -90,135 +110,145 @@ class VectorDBService:
         self.indexing_status["total"] = len(items_to_process)
         logging.info(f"--- [VectorDB] Unique items to process: {len(items_to_process)} (from {len(unique_items)} entries) ---")
 
-        logging.info("--- [VectorDB] Fetching existing IDs from Qdrant to skip... ---")
-        existing_ids = set()
-        next_page = None
+        manifest = IndexManifest(self.collection_name)
+        existing_ids = await asyncio.get_running_loop().run_in_executor(None, self._indexed_ids, manifest, image_processor.model_id)
+        logging.info(f"--- [VectorDB] Already indexed with {image_processor.model_id}: {len(existing_ids)} ---")
+
+        # Resolve every image that still needs indexing up front (newest first)
+        jobs = []
+        for item in reversed(items_to_process):
+            if not item.get("images") or not item.get("url"):
+                continue
+            # Never (re)index opted-out shops or items
+            if excluded_identifiers and is_item_excluded(item, excluded_identifiers):
+                continue
+            for img_rel_path in item["images"]:
+                point_id = get_stable_uuid(img_rel_path)
+                if point_id in existing_ids:
+                    continue
+                job = self._build_job(item, img_rel_path, point_id)
+                if job:
+                    jobs.append(job)
+        logging.info(f"--- [VectorDB] Images to index: {len(jobs)} ---")
+
+        # Progress is tracked per image from here on
+        self.indexing_status["total"] = len(jobs)
+        self.indexing_status["current"] = 0
+        cache = EmbeddingCache(image_processor.cache_id)
+        pipeline = IndexingPipeline(self.aclient, self.collection_name, image_processor, self.indexing_status, cache=cache, manifest=manifest)
         try:
-            while True:
-                # Optimized scroll: minimal payload
-                records, next_page = self.client.scroll(
-                    collection_name=self.collection_name, 
-                    limit=10000, 
-                    with_payload=False, 
-                    with_vectors=False,
-                    offset=next_page
-                )
-                for r in records:
-                    existing_ids.add(r.id)
-                if next_page is None: break
-        except Exception as e:
-            logging.error(f"Failed to fetch existing IDs: {e}")
-        logging.info(f"--- [VectorDB] Total existing IDs in Qdrant: {len(existing_ids)} ---")
+            img_count = await pipeline.run(jobs)
+        finally:
+            cache.close()
+            self.client.flush()
+            manifest.close()
 
-        async with httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_connections=20)) as http_client:
-            batch_points = []
-            img_count = 0
-            consecutive_skips = 0
-            SKIP_LIMIT = 200 
-            
-            # Process in reverse (newest first)
-            for idx, item in enumerate(reversed(items_to_process)):
-                try:
-                    self.indexing_status["current"] = idx + 1
-                    
-                    if not item.get("images") or not item.get("url"):
-                        continue
+        if self.product_index:
+            await asyncio.get_running_loop().run_in_executor(None, self.product_index.build)
 
-                    all_images_already_indexed = True
-                    item_points = []
+        self._generation += 1
+        self.indexing_status["is_complete"] = True
+        logging.info(f"--- [VectorDB] Seeding complete. {img_count} new images indexed. ---")
 
-                    for img_rel_path in item["images"]:
-                        point_id = get_stable_uuid(img_rel_path)
-                        if point_id in existing_ids:
-                            continue
-                        
-                        all_images_already_indexed = False
-                        
-                        # Process image (Download if URL, else local)
-                        img = None
-                        thumbnail_url = img_rel_path
-                        
-                        is_url = img_rel_path.startswith("http://") or img_rel_path.startswith("https://")
-                        if is_url:
-                            try:
-                                @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-                                async def fetch_image(url):
-                                    resp = await http_client.get(url)
-                                    resp.raise_for_status()
-                                    return resp.content
-                                
-                                content = await fetch_image(img_rel_path)
-                                img = Image.open(io.BytesIO(content)).convert("RGB")
-                            except Exception as e:
-                                logging.error(f"Error fetching image {img_rel_path}: {e}")
-                                continue
-                        else:
-                            img_path = os.path.join(self.scraper_dir, img_rel_path)
-                            if not os.path.exists(img_path):
-                                filename = os.path.basename(img_rel_path)
-                                img_path = os.path.join(self.scraper_dir, "raw_images", filename)
-                            
-                            if os.path.exists(img_path):
-                                img = Image.open(img_path).convert("RGB")
-                                filename = os.path.basename(img_path)
-                                thumbnail_url = f"/api/images/{filename}"
-                            else:
-                                continue
+    def _indexed_ids(self, manifest: IndexManifest, model_id: str) -> set:
+        """
+        Point IDs that need no work this run, according to the manifest. If the
+        collection no longer matches it (e.g. a fresh :memory: instance or a
+        manual edit), the manifest is rebuilt from one full scroll first.
+        """
+        try:
+            collection_count = self.client.count(collection_name=self.collection_name, exact=True).count
+        except Exception as e:
+            logging.error(f"Failed to count collection: {e}")
+            return manifest.indexed_ids(model_id)
+        if collection_count == manifest.count():
+            return manifest.indexed_ids(model_id)
 
-                        if img:
-                            vector = image_processor.get_embedding(img)
-                            payload = {
-                                "title": item.get("title", "Unknown"),
-                                "price": item.get("price", "Unknown"),
-                                "shopName": item.get("shop", "Unknown"),
-                                "boothUrl": item.get("url", "#"),
-                                "thumbnailUrl": thumbnail_url,
-                                "category": item.get("category", "Unknown"),
-                                "avatars": item.get("avatars", []),
-                                "colors": item.get("colors", [])
-                            }
-                            item_points.append(PointStruct(id=point_id, vector=vector, payload=payload))
+        logging.info(f"--- [VectorDB] Manifest out of sync ({manifest.count()} vs {collection_count} points), reconciling... ---")
+        existing_ids = set()
+        next_page = None
+        while True:
+            # Optimized scroll: minimal payload
+            records, next_page = self.client.scroll(
+                collection_name=self.collection_name, 
+                limit=10000, 
+                with_payload=False, 
+                with_vectors=False,
+                offset=next_page
+            )
+            for r in records:
+                existing_ids.add(str(r.id))
+            if next_page is None: break
+        # Points indexed before the manifest existed are attributed to the current model
+        manifest.reset(existing_ids, model_id)
+        return existing_ids
 
-                    if all_images_already_indexed:
-                        consecutive_skips += 1
-                    else:
-                        consecutive_skips = 0
-                        batch_points.extend(item_points)
-                        img_count += len(item_points)
+    def enforce_opt_out(self, identifiers: set) -> int:
+        """Delete every point belonging to the given shop/item identifiers."""
+        enforcer = OptOutEnforcer(self.client, self.collection_name)
+        point_ids = enforcer.resolve_point_ids(identifiers)
+        enforcer.delete_points(point_ids)
+        if self.product_index:
+            OptOutEnforcer(self.client, self.product_index.collection_name).enforce(identifiers)
+        # The precomputed table is only filtered by pending opt-outs at query time
+        self.knn_graph.remove_products(identifiers)
+        self.client.flush()
+        self._generation += 1
 
-                    # Upsert in batches of 50 points
-                    if len(batch_points) >= 50:
-                        self.client.upsert(collection_name=self.collection_name, points=batch_points)
-                        logging.info(f"--- [VectorDB] Batch upserted: {len(batch_points)} points ---")
-                        batch_points = []
+        # Keep the manifest in step so the next seed does not need to reconcile
+        manifest = IndexManifest(self.collection_name)
+        try:
+            manifest.remove(point_ids)
+        finally:
+            manifest.close()
+        return len(point_ids)
 
-                    if consecutive_skips >= SKIP_LIMIT:
-                        logging.info(f"--- [VectorDB] Reached SKIP_LIMIT ({SKIP_LIMIT}). Early exit. ---")
-                        break
-                        
-                    self.indexing_status["last_item"] = f"{item.get('title')}"
-                    
-                except Exception as e:
-                    logging.error(f"Item processing error: {e}")
+    def _build_job(self, item: dict, img_rel_path: str, point_id: str):
+        is_url = img_rel_path.startswith("http://") or img_rel_path.startswith("https://")
+        if is_url:
+            source = img_rel_path
+            thumbnail_url = img_rel_path
+        else:
+            source = os.path.join(self.scraper_dir, img_rel_path)
+            if not os.path.exists(source):
+                filename = os.path.basename(img_rel_path)
+                source = os.path.join(self.scraper_dir, "raw_images", filename)
+            if not os.path.exists(source):
+                return None
+            thumbnail_url = f"/api/images/{os.path.basename(source)}"
 
-            # Final batch
-            if batch_points:
-                self.client.upsert(collection_name=self.collection_name, points=batch_points)
-                logging.info(f"--- [VectorDB] Final batch upserted: {len(batch_points)} points ---")
-        
-        self.indexing_status["is_complete"] = True
-        logging.info(f"--- [VectorDB] Seeding complete. {img_count} new images indexed. ---")
+        payload = {
+            "title": item.get("title", "Unknown"),
+            "price": item.get("price", "Unknown"),
+            "shopName": item.get("shop", "Unknown"),
+            "boothUrl": item.get("url", "#"),
+            "thumbnailUrl": thumbnail_url,
+            "category": item.get("category", "Unknown"),
+            "avatars": item.get("avatars", []),
+            "colors": item.get("colors", []),
+            **get_item_payload_ids(item)
+        }
+        return {
+            "point_id": point_id,
+            "source": source,
+            "is_url": is_url,
+            "title": item.get("title"),
+            "payload": payload,
+        }
 
-    def search_similar(self, vector: List[float], limit: int = 10, offset: int = 0, excluded_shops: set = None, category: str = None, avatars: List[str] = None, colors: List[str] = None):
-        from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MatchAny
+    def _build_filter(self, seen_urls: List[str] = None, excluded_shops: set = None, category: str = None, avatars: List[str] = None, colors: List[str] = None, exclusion_conditions: List[FieldCondition] = None):
         
         query_filter = None
         conditions = []
         must_not_conditions = []
         
+        # A few MatchAny conditions keep filter cost flat as the opt-out list grows
+        if exclusion_conditions:
+            must_not_conditions.extend(exclusion_conditions)
         if excluded_shops:
-            for excluded in excluded_shops:
-                must_not_conditions.append(FieldCondition(key="shopName", match=MatchValue(value=excluded)))
+            must_not_conditions.append(FieldCondition(key="shopName", match=MatchAny(any=list(excluded_shops))))
+        if seen_urls:
+            must_not_conditions.append(FieldCondition(key="boothUrl", match=MatchAny(any=list(seen_urls))))
                 
         if category:
             conditions.append(FieldCondition(key="category", match=MatchValue(value=category)))
@@ -233,25 +263,115 @@ class VectorDBService:
                 
         if conditions or must_not_conditions:
             query_filter = Filter(must=conditions if conditions else None, must_not=must_not_conditions if must_not_conditions else None)
+        return query_filter
+
+    async def search_similar(self, vector: List[float], limit: int = 10, **filters):
+        """
+        Top `limit` distinct products (by boothUrl) for the vector. Filters
+        (see _build_filter) run inside Qdrant on the keyword payload indexes.
+        seen_urls are products shown on earlier pages; excluding them makes
+        the next page the top of the remaining ranking.
+        """
+        query_filter = self._build_filter(**filters)
+
+        # Two-stage product search when aggregate vectors exist: no dedup needed
+        if self.product_index and self.product_index.is_ready():
+            return await self.product_index.search(vector, query_filter, limit)
+
+        # Keep reading the ranking until `limit` distinct boothUrls are found
+        return await self.product_fetcher.fetch_async(self._query_page(vector, query_filter), limit)
+
+    def _query_page(self, vector: List[float], query_filter):
+        async def query_page(offset: int, count: int):
+            response = await self.aclient.query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                query_filter=query_filter,
+                limit=count,
+                offset=offset,
+                with_payload=True,
+                search_params=self.search_params
+            )
+            return response.points
+        return query_page
 
-        # Retrieve more candidates for deduplication using query_points API
-        raw_results = self.client.query_points(
+    async def search_similar_batch(self, vectors: List[List[float]], limit: int = 10, **filters) -> List[List]:
+        """
+        search_similar for several vectors with the same filters. The first
+        page of every query goes out in one batched request; only queries
+        whose first page was mostly duplicates need a follow-up.
+        """
+        if not vectors:
+            return []
+        query_filter = self._build_filter(**filters)
+        if self.product_index and self.product_index.is_ready():
+            return list(await asyncio.gather(*[self.product_index.search(v, query_filter, limit) for v in vectors]))
+
+        count = self.product_fetcher.first_page_size(limit)
+        responses = await self.aclient.query_batch_points(
             collection_name=self.collection_name,
-            query=vector,
-            query_filter=query_filter,
-            limit=limit * 3, 
-            with_payload=True
-        ).points
+            requests=[
+                QueryRequest(query=vector, filter=query_filter, limit=count, with_payload=True, params=self.search_params)
+                for vector in vectors
+            ]
+        )
+        return list(await asyncio.gather(*[
+            self.product_fetcher.fetch_async(self._query_page(vector, query_filter), limit, first_page=(response.points, count))
+            for vector, response in zip(vectors, responses)
+        ]))
 
-        # Deduplicate by unique boothUrl
-        unique_results = []
-        seen_urls = set()
-        for hit in raw_results:
-            url = hit.payload.get("boothUrl")
-            if url not in seen_urls:
-                seen_urls.add(url)
-                unique_results.append(hit)
-            if len(unique_results) >= limit:
-                break
-        
-        return unique_results
+    async def find_item(self, item_id: str):
+        """The stored point for a point ID (get_stable_uuid) or a BOOTH item ID, or None."""
+        if item_id.isdigit():
+            # itemId may have been stored as a number, and points indexed before
+            # itemId existed only have the item in their boothUrl
+            records, _ = await self.aclient.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(should=[
+                    FieldCondition(key="itemId", match=MatchValue(value=item_id)),
+                    FieldCondition(key="itemId", match=MatchValue(value=int(item_id))),
+                    FieldCondition(key="boothUrl", match=MatchAny(any=booth_item_urls(item_id))),
+                ]),
+                limit=1,
+                with_payload=True
+            )
+            return records[0] if records else None
+        try:
+            uuid.UUID(item_id)
+        except ValueError:
+            return None
+        records = await self.aclient.retrieve(collection_name=self.collection_name, ids=[item_id], with_payload=True)
+        return records[0] if records else None
+
+    async def search_similar_to_item(self, item_id: str, limit: int = 10, **filters) -> Optional[List]:
+        """
+        Products similar to an indexed one, without a model call. Served from
+        the precomputed k-NN graph when it covers the item; otherwise
+        search_similar seeded with the mean of the product's stored image
+        vectors (at most SIMILAR_MAX_IMAGES). The product itself is excluded.
+        None if item_id is unknown.
+        """
+        query_filter = self._build_filter(**filters)
+        hits = self.knn_graph.neighbors(item_id, limit, query_filter)
+        if hits is not None:
+            return hits
+
+        item = await self.find_item(item_id)
+        if item is None:
+            return None
+        url = item.payload.get("boothUrl")
+        hits = self.knn_graph.neighbors(url, limit, query_filter)
+        if hits is not None:
+            return hits
+
+        images, _ = await self.aclient.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=Filter(must=[FieldCondition(key="boothUrl", match=MatchValue(value=url))]),
+            limit=int(os.getenv("SIMILAR_MAX_IMAGES", "64")),
+            with_payload=False,
+            with_vectors=True
+        )
+        matrix = np.asarray([record.vector for record in images], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        seen_urls = list(filters.pop("seen_urls", None) or []) + [url]
+        return await self.search_similar(matrix.mean(axis=0).tolist(), limit=limit, seen_urls=seen_urls, **filters)
@@ -0,0 +1,673 @@
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.local.qdrant_local import QdrantLocal
+from qdrant_client.http.models import (
+    Filter, FieldCondition, MatchValue, MatchAny, MatchExcept, HasIdCondition,
+    PointIdsList, FilterSelector, ScoredPoint, Record, QueryResponse, QueryRequest, CountResult,
+)
+
+from .qdrant_clients import get_qdrant_client, get_async_qdrant_client
+
+class VectorIndex:
+    """
+    The part of the QdrantClient API the backend relies on.
+
+    VectorDBService, the indexing pipeline and the opt-out enforcer only talk
+    to this interface, so a collection can live in Qdrant or in local files.
+    """
+    def collection_exists(self, collection_name: str) -> bool:
+        raise NotImplementedError
+
+    def create_collection(self, collection_name: str, vectors_config, **kwargs):
+        raise NotImplementedError
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs):
+        raise NotImplementedError
+
+    def upsert(self, collection_name: str, points: List, **kwargs):
+        raise NotImplementedError
+
+    def query_points(self, collection_name: str, query, query_filter: Filter = None, limit: int = 10, offset: int = 0, with_payload: bool = True, **kwargs) -> QueryResponse:
+        raise NotImplementedError
+
+    def query_batch_points(self, collection_name: str, requests: List[QueryRequest], **kwargs) -> List[QueryResponse]:
+        raise NotImplementedError
+
+    def scroll(self, collection_name: str, scroll_filter: Filter = None, limit: int = 10, offset=None, with_payload: bool = True, with_vectors: bool = False, **kwargs):
+        raise NotImplementedError
+
+    def retrieve(self, collection_name: str, ids: List, with_payload: bool = True, with_vectors: bool = False, **kwargs) -> List[Record]:
+        raise NotImplementedError
+
+    def delete(self, collection_name: str, points_selector, **kwargs):
+        raise NotImplementedError
+
+    def count(self, collection_name: str, exact: bool = True, **kwargs) -> CountResult:
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist buffered writes. No-op for backends that persist on write."""
+
+# One lock per in-process client, however many QdrantIndex wrappers share it
+_local_client_locks: "weakref.WeakKeyDictionary[QdrantClient, threading.RLock]" = weakref.WeakKeyDictionary()
+_local_client_locks_guard = threading.Lock()
+
+def _local_client_lock(client) -> Optional[threading.RLock]:
+    if not isinstance(getattr(client, "_client", None), QdrantLocal):
+        return None
+    with _local_client_locks_guard:
+        return _local_client_locks.setdefault(client, threading.RLock())
+
+class QdrantIndex(VectorIndex):
+    """
+    VectorIndex backed by a QdrantClient (Cloud, server or :memory:).
+
+    The in-process store behind :memory: and path clients is not thread-safe,
+    so calls on one are serialized; server clients are called concurrently.
+    """
+    def __init__(self, client: QdrantClient):
+        self.client = client
+        self._lock = _local_client_lock(client)
+
+    def _call(self, fn, *args, **kwargs):
+        if self._lock is None:
+            return fn(*args, **kwargs)
+        with self._lock:
+            return fn(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Anything outside the common interface goes straight to the client
+        attr = getattr(self.client, name)
+        if self._lock is None or not callable(attr):
+            return attr
+        return functools.wraps(attr)(functools.partial(self._call, attr))
+
+    def collection_exists(self, collection_name):
+        return self._call(self.client.collection_exists, collection_name)
+
+    def create_collection(self, collection_name, vectors_config, **kwargs):
+        return self._call(self.client.create_collection, collection_name=collection_name, vectors_config=vectors_config, **kwargs)
+
+    def create_payload_index(self, collection_name, field_name, field_schema=None, **kwargs):
+        return self._call(self.client.create_payload_index, collection_name=collection_name, field_name=field_name, field_schema=field_schema, **kwargs)
+
+    def upsert(self, collection_name, points, **kwargs):
+        return self._call(self.client.upsert, collection_name=collection_name, points=points, **kwargs)
+
+    def query_points(self, collection_name, query, query_filter=None, limit=10, offset=0, with_payload=True, **kwargs):
+        return self._call(self.client.query_points, collection_name=collection_name, query=query, query_filter=query_filter, limit=limit, offset=offset, with_payload=with_payload, **kwargs)
+
+    def query_batch_points(self, collection_name, requests, **kwargs):
+        return self._call(self.client.query_batch_points, collection_name=collection_name, requests=requests, **kwargs)
+
+    def scroll(self, collection_name, scroll_filter=None, limit=10, offset=None, with_payload=True, with_vectors=False, **kwargs):
+        return self._call(self.client.scroll, collection_name=collection_name, scroll_filter=scroll_filter, limit=limit, offset=offset, with_payload=with_payload, with_vectors=with_vectors, **kwargs)
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        return self._call(self.client.retrieve, collection_name=collection_name, ids=ids, with_payload=with_payload, with_vectors=with_vectors, **kwargs)
+
+    def delete(self, collection_name, points_selector, **kwargs):
+        return self._call(self.client.delete, collection_name=collection_name, points_selector=points_selector, **kwargs)
+
+    def count(self, collection_name, exact=True, **kwargs):
+        return self._call(self.client.count, collection_name=collection_name, exact=exact, **kwargs)
+
+class AsyncVectorIndex:
+    """
+    Coroutine version of the VectorIndex data-plane calls used on the request
+    and seeding paths: upsert, query_points, scroll, retrieve, delete, count.
+    Collection management stays on the blocking VectorIndex.
+    """
+    async def upsert(self, collection_name: str, points: List, **kwargs):
+        raise NotImplementedError
+
+    async def query_points(self, collection_name: str, query, query_filter: Filter = None, limit: int = 10, offset: int = 0, with_payload: bool = True, **kwargs) -> QueryResponse:
+        raise NotImplementedError
+
+    async def query_batch_points(self, collection_name: str, requests: List[QueryRequest], **kwargs) -> List[QueryResponse]:
+        raise NotImplementedError
+
+    async def scroll(self, collection_name: str, scroll_filter: Filter = None, limit: int = 10, offset=None, with_payload: bool = True, with_vectors: bool = False, **kwargs):
+        raise NotImplementedError
+
+    async def retrieve(self, collection_name: str, ids: List, with_payload: bool = True, with_vectors: bool = False, **kwargs) -> List[Record]:
+        raise NotImplementedError
+
+    async def delete(self, collection_name: str, points_selector, **kwargs):
+        raise NotImplementedError
+
+    async def count(self, collection_name: str, exact: bool = True, **kwargs) -> CountResult:
+        raise NotImplementedError
+
+class AsyncQdrantIndex(AsyncVectorIndex):
+    """AsyncVectorIndex on a shared AsyncQdrantClient; no thread is held while Qdrant works."""
+    def __init__(self, client: AsyncQdrantClient):
+        self.client = client
+
+    async def upsert(self, collection_name, points, **kwargs):
+        return await self.client.upsert(collection_name=collection_name, points=points, **kwargs)
+
+    async def query_points(self, collection_name, query, query_filter=None, limit=10, offset=0, with_payload=True, **kwargs):
+        return await self.client.query_points(collection_name=collection_name, query=query, query_filter=query_filter, limit=limit, offset=offset, with_payload=with_payload, **kwargs)
+
+    async def query_batch_points(self, collection_name, requests, **kwargs):
+        return await self.client.query_batch_points(collection_name=collection_name, requests=requests, **kwargs)
+
+    async def scroll(self, collection_name, scroll_filter=None, limit=10, offset=None, with_payload=True, with_vectors=False, **kwargs):
+        return await self.client.scroll(collection_name=collection_name, scroll_filter=scroll_filter, limit=limit, offset=offset, with_payload=with_payload, with_vectors=with_vectors, **kwargs)
+
+    async def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        return await self.client.retrieve(collection_name=collection_name, ids=ids, with_payload=with_payload, with_vectors=with_vectors, **kwargs)
+
+    async def delete(self, collection_name, points_selector, **kwargs):
+        return await self.client.delete(collection_name=collection_name, points_selector=points_selector, **kwargs)
+
+    async def count(self, collection_name, exact=True, **kwargs):
+        return await self.client.count(collection_name=collection_name, exact=exact, **kwargs)
+
+class ThreadedAsyncIndex(AsyncVectorIndex):
+    """
+    AsyncVectorIndex over a blocking VectorIndex, for backends that live in
+    this process (local files, Qdrant :memory:). Calls run on the default
+    thread pool so they never block the event loop; both backends lock
+    internally, so concurrent calls are safe.
+    """
+    def __init__(self, index: VectorIndex):
+        self.index = index
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def upsert(self, collection_name, points, **kwargs):
+        return await self._run(self.index.upsert, collection_name, points, **kwargs)
+
+    async def query_points(self, collection_name, query, query_filter=None, limit=10, offset=0, with_payload=True, **kwargs):
+        return await self._run(self.index.query_points, collection_name, query, query_filter=query_filter, limit=limit, offset=offset, with_payload=with_payload, **kwargs)
+
+    async def query_batch_points(self, collection_name, requests, **kwargs):
+        return await self._run(self.index.query_batch_points, collection_name, requests, **kwargs)
+
+    async def scroll(self, collection_name, scroll_filter=None, limit=10, offset=None, with_payload=True, with_vectors=False, **kwargs):
+        return await self._run(self.index.scroll, collection_name, scroll_filter=scroll_filter, limit=limit, offset=offset, with_payload=with_payload, with_vectors=with_vectors, **kwargs)
+
+    async def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        return await self._run(self.index.retrieve, collection_name, ids, with_payload=with_payload, with_vectors=with_vectors, **kwargs)
+
+    async def delete(self, collection_name, points_selector, **kwargs):
+        return await self._run(self.index.delete, collection_name, points_selector, **kwargs)
+
+    async def count(self, collection_name, exact=True, **kwargs):
+        return await self._run(self.index.count, collection_name, exact=exact, **kwargs)
+
+def _compile_condition(cond):
+    if isinstance(cond, Filter):
+        return _compile_filter(cond)
+    if isinstance(cond, HasIdCondition):
+        ids = set(str(i) for i in cond.has_id)
+        return lambda point_id, payload: str(point_id) in ids
+    if not isinstance(cond, FieldCondition) or cond.match is None:
+        raise NotImplementedError(f"Local index does not support condition {cond!r}")
+
+    key, match = cond.key, cond.match
+    if isinstance(match, MatchValue):
+        accepted, negate = {match.value}, False
+    elif isinstance(match, MatchAny):
+        accepted, negate = set(match.any), False
+    elif isinstance(match, MatchExcept):
+        accepted, negate = set(getattr(match, "except_")), True
+    else:
+        raise NotImplementedError(f"Local index does not support match {match!r}")
+
+    def predicate(point_id, payload):
+        value = payload.get(key)
+        values = value if isinstance(value, list) else [value]
+        hit = any(v in accepted for v in values if v is not None)
+        return not hit if negate else hit
+    return predicate
+
+def _compile_filter(f: Filter):
+    must = [_compile_condition(c) for c in (f.must or [])]
+    must_not = [_compile_condition(c) for c in (f.must_not or [])]
+    should = [_compile_condition(c) for c in (f.should or [])]
+
+    def predicate(point_id, payload):
+        if any(not p(point_id, payload) for p in must):
+            return False
+        if any(p(point_id, payload) for p in must_not):
+            return False
+        if should and not any(p(point_id, payload) for p in should):
+            return False
+        return True
+    return predicate
+
+class _LocalCollection:
+    """
+    One collection stored as <dir>/vectors.npy (memory-mapped on load) plus a
+    payloads.jsonl sidecar with one {"id", "payload"} line per row.
+
+    Writes go to an in-memory tail; deletes and overwrites tombstone the old row.
+    flush() compacts everything back to disk and, if enabled, retrains the IVF
+    partitions over the persisted rows.
+
+    Filters are evaluated with NumPy over per-field inverted indexes (value ->
+    rows), built on first use of a field, and each condition's mask is cached.
+    Repeated conditions such as opt-outs and categories stay cached while
+    per-request ones (a cursor's seen_urls) only cost their own matches.
+    """
+    def __init__(self, path: str, dim: int, dtype: str, ivf_lists: int, nprobe: int):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self.lock = threading.RLock()
+        self.version = 0
+        self._mask_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._load()
+
+    # --- storage -------------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        self.ids: List = []
+        self.payloads: List[Dict] = []
+        self.base = np.zeros((0, self.dim), dtype=self.dtype)
+        self.tail: List[np.ndarray] = []
+        self._tail_matrix = None
+        self.centroids = None
+        self.list_rows: List[np.ndarray] = []
+
+        if os.path.exists(self._file("vectors.npy")):
+            self.base = np.load(self._file("vectors.npy"), mmap_mode="r")
+            with open(self._file("payloads.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    self.ids.append(row["id"])
+                    self.payloads.append(row["payload"])
+            if os.path.exists(self._file("ivf_centroids.npy")):
+                self.centroids = np.load(self._file("ivf_centroids.npy"))
+                self._set_assignments(np.load(self._file("ivf_assign.npy")))
+
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.row_of = {point_id: row for row, point_id in enumerate(self.ids)}
+        self._postings: Dict[str, Dict] = {}
+        self._id_order = None
+        self.dirty = False
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            keep = np.flatnonzero(self.alive)
+            vectors = self._all_vectors()[keep].astype(self.dtype)
+            ids = [self.ids[row] for row in keep]
+            payloads = [self.payloads[row] for row in keep]
+
+            os.makedirs(self.path, exist_ok=True)
+            # Write to temp files first so a crash never leaves a half-written index
+            np.save(self._file("vectors.tmp.npy"), vectors)
+            with open(self._file("payloads.jsonl.tmp"), "w", encoding="utf-8") as f:
+                for point_id, payload in zip(ids, payloads):
+                    f.write(json.dumps({"id": point_id, "payload": payload}, ensure_ascii=False) + "\n")
+
+            self._train_ivf(vectors)
+            # Release the old memory map before replacing the file underneath it
+            self.base = None
+            os.replace(self._file("vectors.tmp.npy"), self._file("vectors.npy"))
+            os.replace(self._file("payloads.jsonl.tmp"), self._file("payloads.jsonl"))
+            self._load()
+            self.version += 1
+            self._mask_cache.clear()
+            logging.info(f"Local index flushed: {len(ids)} vectors -> {self.path}")
+
+    def _train_ivf(self, vectors: np.ndarray):
+        for name in ("ivf_centroids.npy", "ivf_assign.npy"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        # Need a reasonable number of points per list for partitioning to pay off
+        if not self.ivf_lists or len(vectors) < self.ivf_lists * 10:
+            return
+
+        data = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(0)
+        sample = data[rng.choice(len(data), size=min(len(data), self.ivf_lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=self.ivf_lists, replace=False)].copy()
+        # Spherical k-means: vectors are unit length, so maximize dot product
+        for _ in range(10):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for k in range(self.ivf_lists):
+                members = sample[assign == k]
+                if len(members):
+                    c = members.sum(axis=0)
+                    centroids[k] = c / max(np.linalg.norm(c), 1e-12)
+
+        assign = np.empty(len(data), dtype=np.int32)
+        for start in range(0, len(data), 65536):
+            assign[start:start + 65536] = np.argmax(data[start:start + 65536] @ centroids.T, axis=1)
+        np.save(self._file("ivf_centroids.npy"), centroids)
+        np.save(self._file("ivf_assign.npy"), assign)
+
+    def _set_assignments(self, assign: np.ndarray):
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        self.list_rows = [order[bounds[k]:bounds[k + 1]] for k in range(len(self.centroids))]
+
+    # --- rows ------------------------------------------------------------------
+
+    def _tail_vectors(self) -> np.ndarray:
+        if self._tail_matrix is None:
+            self._tail_matrix = np.vstack(self.tail) if self.tail else np.zeros((0, self.dim), dtype=np.float32)
+        return self._tail_matrix
+
+    def _all_vectors(self) -> np.ndarray:
+        return np.vstack([np.asarray(self.base, dtype=np.float32), self._tail_vectors()])
+
+    def vector(self, row: int) -> np.ndarray:
+        if row < len(self.base):
+            return np.asarray(self.base[row], dtype=np.float32)
+        return self._tail_vectors()[row - len(self.base)]
+
+    def upsert(self, points: List):
+        with self.lock:
+            for point in points:
+                vec = np.asarray(point.vector, dtype=np.float32)
+                vec = vec / max(np.linalg.norm(vec), 1e-12)
+                point_id = str(point.id)
+                old_row = self.row_of.get(point_id)
+                if old_row is not None:
+                    self.alive[old_row] = False
+                row = len(self.ids)
+                self.row_of[point_id] = row
+                self.ids.append(point_id)
+                self.payloads.append(point.payload or {})
+                self.tail.append(vec[None, :])
+                # Keep already built field indexes current; the old row is dead via alive
+                for key, postings in self._postings.items():
+                    self._post(postings, self.payloads[row].get(key), row)
+            self.alive = np.concatenate([self.alive, np.ones(len(self.ids) - len(self.alive), dtype=bool)])
+            self._tail_matrix = None
+            self._id_order = None
+            self._mask_cache.clear()
+            self.dirty = True
+
+    def delete_rows(self, rows: List[int]):
+        with self.lock:
+            for row in rows:
+                self.alive[row] = False
+                self.row_of.pop(self.ids[row], None)
+            # Cached condition masks stay valid: filter_mask applies alive on top
+            self.dirty = True
+
+    @staticmethod
+    def _post(postings: Dict, value, row: int):
+        for v in value if isinstance(value, list) else [value]:
+            if v is not None and not isinstance(v, (dict, list)):
+                postings.setdefault(v, []).append(row)
+
+    def _field_postings(self, key: str) -> Dict:
+        postings = self._postings.get(key)
+        if postings is None:
+            postings = {}
+            for row, payload in enumerate(self.payloads):
+                self._post(postings, payload.get(key), row)
+            self._postings[key] = postings
+        return postings
+
+    def _rows_mask(self, rows) -> np.ndarray:
+        mask = np.zeros(len(self.ids), dtype=bool)
+        rows = np.fromiter(rows, dtype=np.int64)
+        if len(rows):
+            mask[rows] = True
+        return mask
+
+    def _condition_mask(self, cond) -> np.ndarray:
+        if isinstance(cond, Filter):
+            return self._filter_mask(cond)
+        key = cond.model_dump_json()
+        mask = self._mask_cache.get(key)
+        if mask is not None:
+            self._mask_cache.move_to_end(key)
+            return mask
+
+        if isinstance(cond, HasIdCondition):
+            mask = self._rows_mask(self.row_of[str(i)] for i in cond.has_id if str(i) in self.row_of)
+        elif isinstance(cond, FieldCondition) and cond.match is not None:
+            match = cond.match
+            if isinstance(match, MatchValue):
+                accepted, negate = [match.value], False
+            elif isinstance(match, MatchAny):
+                accepted, negate = match.any, False
+            elif isinstance(match, MatchExcept):
+                accepted, negate = getattr(match, "except_"), True
+            else:
+                raise NotImplementedError(f"Local index does not support match {match!r}")
+            postings = self._field_postings(cond.key)
+            mask = self._rows_mask(row for value in set(accepted) for row in postings.get(value, ()))
+            if negate:
+                mask = ~mask
+        else:
+            raise NotImplementedError(f"Local index does not support condition {cond!r}")
+
+        self._mask_cache[key] = mask
+        while len(self._mask_cache) > 256:
+            self._mask_cache.popitem(last=False)
+        return mask
+
+    def _filter_mask(self, f: Filter) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        for cond in f.must or []:
+            mask &= self._condition_mask(cond)
+        for cond in f.must_not or []:
+            mask &= ~self._condition_mask(cond)
+        if f.should:
+            any_should = np.zeros(len(self.ids), dtype=bool)
+            for cond in f.should:
+                any_should |= self._condition_mask(cond)
+            mask &= any_should
+        return mask
+
+    def filter_mask(self, query_filter: Optional[Filter]) -> np.ndarray:
+        if query_filter is None:
+            return self.alive
+        return self.alive & self._filter_mask(query_filter)
+
+    def id_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows sorted by point id, and the sorted ids. Scroll offsets are point
+        ids, so they stay valid when a flush compacts and renumbers rows.
+        """
+        if self._id_order is None:
+            ids = np.asarray(self.ids, dtype=str)
+            order = np.argsort(ids, kind="stable")
+            self._id_order = (order, ids[order])
+        return self._id_order
+
+    def search(self, query: np.ndarray, mask: np.ndarray, k: int):
+        n_base = len(self.base)
+        if self.centroids is not None and n_base:
+            probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            candidates = np.concatenate([self.list_rows[p] for p in probes])
+        else:
+            candidates = np.arange(n_base)
+
+        # Sorted row order keeps memory-mapped reads sequential
+        candidates = np.sort(candidates[mask[candidates]]) if len(candidates) else candidates
+        scores = [np.asarray(self.base[candidates], dtype=np.float32) @ query]
+        rows = [candidates]
+
+        tail_rows = np.arange(n_base, len(self.ids))
+        tail_rows = tail_rows[mask[tail_rows]]
+        if len(tail_rows):
+            scores.append(self._tail_vectors()[tail_rows - n_base] @ query)
+            rows.append(tail_rows)
+
+        scores = np.concatenate(scores)
+        rows = np.concatenate(rows)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+class LocalVectorIndex(VectorIndex):
+    """
+    File-backed VectorIndex for offline and single-node deployments.
+
+    Vectors are unit-normalized and stored in a memory-mapped .npy per
+    collection, so startup only maps the file instead of re-embedding anything.
+    Top-k is an exact matrix-vector product; with ivf_lists > 0 the persisted
+    rows are partitioned by spherical k-means and only the nprobe closest lists
+    are scanned.
+    """
+    def __init__(self, path: str = None, dtype: str = None, ivf_lists: int = None, nprobe: int = None):
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.path = path or os.getenv("LOCAL_INDEX_PATH", os.path.join(base_dir, "local_index"))
+        self.dtype = dtype or os.getenv("LOCAL_INDEX_DTYPE", "float16")
+        self.ivf_lists = ivf_lists if ivf_lists is not None else int(os.getenv("LOCAL_INDEX_IVF_LISTS", "0"))
+        self.nprobe = nprobe or int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+        self.flush_every = int(os.getenv("LOCAL_INDEX_FLUSH_EVERY", "10000"))
+        self._collections: Dict[str, _LocalCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        atexit.register(self.flush)
+
+    def _meta_path(self, collection_name: str) -> str:
+        return os.path.join(self.path, collection_name, "meta.json")
+
+    def _collection(self, collection_name: str) -> _LocalCollection:
+        with self._lock:
+            col = self._collections.get(collection_name)
+            if col is None:
+                if not os.path.exists(self._meta_path(collection_name)):
+                    raise ValueError(f"Collection {collection_name} not found")
+                with open(self._meta_path(collection_name), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                col = _LocalCollection(os.path.join(self.path, collection_name), meta["size"], meta.get("dtype", self.dtype), self.ivf_lists, self.nprobe)
+                self._collections[collection_name] = col
+            return col
+
+    def collection_exists(self, collection_name):
+        return os.path.exists(self._meta_path(collection_name))
+
+    def create_collection(self, collection_name, vectors_config, **kwargs):
+        os.makedirs(os.path.join(self.path, collection_name), exist_ok=True)
+        with open(self._meta_path(collection_name), "w", encoding="utf-8") as f:
+            json.dump({"size": vectors_config.size, "dtype": self.dtype}, f)
+        return True
+
+    def create_payload_index(self, collection_name, field_name, field_schema=None, **kwargs):
+        # Field indexes are built on the first filter that uses the field
+        return True
+
+    def upsert(self, collection_name, points, **kwargs):
+        col = self._collection(collection_name)
+        col.upsert(points)
+        if len(col.tail) >= self.flush_every:
+            col.flush()
+
+    def _to_record(self, col: _LocalCollection, row: int, with_payload, with_vectors, score=None):
+        payload = col.payloads[row] if with_payload else None
+        vector = col.vector(row).tolist() if with_vectors else None
+        if score is None:
+            return Record(id=col.ids[row], payload=payload, vector=vector)
+        return ScoredPoint(id=col.ids[row], version=col.version, score=float(score), payload=payload, vector=vector)
+
+    def query_points(self, collection_name, query, query_filter=None, limit=10, offset=0, with_payload=True, with_vectors=False, **kwargs):
+        col = self._collection(collection_name)
+        q = np.asarray(query, dtype=np.float32)
+        q = q / max(np.linalg.norm(q), 1e-12)
+        with col.lock:
+            rows, scores = col.search(q, col.filter_mask(query_filter), (offset or 0) + limit)
+            points = [
+                self._to_record(col, row, with_payload, with_vectors, score)
+                for row, score in list(zip(rows, scores))[offset or 0:]
+            ]
+        return QueryResponse(points=points)
+
+    def query_batch_points(self, collection_name, requests, **kwargs):
+        return [
+            self.query_points(
+                collection_name,
+                request.query,
+                query_filter=request.filter,
+                limit=request.limit or 10,
+                offset=request.offset or 0,
+                with_payload=bool(request.with_payload),
+                with_vectors=bool(request.with_vector),
+            )
+            for request in requests
+        ]
+
+    def scroll(self, collection_name, scroll_filter=None, limit=10, offset=None, with_payload=True, with_vectors=False, **kwargs):
+        col = self._collection(collection_name)
+        with col.lock:
+            # In point id order from offset (a point id, inclusive), like Qdrant
+            order, sorted_ids = col.id_order()
+            start = int(np.searchsorted(sorted_ids, str(offset))) if offset is not None else 0
+            rows = order[start:]
+            rows = rows[col.filter_mask(scroll_filter)[rows]]
+            records = [self._to_record(col, row, with_payload, with_vectors) for row in rows[:limit]]
+            next_offset = col.ids[rows[limit]] if len(rows) > limit else None
+        return records, next_offset
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        col = self._collection(collection_name)
+        with col.lock:
+            rows = [col.row_of[str(i)] for i in ids if str(i) in col.row_of]
+            return [self._to_record(col, row, with_payload, with_vectors) for row in rows]
+
+    def delete(self, collection_name, points_selector, **kwargs):
+        col = self._collection(collection_name)
+        with col.lock:
+            if isinstance(points_selector, PointIdsList):
+                rows = [col.row_of[str(i)] for i in points_selector.points if str(i) in col.row_of]
+            elif isinstance(points_selector, FilterSelector):
+                rows = list(np.flatnonzero(col.filter_mask(points_selector.filter)))
+            else:
+                rows = [col.row_of[str(i)] for i in points_selector if str(i) in col.row_of]
+            col.delete_rows(rows)
+
+    def count(self, collection_name, exact=True, **kwargs):
+        col = self._collection(collection_name)
+        with col.lock:
+            return CountResult(count=int(col.alive.sum()))
+
+    def flush(self):
+        for col in list(self._collections.values()):
+            col.flush()
+
+def create_vector_index() -> VectorIndex:
+    """
+    Pick the backend from the environment: VECTOR_BACKEND=local for the file
+    index, otherwise Qdrant Cloud when credentials are set, else in-memory Qdrant.
+    """
+    if os.getenv("VECTOR_BACKEND", "qdrant").lower() == "local":
+        logging.info("Using local NumPy vector index.")
+        return LocalVectorIndex()
+
+    # One client per process, shared with the scripts and search_standalone.py
+    return QdrantIndex(get_qdrant_client())
+
+def create_async_vector_index(index: VectorIndex) -> AsyncVectorIndex:
+    """
+    Async view of the same collections: the shared AsyncQdrantClient when
+    `index` talks to a Qdrant server, otherwise `index` run on threads.
+    """
+    if isinstance(index, QdrantIndex) and index.client is get_qdrant_client():
+        async_client = get_async_qdrant_client()
+        if async_client is not None:
+            return AsyncQdrantIndex(async_client)
+    return ThreadedAsyncIndex(index)
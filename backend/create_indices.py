@@ -11,7 +11,7 @@ qdrant_api_key = os.getenv("QDRANT_CLOUD_API_KEY")
 client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
 collection_name = "booth_items"
 
-fields = ["shopName", "category", "avatars", "colors"]
+fields = ["shopName", "shopSubdomain", "itemId", "category", "avatars", "colors", "boothUrl"]
 
 for field in fields:
     print(f"Creating index for {field}...")
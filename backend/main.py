@@ -6,14 +6,33 @@ import os
 import asyncio
 
 from app.db import init_db
-from app.routers.search import get_vector_db
-from app.services.image_processor import ImageProcessor
+from app.services.quota_counter import quota_counter
+from app.routers.search import get_inference_executor, get_text_embedding_cache, get_garment_detector
+from app.services.catalog_vocabulary import text_warmup_phrases
+from app.services.qdrant_clients import get_async_qdrant_client
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize SQLite DB
     init_db()
     
+    # Finish deleting opted-out shops whose enforcement did not complete
+    from app.routers.admin import enforce_pending_opt_outs
+    asyncio.get_running_loop().run_in_executor(None, enforce_pending_opt_outs)
+    
+    # Write-behind flushing of search counts
+    quota_counter.start()
+
+    # Pre-embed avatar/color queries for /api/search/text in the background. Under
+    # CLIP_RUNTIME=onnx that would load the PyTorch model just for the text tower,
+    # so there it only runs with TEXT_CACHE_WARMUP=1
+    default_warmup = "0" if os.getenv("CLIP_RUNTIME", "torch").lower() == "onnx" else "1"
+    if os.getenv("TEXT_CACHE_WARMUP", default_warmup) == "1":
+        asyncio.get_running_loop().run_in_executor(None, get_text_embedding_cache().warm_up, text_warmup_phrases())
+
+    # Load (exporting to ONNX if needed) the YOLO model before the first /api/detect
+    asyncio.get_running_loop().run_in_executor(None, get_garment_detector().refresh)
+    
     # Start background seeding for VectorDB
     # processor = ImageProcessor() 
     # vector_db = get_vector_db()
@@ -21,8 +40,12 @@ async def lifespan(app: FastAPI):
     
     yield
     # Cleanup if needed
+    await quota_counter.stop()
+    get_inference_executor().shutdown()
+    if get_async_qdrant_client() is not None:
+        await get_async_qdrant_client().close()
 
-from app.routers import search, subscription, admin
+from app.routers import search, subscription, admin, detect
 
 app = FastAPI(lifespan=lifespan)
 
@@ -52,6 +75,7 @@ if os.path.exists(SCRAPER_DATA_DIR):
 app.include_router(search.router, prefix="/api")
 app.include_router(subscription.router, prefix="/api")
 app.include_router(admin.router, prefix="/api")
+app.include_router(detect.router, prefix="/api")
 
 @app.get("/")
 def root():
@@ -1,23 +1,14 @@
 import os
+import sys
 import random
 import glob
 import shutil
-from ultralytics import YOLO
 from pathlib import Path
 from tqdm import tqdm
 
-def find_best_model():
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    candidates = [
-        os.path.join(base_dir, "runs", "detect", "train2", "weights", "best.pt"),
-        os.path.join(base_dir, "..", "runs", "detect", "train2", "weights", "best.pt"),
-        os.path.join(base_dir, "runs", "detect", "train", "weights", "best.pt"),
-        os.path.join(base_dir, "..", "runs", "detect", "train", "weights", "best.pt"),
-    ]
-    for path in candidates:
-        if os.path.exists(path):
-            return path
-    return None
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.fast_preprocess import open_frame
+from app.services.garment_detector import GarmentDetector, find_best_model
 
 def auto_annotate(num_samples=1000, confidence_threshold=0.6):
     backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -28,7 +19,12 @@ def auto_annotate(num_samples=1000, confidence_threshold=0.6):
         return
 
     print(f"Loading YOLO model from: {model_path}")
-    model = YOLO(model_path)
+    detector = GarmentDetector(model_path, confidence=confidence_threshold)
+    # Keep every box above the threshold (ultralytics' default cap), not just the few search uses
+    detector.max_detections = 300
+    if not detector.available:
+        print("Error: the YOLO model could not be loaded (exporting best.pt to ONNX needs ultralytics).")
+        return
 
     raw_images_dir = os.path.join(backend_dir, "scraper", "data", "raw_images")
     output_dataset_dir = os.path.join(backend_dir, "yolo_dataset", "auto_generated")
@@ -54,41 +50,47 @@ def auto_annotate(num_samples=1000, confidence_threshold=0.6):
     
     successful_annotated = 0
 
-    for img_path in tqdm(samples):
-        filename = os.path.basename(img_path)
-        img_name, ext = os.path.splitext(filename)
-        
-        try:
-            results = model(img_path, conf=confidence_threshold, verbose=False)
-            
+    # Detect in batches; letterboxing makes the normalized boxes independent of the decode size
+    for batch_start in tqdm(range(0, len(samples), detector.batch_size)):
+        batch_paths = samples[batch_start:batch_start + detector.batch_size]
+        frames, frame_paths = [], []
+        for img_path in batch_paths:
+            try:
+                frames.append(open_frame(img_path, detector.imgsz))
+                frame_paths.append(img_path)
+            except Exception as e:
+                print(f"Error processing {os.path.basename(img_path)}: {e}")
+        if not frames:
+            continue
+
+        for img_path, detections in zip(frame_paths, detector.detect_batch(frames)):
+            filename = os.path.basename(img_path)
+            img_name, ext = os.path.splitext(filename)
+
             # If nothing was detected above threshold, skip saving this image
             # Or you might want to save it as empty background. For now, we only save if detected.
-            has_detections = False
+            if not detections:
+                continue
+
+            # YOLO normalized coordinates: center_x center_y width height
             label_lines = []
-            
-            for result in results:
-                for box in result.boxes:
-                    cls_id = int(box.cls)
-                    # YOLO normalized coordinates: center_x center_y width height
-                    # xywhn is normalized 0-1
-                    x, y, w, h = box.xywhn[0]
-                    label_lines.append(f"{cls_id} {float(x)} {float(y)} {float(w)} {float(h)}")
-                    has_detections = True
-            
-            if has_detections:
+            for d in detections:
+                x1, y1, x2, y2 = d["box"]
+                label_lines.append(f"{d['class_id']} {(x1 + x2) / 2} {(y1 + y2) / 2} {x2 - x1} {y2 - y1}")
+
+            try:
                 # 1. Copy image
                 dest_img = os.path.join(images_out_dir, filename)
                 shutil.copy2(img_path, dest_img)
-                
+
                 # 2. Save label
                 label_path = os.path.join(labels_out_dir, f"{img_name}.txt")
                 with open(label_path, "w", encoding="utf-8") as f:
                     f.write("\n".join(label_lines) + "\n")
-                    
+
                 successful_annotated += 1
-                
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+            except Exception as e:
+                print(f"Error processing {filename}: {e}")
 
     print(f"Auto-annotation complete! {successful_annotated} images successfully extracted to {output_dataset_dir}")
 
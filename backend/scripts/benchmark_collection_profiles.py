@@ -0,0 +1,97 @@
+"""
+Compare Qdrant collection profiles (app/services/collection_profile.py) on
+recall@k and query latency before switching QDRANT_PROFILE.
+
+Each profile gets a scratch collection filled with the same vectors: real
+ones scrolled from booth_items when it has points, otherwise synthetic
+clusters. Recall is measured against exact brute-force neighbors. Needs a
+Qdrant server (QDRANT_URL, or QDRANT_CLOUD_URL + QDRANT_CLOUD_API_KEY);
+local :memory: mode ignores HNSW and quantization settings entirely.
+
+Usage: python scripts/benchmark_collection_profiles.py [num_points] [num_queries] [top_k]
+"""
+import os
+import sys
+import time
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.collection_profile import PROFILES, create_collection_kwargs, search_params
+
+SOURCE_COLLECTION = "booth_items"
+DIM = 512
+
+def connect() -> QdrantClient:
+    load_dotenv()
+    if os.getenv("QDRANT_URL"):
+        return QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    if os.getenv("QDRANT_CLOUD_URL") and os.getenv("QDRANT_CLOUD_API_KEY"):
+        return QdrantClient(url=os.getenv("QDRANT_CLOUD_URL"), api_key=os.getenv("QDRANT_CLOUD_API_KEY"))
+    print("No Qdrant server configured; set QDRANT_URL or QDRANT_CLOUD_URL/QDRANT_CLOUD_API_KEY")
+    sys.exit(1)
+
+def load_vectors(client: QdrantClient, n: int, rng) -> np.ndarray:
+    vectors = []
+    if client.collection_exists(SOURCE_COLLECTION):
+        next_page = None
+        while len(vectors) < n:
+            records, next_page = client.scroll(SOURCE_COLLECTION, limit=1000, with_payload=False, with_vectors=True, offset=next_page)
+            vectors.extend(r.vector for r in records)
+            if next_page is None: break
+    if vectors:
+        print(f"Using {min(n, len(vectors))} vectors from {SOURCE_COLLECTION}")
+        vectors = np.asarray(vectors[:n], dtype=np.float32)
+    else:
+        print(f"{SOURCE_COLLECTION} is empty; using {n} synthetic clustered vectors")
+        centers = rng.normal(size=(max(1, n // 10), DIM))
+        vectors = (centers[rng.integers(len(centers), size=n)] + 0.5 * rng.normal(size=(n, DIM))).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def wait_until_indexed(client: QdrantClient, name: str, timeout: float = 600):
+    start = time.time()
+    while time.time() - start < timeout:
+        if str(client.get_collection(name).status).lower().endswith("green"):
+            return
+        time.sleep(1)
+    print(f"  warning: {name} still optimizing after {timeout}s")
+
+def main():
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    client = connect()
+    rng = np.random.default_rng(0)
+    vectors = load_vectors(client, num_points, rng)
+    picks = rng.choice(len(vectors), size=num_queries, replace=False)
+    queries = vectors[picks] + rng.normal(scale=0.02, size=(num_queries, DIM)).astype(np.float32)
+    truth = [set(np.argsort(-(vectors @ q))[:k].tolist()) for q in queries]
+
+    for name, profile in PROFILES.items():
+        collection = f"bench_profile_{name}"
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        client.create_collection(collection_name=collection, **create_collection_kwargs(profile, DIM))
+        try:
+            for i in range(0, len(vectors), 1000):
+                client.upsert(collection, points=[PointStruct(id=j, vector=vectors[j].tolist()) for j in range(i, min(i + 1000, len(vectors)))], wait=True)
+            wait_until_indexed(client, collection)
+
+            params = search_params(profile)
+            latencies = []
+            recall = 0.0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                hits = client.query_points(collection, query=q.tolist(), limit=k, search_params=params).points
+                latencies.append((time.perf_counter() - start) * 1000)
+                recall += len({int(h.id) for h in hits} & expected) / k
+            latencies = np.array(latencies)
+            print(f"{name:<15} p50={np.percentile(latencies, 50):7.2f}ms  p99={np.percentile(latencies, 99):7.2f}ms  recall@{k}={recall / num_queries:.3f}")
+        finally:
+            client.delete_collection(collection)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark the INT8 CLIP encoder against fp32 before enabling CLIP_QUANTIZE=int8.
+
+Embeds a fixed random sample of scraper/data/raw_images with both encoders on
+the selected runtime (CLIP_RUNTIME), reports latency and throughput, and
+measures how much of the fp32 top-k survives when the fp32 index is queried
+with INT8 query vectors.
+
+Usage: python scripts/benchmark_quantized_clip.py [sample_size] [batch_size] [top_k]
+"""
+import glob
+import os
+import random
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.image_processor import ImageProcessor
+
+SEED = 42
+
+def load_sample(sample_size: int):
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = sorted(glob.glob(os.path.join(backend_dir, "scraper", "data", "raw_images", "*.jpg")))
+    if not paths:
+        print("No images found in scraper/data/raw_images")
+        sys.exit(1)
+    random.Random(SEED).shuffle(paths)
+    return [Image.open(p).convert("RGB") for p in paths[:sample_size]]
+
+def embed_all(processor: ImageProcessor, images, batch_size: int):
+    # One warm-up batch so lazy initialization is not timed
+    processor.get_embeddings(images[:batch_size])
+    latencies = []
+    vectors = []
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        batch_start = time.perf_counter()
+        vectors.extend(processor.get_embeddings(images[i:i + batch_size]))
+        latencies.append((time.perf_counter() - batch_start) * 1000)
+    total = time.perf_counter() - start
+    return np.array(vectors, dtype=np.float32), np.array(latencies), len(images) / total
+
+def top_k(index: np.ndarray, queries: np.ndarray, k: int):
+    scores = queries @ index.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+if __name__ == "__main__":
+    sample_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    images = load_sample(sample_size)
+    print(f"Sample: {len(images)} images | batch size {batch_size} | runtime {os.getenv('CLIP_RUNTIME', 'torch')}")
+
+    results = {}
+    for mode in ("none", "int8"):
+        vectors, latencies, throughput = embed_all(ImageProcessor(quantize=mode), images, batch_size)
+        results[mode] = vectors
+        label = "fp32" if mode == "none" else mode
+        print(f"{label:<5} p50={np.percentile(latencies, 50):8.1f} ms/batch  p99={np.percentile(latencies, 99):8.1f} ms/batch  throughput={throughput:6.1f} img/s")
+
+    fp32, int8 = results["none"], results["int8"]
+    cosines = np.sum(fp32 * int8, axis=1)
+    # Each image queries the fp32 index; compare neighbors of its fp32 and int8 query vectors
+    overlap = np.mean([
+        len(set(a) & set(b)) / k
+        for a, b in zip(top_k(fp32, fp32, k), top_k(fp32, int8, k))
+    ])
+    print(f"fp32 vs int8 cosine: min={cosines.min():.4f} mean={cosines.mean():.4f}")
+    print(f"top-{k} overlap against fp32 index: {overlap:.3f}")
@@ -0,0 +1,62 @@
+"""
+Compare top-k latency and recall of the local NumPy index (brute force and IVF)
+against in-memory Qdrant on synthetic unit vectors.
+
+Usage: python scripts/benchmark_vector_index.py [num_points] [num_queries]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams, PointStruct
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.vector_index import LocalVectorIndex, QdrantIndex
+
+COLLECTION_NAME = "bench"
+DIM = 512
+TOP_K = 10
+
+def make_points(n: int, rng):
+    vectors = rng.normal(size=(n, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, [PointStruct(id=i, vector=vectors[i].tolist(), payload={"shopName": f"shop-{i % 100}"}) for i in range(n)]
+
+def run(name, index, queries, truth):
+    latencies = []
+    recall = 0.0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = index.query_points(COLLECTION_NAME, query=q.tolist(), limit=TOP_K).points
+        latencies.append((time.perf_counter() - start) * 1000)
+        recall += len({int(h.id) for h in hits} & expected) / TOP_K
+    latencies = np.array(latencies)
+    print(f"{name:<16} p50={np.percentile(latencies, 50):7.2f}ms  p99={np.percentile(latencies, 99):7.2f}ms  recall@{TOP_K}={recall / len(queries):.3f}")
+
+def main():
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = np.random.default_rng(0)
+    vectors, points = make_points(num_points, rng)
+    queries = vectors[rng.choice(num_points, size=num_queries, replace=False)] + rng.normal(scale=0.05, size=(num_queries, DIM)).astype(np.float32)
+    truth = [set(np.argsort(-(vectors @ q))[:TOP_K].tolist()) for q in queries]
+
+    config = VectorParams(size=DIM, distance=Distance.COSINE)
+    qdrant = QdrantIndex(QdrantClient(":memory:"))
+    qdrant.create_collection(COLLECTION_NAME, config)
+    for i in range(0, num_points, 1000):
+        qdrant.upsert(COLLECTION_NAME, points[i:i + 1000])
+    run("qdrant :memory:", qdrant, queries, truth)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, ivf_lists in (("local brute", 0), ("local ivf", max(16, int(np.sqrt(num_points))))):
+            local = LocalVectorIndex(path=os.path.join(tmp, label.replace(" ", "_")), dtype="float16", ivf_lists=ivf_lists)
+            local.create_collection(COLLECTION_NAME, config)
+            local.upsert(COLLECTION_NAME, points)
+            local.flush()
+            run(label, local, queries, truth)
+
+if __name__ == "__main__":
+    main()
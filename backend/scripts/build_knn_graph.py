@@ -0,0 +1,23 @@
+"""
+Precompute the k most similar products of every product (app/services/knn_graph.py)
+for /api/similar. Run after the scraper and seeding; by default only new or
+changed products are scored, pass --full to rebuild from scratch. The API
+picks up the new table without a restart.
+
+Usage: python scripts/build_knn_graph.py [k] [--full]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.knn_graph import build_knn_graph
+from app.services.vector_index import create_vector_index
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    k = int(args[0]) if args else None
+
+    start = time.time()
+    stats = build_knn_graph(create_vector_index(), "booth_items", k=k, full="--full" in sys.argv)
+    print(f"{stats['products']} products, {stats['recomputed']} rows recomputed (k={stats['k']}) in {time.time() - start:.1f}s -> {stats['path']}")
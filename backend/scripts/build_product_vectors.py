@@ -0,0 +1,43 @@
+"""
+Build (or rebuild) the per-product aggregate collection from booth_items.
+
+seed_data rebuilds it automatically when PRODUCT_VECTORS=1; run this after
+seeding with another tool, or to switch PRODUCT_POOLING. Afterwards it reports
+how often two-stage search agrees with per-image search on a sample of
+stored vectors used as queries.
+
+Usage: python scripts/build_product_vectors.py [sample_queries] [top_k]
+"""
+import asyncio
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["PRODUCT_VECTORS"] = "1"
+from app.services.vector_db import VectorDBService
+
+async def compare(db: VectorDBService, records, k: int):
+    overlaps = []
+    for record in records:
+        two_stage = await db.search_similar(record.vector, limit=k)
+        product_index, db.product_index = db.product_index, None
+        per_image = await db.search_similar(record.vector, limit=k)
+        db.product_index = product_index
+        a = {hit.payload.get("boothUrl") for hit in two_stage}
+        b = {hit.payload.get("boothUrl") for hit in per_image}
+        overlaps.append(len(a & b) / max(len(b), 1))
+    return overlaps
+
+if __name__ == "__main__":
+    sample_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    db = VectorDBService()
+    images = db.client.count(db.collection_name).count
+    products = db.product_index.build()
+    print(f"{images} images -> {products} products ({images / max(products, 1):.1f}x smaller index)")
+
+    records, _ = db.client.scroll(collection_name=db.collection_name, limit=sample_queries, with_payload=False, with_vectors=True)
+    overlaps = asyncio.run(compare(db, records, k))
+    print(f"top-{k} product overlap with per-image search over {len(overlaps)} queries: {np.mean(overlaps):.3f}")
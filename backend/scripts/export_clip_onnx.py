@@ -0,0 +1,17 @@
+"""
+Export the CLIP vision encoder to ONNX for CLIP_RUNTIME=onnx.
+
+Usage: python scripts/export_clip_onnx.py [output_path]
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.image_processor import CLIP_MODEL_ID
+from app.services.onnx_encoder import DEFAULT_ONNX_PATH, export_vision_onnx
+
+if __name__ == "__main__":
+    output_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("CLIP_ONNX_PATH", DEFAULT_ONNX_PATH)
+    print(f"Exporting {CLIP_MODEL_ID} vision encoder...")
+    export_vision_onnx(CLIP_MODEL_ID, output_path)
+    print(f"Saved to {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
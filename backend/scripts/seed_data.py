@@ -1,5 +1,6 @@
 import asyncio
 import os
+import sys
 import uuid
 from prisma import Prisma
 from qdrant_client import QdrantClient
@@ -10,6 +11,11 @@ import io
 import torch
 from transformers import CLIPProcessor, CLIPModel
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.opt_out_enforcer import is_item_excluded
+from app.services.opt_out_registry import OptOutRegistry
+from app.db import init_db
+
 # Configuration
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = "booth_items"
@@ -55,7 +61,12 @@ async def seed():
             vectors_config=VectorParams(size=512, distance=Distance.COSINE),
         )
 
+    init_db()
+    excluded_identifiers = OptOutRegistry().identifiers
     for item in SAMPLE_ITEMS:
+        if is_item_excluded({"url": item['boothUrl'], "shop": item['shopName']}, excluded_identifiers):
+            print(f"Skipping opted-out shop: {item['shopName']}")
+            continue
         print(f"Processing: {item['title']}")
         
         # 1. Download image and generate embedding
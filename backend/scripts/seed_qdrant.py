@@ -1,4 +1,5 @@
 import os
+import sys
 import uuid
 import torch
 from PIL import Image
@@ -8,6 +9,13 @@ from transformers import CLIPProcessor, CLIPModel
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams, PointStruct
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.image_processor import CLIP_MODEL_ID
+from app.services.embedding_cache import EmbeddingCache, content_hash
+from app.services.opt_out_enforcer import is_item_excluded
+from app.services.opt_out_registry import OptOutRegistry
+from app.db import init_db
+
 # Configuration
 COLLECTION_NAME = "booth_items"
 HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
@@ -36,8 +44,9 @@ def seed_qdrant_only():
     # Initialize CLIP
     print("Loading CLIP model...")
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(device)
-    processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    model = CLIPModel.from_pretrained(CLIP_MODEL_ID).to(device)
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID)
+    embedding_cache = EmbeddingCache(CLIP_MODEL_ID)
     
     # Initialize Qdrant Local
     qdrant = QdrantClient(path="qdrant_local")
@@ -51,29 +60,40 @@ def seed_qdrant_only():
             vectors_config=VectorParams(size=512, distance=Distance.COSINE),
         )
 
+    init_db()
+    excluded_identifiers = OptOutRegistry().identifiers
     for item in SAMPLE_ITEMS:
+        if is_item_excluded({"url": item['boothUrl'], "shop": item['shopName']}, excluded_identifiers):
+            print(f"Skipping opted-out shop: {item['shopName']}")
+            continue
         print(f"Processing: {item['title']}")
         try:
             # 1. Download image
             response = requests.get(item['thumbnailUrl'], headers=HEADERS, timeout=15)
             response.raise_for_status()
-            image = Image.open(io.BytesIO(response.content)).convert("RGB")
-            
-            # 2. Get embedding
-            inputs = processor(images=image, return_tensors="pt").to(device)
-            with torch.no_grad():
-                outputs = model.get_image_features(**inputs)
             
-            # Extract tensor robustly
-            if hasattr(outputs, "image_embeds"):
-                features = outputs.image_embeds
-            elif hasattr(outputs, "pooler_output"):
-                features = outputs.pooler_output
+            # 2. Get embedding (reusing the cached vector for identical bytes)
+            img_hash = content_hash(response.content)
+            vector = embedding_cache.get(img_hash)
+            if vector is None:
+                image = Image.open(io.BytesIO(response.content)).convert("RGB")
+                inputs = processor(images=image, return_tensors="pt").to(device)
+                with torch.no_grad():
+                    outputs = model.get_image_features(**inputs)
+                
+                # Extract tensor robustly
+                if hasattr(outputs, "image_embeds"):
+                    features = outputs.image_embeds
+                elif hasattr(outputs, "pooler_output"):
+                    features = outputs.pooler_output
+                else:
+                    features = outputs[0] if isinstance(outputs, (list, tuple)) else outputs
+                
+                features = features / features.norm(p=2, dim=-1, keepdim=True)
+                vector = features.cpu().numpy()[0].tolist()
+                embedding_cache.put(img_hash, vector)
             else:
-                features = outputs[0] if isinstance(outputs, (list, tuple)) else outputs
-            
-            features = features / features.norm(p=2, dim=-1, keepdim=True)
-            vector = features.cpu().numpy()[0].tolist()
+                print("  -> Reused cached embedding")
             
             # 3. Save to Qdrant
             qdrant.upsert(
@@ -97,6 +117,7 @@ def seed_qdrant_only():
         except Exception as e:
             print(f"  -> ERROR seeding {item['title']}: {e}")
 
+    embedding_cache.close()
     print("--- [DEBUG] Seeding Complete ---")
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+"""
+Check that incremental k-NN graph builds (app/services/knn_graph.py) agree
+with a full rebuild: a rerun with no changes, a run after deleting a
+product, a run after adding products, and a run after remove_products()
+dropped an opted-out shop. Uses an in-memory Qdrant with
+synthetic clustered vectors, so it needs no server or model.
+
+Usage: python scripts/test_knn_graph.py
+"""
+import os
+import sys
+import tempfile
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointIdsList, PointStruct, VectorParams
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.knn_graph import KnnGraph, build_knn_graph
+from app.services.vector_db import get_stable_uuid
+from app.services.vector_index import QdrantIndex
+
+COLLECTION = "booth_items"
+DIM = 32
+K = 8
+
+def make_points(rng, centers, start: int, stop: int):
+    return [
+        PointStruct(
+            id=get_stable_uuid(f"img{i}"),
+            vector=(centers[(i // 3) % len(centers)] + 0.7 * rng.normal(size=DIM)).tolist(),
+            payload={"boothUrl": f"https://booth.pm/ja/items/{i // 3}", "shopName": f"shop{i // 12}", "itemId": str(i // 3)},
+        )
+        for i in range(start, stop)
+    ]
+
+def assert_matches_full(client, incremental_path: str, full_path: str):
+    build_knn_graph(client, COLLECTION, path=full_path, k=K, full=True)
+    a, b = KnnGraph.read(incremental_path), KnnGraph.read(full_path)
+    assert [p["key"] for p in a["products"]] == [p["key"] for p in b["products"]], "product keys differ"
+    # Neighbor order may differ only between scores that tie after float16 rounding
+    assert np.array_equal(a["scores"], b["scores"]), "neighbor scores differ from a full rebuild"
+
+def test_incremental_builds():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, DIM))
+    client = QdrantIndex(QdrantClient(":memory:"))
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+    client.upsert(COLLECTION, points=make_points(rng, centers, 0, 300))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, full_path = os.path.join(tmp, "graph.npz"), os.path.join(tmp, "full.npz")
+        assert build_knn_graph(client, COLLECTION, path=path, k=K)["recomputed"] == 100
+
+        # Unchanged collection: nothing to recompute
+        assert build_knn_graph(client, COLLECTION, path=path, k=K)["recomputed"] == 0
+        assert_matches_full(client, path, full_path)
+
+        # Deletion only (e.g. an opt-out purge): rows that pointed at it are recomputed
+        client.delete(COLLECTION, points_selector=PointIdsList(points=[get_stable_uuid(f"img{i}") for i in range(30, 33)]))
+        stats = build_knn_graph(client, COLLECTION, path=path, k=K)
+        assert stats["products"] == 99
+        assert_matches_full(client, path, full_path)
+
+        # New products are scored against everything and merged into existing rows
+        client.upsert(COLLECTION, points=make_points(rng, centers, 300, 360))
+        assert build_knn_graph(client, COLLECTION, path=path, k=K)["products"] == 119
+        assert_matches_full(client, path, full_path)
+
+def test_remove_products():
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(20, DIM))
+    client = QdrantIndex(QdrantClient(":memory:"))
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+    client.upsert(COLLECTION, points=make_points(rng, centers, 0, 300))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, full_path = os.path.join(tmp, "graph.npz"), os.path.join(tmp, "full.npz")
+        build_knn_graph(client, COLLECTION, path=path, k=K)
+        graph = KnnGraph(path)
+        assert graph.remove_products({"shop3"}) == 4
+
+        # Opted-out products are neither keys nor neighbors any more
+        assert "https://booth.pm/ja/items/12" not in graph and "15" not in graph
+        for key in ("https://booth.pm/ja/items/0", "https://booth.pm/ja/items/50"):
+            hits = graph.neighbors(key, limit=K) or []
+            assert all(hit.payload["shopName"] != "shop3" for hit in hits)
+
+        # After the points are purged, the next build recomputes the truncated rows
+        client.delete(COLLECTION, points_selector=PointIdsList(points=[get_stable_uuid(f"img{i}") for i in range(36, 48)]))
+        build_knn_graph(client, COLLECTION, path=path, k=K)
+        assert not KnnGraph.read(path)["truncated"].any()
+        assert_matches_full(client, path, full_path)
+
+if __name__ == "__main__":
+    test_incremental_builds()
+    test_remove_products()
+    print("SUCCESS: incremental k-NN graph builds and opt-out removal match full rebuilds")
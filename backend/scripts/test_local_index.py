@@ -0,0 +1,114 @@
+"""
+Check the local NumPy index (app/services/vector_index.py) against the
+reference payload predicate: vectorized filter masks must select exactly
+the rows _compile_filter accepts, including after deletes, overwrites and
+a flush, and scrolling must visit every point once even when a flush
+renumbers rows between pages. Also times paged searches whose seen_urls
+filter changes on every page.
+
+Usage: python scripts/test_local_index.py [num_points]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from qdrant_client.http.models import (
+    Distance, FieldCondition, Filter, HasIdCondition, MatchAny, MatchExcept, MatchValue,
+    PointIdsList, PointStruct, VectorParams,
+)
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.vector_index import LocalVectorIndex, _compile_filter
+
+COLLECTION_NAME = "booth_items"
+DIM = 32
+
+def make_points(rng, start: int, stop: int):
+    return [
+        PointStruct(
+            id=f"00000000-0000-0000-0000-{i:012d}",
+            vector=rng.normal(size=DIM).tolist(),
+            payload={
+                "shopName": f"shop{i % 50}",
+                "boothUrl": f"https://booth.pm/ja/items/{i // 3}",
+                "category": ["dress", "hair", "shoes"][i % 3],
+                "avatars": [f"avatar{i % 7}", f"avatar{i % 11}"],
+                "itemId": str(i // 3) if i % 5 else None,
+            },
+        )
+        for i in range(start, stop)
+    ]
+
+def sample_filters(rng):
+    urls = [f"https://booth.pm/ja/items/{i}" for i in rng.choice(400, size=60, replace=False)]
+    opt_outs = FieldCondition(key="shopName", match=MatchAny(any=["shop3", "shop17", "shop40"]))
+    return [
+        Filter(must_not=[opt_outs]),
+        Filter(must_not=[opt_outs, FieldCondition(key="boothUrl", match=MatchAny(any=urls))]),
+        Filter(must=[FieldCondition(key="category", match=MatchValue(value="hair"))], must_not=[opt_outs]),
+        Filter(must=[FieldCondition(key="avatars", match=MatchAny(any=["avatar2"]))], should=[
+            FieldCondition(key="itemId", match=MatchAny(any=["10", "20", "30"])),
+            FieldCondition(key="shopName", match=MatchValue(value="shop9")),
+        ]),
+        Filter(must=[FieldCondition(key="category", match=MatchExcept(**{"except": ["dress"]}))]),
+        Filter(must=[HasIdCondition(has_id=["00000000-0000-0000-0000-000000000005", "00000000-0000-0000-0000-000000000900"])]),
+        Filter(must=[Filter(should=[opt_outs])]),
+    ]
+
+def assert_masks_match(col, filters):
+    for f in filters:
+        predicate = _compile_filter(f)
+        expected = np.array([alive and predicate(point_id, payload) for point_id, payload, alive in zip(col.ids, col.payloads, col.alive)])
+        assert np.array_equal(col.filter_mask(f), expected), f"mask differs for {f}"
+
+def scroll_ids(index, flush_after_page: int = None, delete_seen: int = 0):
+    seen, offset, page = [], None, 0
+    while True:
+        records, offset = index.scroll(COLLECTION_NAME, limit=37, offset=offset)
+        seen.extend(str(r.id) for r in records)
+        page += 1
+        if page == flush_after_page:
+            # Rows are renumbered; delete a few already visited points so positions shift
+            index.delete(COLLECTION_NAME, PointIdsList(points=seen[:delete_seen]))
+            index.flush()
+        if offset is None:
+            return seen
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1200
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(path=tmp, dtype="float16")
+        index.create_collection(COLLECTION_NAME, VectorParams(size=DIM, distance=Distance.COSINE))
+        index.upsert(COLLECTION_NAME, make_points(rng, 0, n))
+        col = index._collection(COLLECTION_NAME)
+        filters = sample_filters(rng)
+
+        assert_masks_match(col, filters)
+        # Overwrites and deletes after the field indexes and masks are cached
+        index.upsert(COLLECTION_NAME, make_points(rng, n - 100, n + 100))
+        index.delete(COLLECTION_NAME, PointIdsList(points=[f"00000000-0000-0000-0000-{i:012d}" for i in range(0, 300, 4)]))
+        assert_masks_match(col, filters)
+        index.flush()
+        assert_masks_match(index._collection(COLLECTION_NAME), filters)
+
+        expected = sorted(index._collection(COLLECTION_NAME).ids)
+        assert scroll_ids(index) == expected, "scroll did not visit every point in id order"
+        seen = scroll_ids(index, flush_after_page=3, delete_seen=20)
+        assert sorted(seen) == expected and len(set(seen)) == len(seen), "scroll skipped or repeated points across a flush"
+
+        # Paged search: the static opt-out mask stays cached, seen_urls changes per page
+        static = FieldCondition(key="shopName", match=MatchAny(any=[f"shop{i}" for i in range(0, 50, 5)]))
+        seen_urls, latencies = [], []
+        for _ in range(20):
+            f = Filter(must_not=[static, FieldCondition(key="boothUrl", match=MatchAny(any=seen_urls))]) if seen_urls else Filter(must_not=[static])
+            start = time.perf_counter()
+            hits = index.query_points(COLLECTION_NAME, rng.normal(size=DIM).tolist(), query_filter=f, limit=10).points
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert not {h.payload["boothUrl"] for h in hits} & set(seen_urls)
+            seen_urls.extend(h.payload["boothUrl"] for h in hits)
+        print(f"paged search: p50={np.percentile(latencies, 50):.2f}ms max={max(latencies):.2f}ms over {len(col.ids)} rows")
+
+    print("SUCCESS: local index filters and scroll offsets match the reference")
@@ -0,0 +1,49 @@
+"""
+Check that the ONNX Runtime image encoder matches the transformers model.
+
+Embeds a few sample images with both runtimes and fails if any pair of
+vectors has cosine similarity below the threshold.
+Usage: python scripts/test_onnx_parity.py [num_images]
+"""
+import glob
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.image_processor import ImageProcessor
+
+MIN_COSINE = 0.9999
+
+def load_samples(n: int):
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = sorted(glob.glob(os.path.join(backend_dir, "scraper", "data", "raw_images", "*.jpg")))[:n]
+    images = [Image.open(p).convert("RGB") for p in paths]
+    # Pad with synthetic images so the check also runs on a fresh checkout
+    rng = np.random.default_rng(0)
+    while len(images) < n:
+        images.append(Image.fromarray(rng.integers(0, 256, size=(300, 400, 3), dtype=np.uint8)))
+    return images
+
+def timed(processor, images):
+    start = time.perf_counter()
+    vectors = np.array(processor.get_embeddings(images))
+    return vectors, (time.perf_counter() - start) * 1000 / len(images)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    images = load_samples(n)
+
+    torch_vectors, torch_ms = timed(ImageProcessor(runtime="torch"), images)
+    onnx_vectors, onnx_ms = timed(ImageProcessor(runtime="onnx"), images)
+
+    cosines = np.sum(torch_vectors * onnx_vectors, axis=1)
+    print(f"torch: {torch_ms:.1f} ms/image | onnx: {onnx_ms:.1f} ms/image")
+    print(f"cosine min={cosines.min():.6f} mean={cosines.mean():.6f} | max abs diff={np.abs(torch_vectors - onnx_vectors).max():.2e}")
+
+    if cosines.min() < MIN_COSINE:
+        print(f"FAILED: ONNX output diverges from transformers (min cosine < {MIN_COSINE})")
+        sys.exit(1)
+    print("SUCCESS: ONNX encoder matches transformers output")
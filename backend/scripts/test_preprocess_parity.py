@@ -0,0 +1,58 @@
+"""
+Check that fast_preprocess produces the same pixel values as CLIPProcessor,
+including on large images, where a single resample is most likely to drift.
+
+Each synthetic image (smooth gradients plus fine texture) is preprocessed
+both ways, decoded in memory and as a JPEG upload through load_image (draft
+decoding). Fails if the mean absolute difference of the normalized pixel
+values exceeds the tolerance for any image.
+Usage: python scripts/test_preprocess_parity.py
+"""
+import io
+import os
+import sys
+import numpy as np
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.image_processor import CLIP_MODEL_ID
+from app.services.fast_preprocess import load_image, to_pixel_values
+
+# Normalized units (one uint8 level is about 0.015). reducing_gap and JPEG
+# draft decoding account for most of what remains on the largest images.
+MAX_MAD = 0.03
+SIZES = [(300, 400), (1200, 900), (2400, 1800), (4000, 3000), (3001, 2000), (1000, 3000)]
+
+def synthetic_image(rng, w: int, h: int) -> Image.Image:
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.stack([127 + 100 * np.sin(x / (w / 7) + c) * np.cos(y / (h / 5)) for c in range(3)], axis=-1)
+    stripes = 40 * np.sign(np.sin(x / 3.0))[..., None]
+    pixels = base + stripes + rng.normal(scale=25, size=(h, w, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+if __name__ == "__main__":
+    processor = CLIPImageProcessor.from_pretrained(CLIP_MODEL_ID)
+    rng = np.random.default_rng(0)
+    failed = False
+
+    for w, h in SIZES:
+        image = synthetic_image(rng, w, h)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=92)
+        jpeg = buffer.getvalue()
+
+        for mode, source, fast in (
+            ("decoded", image, to_pixel_values([image])),
+            ("jpeg", Image.open(io.BytesIO(jpeg)).convert("RGB"), to_pixel_values([load_image(jpeg)])),
+        ):
+            reference = processor(images=[source], return_tensors="pt")["pixel_values"]
+            diff = (fast - reference).abs()
+            mad = diff.mean().item()
+            print(f"{w}x{h} {mode:<7} MAD={mad:.4f} max={diff.max().item():.3f}")
+            failed |= mad > MAX_MAD
+
+    if failed:
+        print(f"FAILED: fast_preprocess diverges from CLIPProcessor (MAD > {MAX_MAD})")
+        sys.exit(1)
+    print("SUCCESS: fast_preprocess matches CLIPProcessor within tolerance")
@@ -2,7 +2,6 @@
 Standalone Search API - Uses in-memory Qdrant to avoid file lock issues.
 Loads seed data into memory on startup.
 """
-import io
 import uuid
 import torch
 import traceback
@@ -10,12 +9,20 @@ import requests
 from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from transformers import CLIPModel
+from qdrant_client.http.models import PointStruct
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import asyncio
+from app.services.inference_executor import InferenceExecutor
+from app.services.embedding_cache import EmbeddingCache, content_hash
+from app.services.fast_preprocess import cache_model_id, load_image, to_pixel_values
+from app.services.query_cache import QueryCache, dhash
+from app.services.product_dedup import DistinctProductFetcher
+from app.services.qdrant_clients import get_qdrant_client
+from app.services.vector_index import QdrantIndex, create_async_vector_index
+from app.services.collection_profile import get_profile, create_collection_kwargs, migrate_collection, search_params
+from app.services.opt_out_enforcer import OptOutEnforcer, get_booth_identifiers, get_item_payload_ids, build_exclusion_conditions
 
 import logging
 import os
@@ -72,37 +79,51 @@ print(f"--- [DEBUG] Device: {device} ---")
 # Initialize CLIP
 print("--- [DEBUG] Loading CLIP model ---")
 from transformers import CLIPImageProcessor
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(device)
-processor = CLIPImageProcessor.from_pretrained("openai/clip-vit-base-patch32")
+from app.services.image_processor import CLIP_MODEL_ID
+model = CLIPModel.from_pretrained(CLIP_MODEL_ID).to(device)
+processor = CLIPImageProcessor.from_pretrained(CLIP_MODEL_ID)
+CLIP_QUANTIZE = os.getenv("CLIP_QUANTIZE", "none").lower()
+if CLIP_QUANTIZE == "int8":
+    # Opt-in dynamic INT8 image-tower linear layers (CPU only); see scripts/benchmark_quantized_clip.py
+    from app.services.clip_quantization import quantize_torch_model
+    device = "cpu"
+    model = quantize_torch_model(model)
+    print("--- [DEBUG] CLIP quantized to dynamic INT8 ---")
 print("--- [DEBUG] CLIP loaded ---")
 
 # Initialize Qdrant (Cloud or In-Memory)
 print("--- [DEBUG] Initializing Qdrant ---")
-qdrant_url = os.getenv("QDRANT_CLOUD_URL")
-qdrant_api_key = os.getenv("QDRANT_CLOUD_API_KEY")
+# Blocking index for setup and opt-out jobs; queries and upserts go through the
+# shared AsyncQdrantClient (gRPC preferred) when Qdrant Cloud is configured.
+# One QdrantIndex for every caller, so its lock covers the :memory: store
+qdrant = QdrantIndex(get_qdrant_client())
+aqdrant = create_async_vector_index(qdrant)
+print(f"--- [DEBUG] Connected to Qdrant ({type(aqdrant).__name__}) ---")
 
-if qdrant_url and qdrant_api_key:
-    qdrant = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
-    print("--- [DEBUG] Connected to Qdrant Cloud ---")
-else:
-    qdrant = QdrantClient(":memory:")
-    print("--- [DEBUG] Connected to Local In-Memory Qdrant ---")
+# Dedicated pool for decoding, CLIP and Qdrant calls so they never block the event loop
+inference = InferenceExecutor()
+
+# HNSW / quantization / on-disk settings, see app/services/collection_profile.py
+QDRANT_PROFILE = get_profile()
+SEARCH_PARAMS = search_params(QDRANT_PROFILE)
 
 # Try to create collection if it doesn't exist
 try:
     if not qdrant.collection_exists(COLLECTION_NAME):
         qdrant.create_collection(
             collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(size=512, distance=Distance.COSINE),
+            **create_collection_kwargs(QDRANT_PROFILE, 512)
         )
+    else:
+        migrate_collection(qdrant, COLLECTION_NAME, QDRANT_PROFILE)
 except Exception as e:
     print(f"--- [DEBUG] Collection check/create notice: {e} ---")
 
 def get_embedding(image: Image.Image):
-    # Use image-only processing without padding to bypass the older transformers bug
-    inputs = processor(images=[image], return_tensors="pt").to(device)
+    # Resize/crop/normalize in NumPy instead of CLIPImageProcessor
+    pixel_values = to_pixel_values([image]).to(device)
     with torch.no_grad():
-        outputs = model.get_image_features(**inputs)
+        outputs = model.get_image_features(pixel_values=pixel_values)
     
     # Robust extraction
     if isinstance(outputs, torch.Tensor):
@@ -143,6 +164,9 @@ METADATA_PATH = os.path.join(BASE_DIR, "scraper", "data", "popular_items_full.js
 SCRAPER_DIR = os.path.join(BASE_DIR, "scraper")
 
 
+# Content-addressed CLIP vectors shared with the other fast_preprocess seeders
+embedding_cache = EmbeddingCache(cache_model_id(CLIP_MODEL_ID if CLIP_QUANTIZE == "none" else f"{CLIP_MODEL_ID}:{CLIP_QUANTIZE}"))
+
 # Global state for indexing status
 indexing_status = {
     "total": 0,
@@ -152,7 +176,6 @@ indexing_status = {
 }
 
 async def seed_data():
-    global indexing_status
     logging.info("--- [DEBUG] Starting background seeding ---")
     if os.path.exists(METADATA_PATH):
         processed_urls = set()
@@ -201,8 +224,7 @@ async def seed_data():
                                 if resp.status_code != 200:
                                     logging.warning(f"Failed to fetch remote image: {img_rel_path}")
                                     continue
-                                img_data = io.BytesIO(resp.content)
-                                img = Image.open(img_data).convert("RGB")
+                                content = resp.content
                                 thumbnail_url = img_rel_path
                             else:
                                 # Try the path as is first
@@ -218,22 +240,30 @@ async def seed_data():
                                     logging.warning(f"Image not found: {img_rel_path} or {img_path}")
                                     continue
                                 
-                                img = Image.open(img_path).convert("RGB")
+                                with open(img_path, "rb") as img_file:
+                                    content = img_file.read()
                                 filename = os.path.basename(img_path)
                                 thumbnail_url = f"/api/images/{filename}"
 
-                            vector = get_embedding(img)
+                            # Reuse vectors from earlier runs when the image bytes are unchanged
+                            img_hash = content_hash(content)
+                            vector = embedding_cache.get(img_hash)
+                            if vector is None:
+                                img = load_image(content)
+                                vector = get_embedding(img)
+                                embedding_cache.put(img_hash, vector)
 
                             payload = {
                                 "title": item.get("title", "Unknown"),
                                 "price": item.get("price", "Unknown"),
                                 "shopName": item.get("shop", "Unknown"),
                                 "boothUrl": item.get("url", "#"),
-                                "thumbnailUrl": thumbnail_url
+                                "thumbnailUrl": thumbnail_url,
+                                **get_item_payload_ids(item)
                             }
                             point_id = get_stable_uuid(img_rel_path)
 
-                            qdrant.upsert(
+                            await aqdrant.upsert(
                                 collection_name=COLLECTION_NAME,
                                 points=[PointStruct(
                                     id=point_id,
@@ -262,58 +292,33 @@ async def startup_event():
     import asyncio
     # Start seeding in the background
     asyncio.create_task(seed_data())
+    # Purge anything the blacklist already covers (e.g. in Qdrant Cloud)
+    asyncio.create_task(enforce_opt_out(set(PENDING_OPT_OUTS)))
 
 
 
 from pydantic import BaseModel
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue
+from qdrant_client.http.models import Filter
 
 # ... (existing imports)
 
-def get_booth_identifiers(text: str):
-    """
-    Extracts stable identifiers (Shop Subdomain, Item ID) from BOOTH URLs or text.
-    Returns a set of normalized strings.
-    """
-    ids = set()
-    text = text.strip()
-    if not text:
-        return ids
-    
-    # 1. Direct Shop Subdomain (e.g. mame-shop.booth.pm)
-    shop_match = re.search(r'https?://([\w-]+)\.booth\.pm', text)
-    if shop_match:
-        sub = shop_match.group(1).lower()
-        if sub not in ('www', 'manage', 'accounts', 'pixiv', 'checkout'):
-            ids.add(sub)
-    
-    # 2. Item ID from path (e.g. booth.pm/ja/items/12345 or shop.booth.pm/items/12345)
-    item_match = re.search(r'/items/(\d+)', text)
-    if item_match:
-        ids.add(item_match.group(1))
-    
-    # 3. Simple numeric ID
-    if text.isdigit():
-        ids.add(text)
-    
-    # 4. Fallback: if it's a slug or name part (lowercase)
-    if not text.startswith("http"):
-        ids.add(text.lower())
-        
-    return ids
-
 # Persistent store for opted-out shops (names or URLs)
 BLACKLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blacklist.txt")
 OPTED_OUT_SHOPS = set()
+# Identifiers whose points have not been deleted from Qdrant yet; only these need a query-time filter
+PENDING_OPT_OUTS = set()
+# Bumped on every opt-out change; part of the query cache key
+OPT_OUT_GENERATION = 0
+opt_out_enforcer = OptOutEnforcer(qdrant, COLLECTION_NAME)
 
 def load_blacklist():
-    global OPTED_OUT_SHOPS
     if os.path.exists(BLACKLIST_PATH):
         with open(BLACKLIST_PATH, "r", encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
                 if line and not line.startswith("#"):
                     OPTED_OUT_SHOPS.add(line)
+    PENDING_OPT_OUTS.update(OPTED_OUT_SHOPS)
     logging.info(f"--- [DEBUG] Blacklist loaded: {len(OPTED_OUT_SHOPS)} entries ---")
 
 # Initial load
@@ -322,6 +327,18 @@ load_blacklist()
 class OptOutRequest(BaseModel):
     shopUrl: str
 
+async def enforce_opt_out(identifiers: set):
+    if not identifiers:
+        return
+    try:
+        await inference.run(opt_out_enforcer.enforce, identifiers)
+    except Exception as e:
+        logging.error(f"--- [DEBUG] Opt-out enforcement failed for {identifiers}: {e} ---")
+        return
+    global OPT_OUT_GENERATION
+    PENDING_OPT_OUTS.difference_update(identifiers)
+    OPT_OUT_GENERATION += 1
+
 import smtplib
 from email.message import EmailMessage
 
@@ -357,11 +374,12 @@ async def opt_out(req: OptOutRequest, background_tasks: BackgroundTasks):
     identifier = req.shopUrl.strip()
     if identifier:
         new_ids = get_booth_identifiers(identifier)
-        for nid in new_ids:
-            OPTED_OUT_SHOPS.add(nid)
-        
         # Original fallback (just in case)
-        OPTED_OUT_SHOPS.add(identifier.lower())
+        new_ids.add(identifier.lower())
+        global OPT_OUT_GENERATION
+        OPTED_OUT_SHOPS.update(new_ids)
+        PENDING_OPT_OUTS.update(new_ids)
+        OPT_OUT_GENERATION += 1
 
         logging.info(f"--- [DEBUG] Opted out: {identifier} -> IDs: {new_ids} (Total: {len(OPTED_OUT_SHOPS)}) ---")
         
@@ -372,6 +390,8 @@ async def opt_out(req: OptOutRequest, background_tasks: BackgroundTasks):
         except Exception as e:
             logging.error(f"Failed to save to blacklist.txt: {e}")
 
+        # Delete the shop's points from the index, then drop it from the query-time filter
+        background_tasks.add_task(enforce_opt_out, new_ids)
         # Dispatch background task for email
         background_tasks.add_task(send_opt_out_email, identifier)
         
@@ -380,11 +400,30 @@ async def opt_out(req: OptOutRequest, background_tasks: BackgroundTasks):
         raise HTTPException(status_code=400, detail="Invalid shop identifier")
 
 
+def decode_upload(contents: bytes) -> Image.Image:
+    # First frame of animations, transparency flattened onto white, JPEG draft
+    # decode, then one resample straight to CLIP's 224x224 input
+    return load_image(contents)
+
+def decode_and_hash(contents: bytes):
+    image = decode_upload(contents)
+    return image, dhash(image)
+
+# Repeat uploads (same bytes or same dHash) skip CLIP, unchanged queries skip Qdrant
+query_cache = QueryCache()
+product_fetcher = DistinctProductFetcher()
+RESULT_LIMIT = 12 # Slightly higher limit for better UI
+
 @app.post("/api/search")
 async def search_image(file: UploadFile = File(...)):
     if not indexing_status["is_complete"] and indexing_status["current"] == 0:
          raise HTTPException(status_code=503, detail="Search engine is still initializing. Please wait a few moments.")
     
+    # Reject early with 503 when the inference queue is full
+    async with inference.reserve():
+        return await _search_image(file)
+
+async def _search_image(file: UploadFile):
     try:
         s_filename = repr(file.filename)
         logging.info(f"--- [DEBUG] START REQUEST: {s_filename} ---")
@@ -392,83 +431,56 @@ async def search_image(file: UploadFile = File(...)):
         logging.info("--- [DEBUG] 1. Reading file content ---")
         contents = await file.read()
         
-        logging.info("--- [DEBUG] 2. Opening image with PIL ---")
-        try:
-            img_obj = Image.open(io.BytesIO(contents))
-            # Safely handle animated images by only taking the first frame
-            if getattr(img_obj, "is_animated", False):
-                img_obj.seek(0)
-            
-            # Create a solid white background for transparent images to avoid RGBA bugs
-            image = Image.new("RGB", img_obj.size, (255, 255, 255))
-            if img_obj.mode in ('RGBA', 'LA') or (img_obj.mode == 'P' and 'transparency' in img_obj.info):
-                image.paste(img_obj, mask=img_obj.convert('RGBA').split()[3])
-            else:
-                image.paste(img_obj)
-                
-            logging.info(f"--- [DEBUG] Image size: {image.size} ---")
-        except Exception as e:
-            logging.error(f"--- [DEBUG] PIL Error: {e} ---")
-            raise e
-        
-        logging.info("--- [DEBUG] 3. Calling get_embedding ---")
-        vector = get_embedding(image)
-        logging.info("--- [DEBUG] 4. Embedding generated successfully ---")
-        
-        logging.info(f"--- [DEBUG] 5. Searching Qdrant with Opt-out Filter (Excluded: {len(OPTED_OUT_SHOPS)}) ---")
-        
-        # Construct filter to exclude opted-out shops
-        # We filter against 'shopName' and 'boothUrl' payload fields
-        # Ideally, we should exact match, but for now we check if the shopName is in the set
+        sha = content_hash(contents)
+        cached = query_cache.lookup_content(sha)
+        if cached is None:
+            logging.info("--- [DEBUG] 2. Opening image with PIL ---")
+            try:
+                image, phash = await inference.run(decode_and_hash, contents)
+                logging.info(f"--- [DEBUG] Image size: {image.size} ---")
+            except Exception as e:
+                logging.error(f"--- [DEBUG] PIL Error: {e} ---")
+                raise e
+
+            cached = query_cache.lookup_perceptual(phash)
+            if cached is None:
+                logging.info("--- [DEBUG] 3. Calling get_embedding ---")
+                cached = (phash, await inference.run(get_embedding, image))
+                logging.info("--- [DEBUG] 4. Embedding generated successfully ---")
+            query_cache.put_embedding(sha, *cached)
+        phash, vector = cached
+
+        # Seeding progress and opt-out changes both alter what the same query returns
+        generation = (OPT_OUT_GENERATION, indexing_status["current"], indexing_status["is_complete"])
+        results = query_cache.get_results(phash, generation)
+        if results is not None:
+            logging.info(f"--- [DEBUG] Query cache hit ({len(results)} results) ---")
+            return {"results": results}
+
+        logging.info(f"--- [DEBUG] 5. Searching Qdrant with Opt-out Filter (Excluded: {len(OPTED_OUT_SHOPS)}, Pending: {len(PENDING_OPT_OUTS)}) ---")
         
+        # Enforced opt-outs are already deleted from Qdrant; only filter the pending ones
         query_filter = None
-        if OPTED_OUT_SHOPS:
-            # Create a list of conditions where shopName matches any of the opted-out identifiers
-            # Qdrant 'must_not' with multiple Match conditions acts as NOR (neither A nor B)
-            # We want to exclude if shopName is in OPTED_OUT_SHOPS OR boothUrl is in OPTED_OUT_SHOPS
-            
-            # Since qdrant filters are strict, let's just match against shopName for the prototype
-            # as our sample data has clean shop names.
-            
-            conditions = []
-            for excluded in OPTED_OUT_SHOPS:
-                # Match against shopName (subdomain) or boothUrl (contains ID)
-                # Note: MatchValue is an exact match for the field.
-                # However, our payload contains the FULL URL in 'boothUrl'.
-                # To be robust, we'd need 'must_not' to catch any item where
-                # ANY of our normalized IDs appear in the URL or shopName.
-                
-                # Filter by Shop Name (exact)
-                conditions.append(FieldCondition(key="shopName", match=MatchValue(value=excluded)))
-                
-                # To filter by Item ID in the URL, we can't easily do substring match in Qdrant 
-                # without Regex index. For now, we'll rely on the Shop Name matching correctly.
-                # If 'excluded' is a numeric ID, we normally can't match it against the full URL.
-            
-            query_filter = Filter(must_not=conditions)
+        exclusions = build_exclusion_conditions(PENDING_OPT_OUTS)
+        if exclusions:
+            query_filter = Filter(must_not=exclusions)
 
         try:
-            # Fetch more points to allow for deduplication by product (boothUrl)
-            search_result = qdrant.search(
-                collection_name=COLLECTION_NAME,
-                query_vector=vector,
-                query_filter=query_filter, 
-                limit=40,
-                with_payload=True
-            )
-            
-            # Deduplicate by boothUrl, keeping only the best match per product
-            unique_results = []
-            seen_urls = set()
-            for hit in search_result:
-                url = hit.payload.get("boothUrl")
-                if url not in seen_urls:
-                    seen_urls.add(url)
-                    unique_results.append(hit)
-                if len(unique_results) >= 12: # Slightly higher limit for better UI
-                    break
-            
-            search_result = unique_results
+            async def query_page(offset: int, count: int):
+                response = await aqdrant.query_points(
+                    collection_name=COLLECTION_NAME,
+                    query=vector,
+                    query_filter=query_filter,
+                    limit=count,
+                    offset=offset,
+                    with_payload=True,
+                    search_params=SEARCH_PARAMS
+                )
+                return response.points
+
+            # Read the ranking until RESULT_LIMIT distinct products (boothUrl) are found,
+            # keeping only the best match per product
+            search_result = await product_fetcher.fetch_async(query_page, RESULT_LIMIT)
             logging.info(f"--- [DEBUG] Found {len(search_result)} unique products ---")
 
         except Exception as e:
@@ -476,12 +488,12 @@ async def search_image(file: UploadFile = File(...)):
             raise e
         
         logging.info("--- [DEBUG] 6. Formatting response ---")
-        return {
-            "results": [
-                {"id": str(hit.id), "score": hit.score, "payload": hit.payload}
-                for hit in search_result
-            ]
-        }
+        results = [
+            {"id": str(hit.id), "score": hit.score, "payload": hit.payload}
+            for hit in search_result
+        ]
+        query_cache.put_results(phash, generation, results)
+        return {"results": results}
     except Exception as e:
         logging.error(f"FATAL SEARCH ERROR: {e}")
         logging.error(traceback.format_exc())
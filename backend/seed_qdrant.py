@@ -1,6 +1,7 @@
 import asyncio
 from app.services.vector_db import VectorDBService
 from app.services.image_processor import ImageProcessor
+from app.db import init_db
 from dotenv import load_dotenv
 import os
 
@@ -10,6 +11,8 @@ async def main():
     qdrant_url = os.getenv("QDRANT_CLOUD_URL")
     print(f"Connecting to Qdrant Cloud: {qdrant_url}")
     
+    # seed_data reads the opt-outs from the Shop table
+    init_db()
     vector_db = VectorDBService()
     
     # Upsert only: keep existing vectors in Qdrant (no delete)
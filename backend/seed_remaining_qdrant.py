@@ -7,11 +7,16 @@ import uuid
 import requests
 import io
 import torch
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct, PayloadSchemaType
+from qdrant_client.http.models import PointStruct
 from transformers import CLIPModel, CLIPImageProcessor
 from PIL import Image
 from dotenv import load_dotenv
+from app.services.image_processor import CLIP_MODEL_ID
+from app.services.embedding_cache import EmbeddingCache, content_hash
+from app.services.opt_out_enforcer import get_item_payload_ids, is_item_excluded
+from app.services.opt_out_registry import OptOutRegistry
+from app.db import init_db
+from app.services.qdrant_clients import get_qdrant_client
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
@@ -21,17 +26,19 @@ def get_stable_uuid(text: str):
 
 async def main():
     load_dotenv()
-    qdrant_url = os.getenv("QDRANT_CLOUD_URL")
-    qdrant_api_key = os.getenv("QDRANT_CLOUD_API_KEY")
-    client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key, timeout=30.0)
+    if not (os.getenv("QDRANT_CLOUD_URL") and os.getenv("QDRANT_CLOUD_API_KEY")):
+        raise SystemExit("QDRANT_CLOUD_URL and QDRANT_CLOUD_API_KEY must be set")
+    # Same settings as the API (gRPC preferred, QDRANT_TIMEOUT defaults to 30s)
+    client = get_qdrant_client()
     collection_name = "booth_items"
     
     # 1. Load CLIP Model
     logging.info("Loading CLIP model...")
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(device)
-    processor = CLIPImageProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    model = CLIPModel.from_pretrained(CLIP_MODEL_ID).to(device)
+    processor = CLIPImageProcessor.from_pretrained(CLIP_MODEL_ID)
     logging.info(f"Loaded CLIP on {device}.")
+    embedding_cache = EmbeddingCache(CLIP_MODEL_ID)
 
     def get_embedding(img: Image.Image):
         inputs = processor(images=[img], return_tensors="pt").to(device)
@@ -74,6 +81,11 @@ async def main():
 
     logging.info(f"Total existing IDs in Qdrant: {len(existing_ids)}")
 
+    # Every opt-out, purged or pending: purged shops must not be re-indexed
+    init_db()
+    excluded_identifiers = OptOutRegistry().identifiers
+    logging.info(f"Skipping {len(excluded_identifiers)} opted-out identifiers")
+
     # 3. Process metadata
     metadata_path = "scraper/data/popular_items_full.jsonl"
     scraper_dir = "scraper"
@@ -83,19 +95,24 @@ async def main():
     
     added_count = 0
     skipped_count = 0
+    opted_out_count = 0
     error_count = 0
+    cached_count = 0
 
     logging.info(f"Processing {total_lines} items...")
     
     with open(metadata_path, "r", encoding="utf-8") as f:
         for line_idx, line in enumerate(f):
             if (line_idx + 1) % 100 == 0:
-                logging.info(f"Progress: {line_idx + 1}/{total_lines} items | Added: {added_count} | Skipped: {skipped_count} | Errors: {error_count}")
+                logging.info(f"Progress: {line_idx + 1}/{total_lines} items | Added: {added_count} | Skipped: {skipped_count} | Cached: {cached_count} | Errors: {error_count}")
             
             try:
                 item = json.loads(line.strip())
                 if not item.get("images") or not item.get("url"):
                     continue
+                if is_item_excluded(item, excluded_identifiers):
+                    opted_out_count += 1
+                    continue
                 
                 for img_rel_path in item["images"]:
                     point_id = get_stable_uuid(img_rel_path)
@@ -111,8 +128,7 @@ async def main():
                         if is_url:
                             resp = requests.get(img_rel_path, timeout=10)
                             if resp.status_code != 200: continue
-                            img_data = io.BytesIO(resp.content)
-                            img = Image.open(img_data).convert("RGB")
+                            content = resp.content
                             thumbnail_url = img_rel_path
                         else:
                             img_path = os.path.join(scraper_dir, img_rel_path)
@@ -122,11 +138,19 @@ async def main():
                             if not os.path.exists(img_path):
                                 continue
                             
-                            img = Image.open(img_path).convert("RGB")
+                            with open(img_path, "rb") as img_file:
+                                content = img_file.read()
                             filename = os.path.basename(img_path)
                             thumbnail_url = f"/api/images/{filename}"
 
-                        vector = get_embedding(img)
+                        img_hash = content_hash(content)
+                        vector = embedding_cache.get(img_hash)
+                        if vector is None:
+                            img = Image.open(io.BytesIO(content)).convert("RGB")
+                            vector = get_embedding(img)
+                            embedding_cache.put(img_hash, vector)
+                        else:
+                            cached_count += 1
                         payload = {
                             "title": item.get("title", "Unknown"),
                             "price": item.get("price", "Unknown"),
@@ -135,7 +159,8 @@ async def main():
                             "thumbnailUrl": thumbnail_url,
                             "category": item.get("category", "Unknown"),
                             "avatars": item.get("avatars", []),
-                            "colors": item.get("colors", [])
+                            "colors": item.get("colors", []),
+                            **get_item_payload_ids(item)
                         }
 
                         client.upsert(
@@ -150,7 +175,8 @@ async def main():
             except Exception as e:
                 logging.error(f"Error reading item line: {e}")
 
-    logging.info(f"FINISHED. Total added: {added_count}, Skipped: {skipped_count}, Errors: {error_count}")
+    embedding_cache.close()
+    logging.info(f"FINISHED. Total added: {added_count}, Skipped: {skipped_count}, Opted out: {opted_out_count}, Cached: {cached_count}, Errors: {error_count}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,27 +1,28 @@
-from ultralytics import YOLO
 import glob
 import os
+import sys
 
-# Load the best model
-# Note: Adjust the path if training saved to a different run directory (e.g., train2, train3)
-# We will use a glob pattern to find the latest run
-runs = glob.glob('runs/detect/train*')
-latest_run = max(runs, key=os.path.getmtime)
-model_path = os.path.join(latest_run, 'weights', 'best.pt')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from PIL import Image
+from app.services.garment_detector import GarmentDetector, find_best_model
 
+# Load the best model: YOLO_MODEL_PATH, otherwise the most recent runs/detect/*/weights/best.pt
+model_path = find_best_model()
 print(f"Loading model from: {model_path}")
-model = YOLO(model_path)
+detector = GarmentDetector(model_path)
 
 # Test on a few images from the test set
 test_images = glob.glob('backend/yolo_dataset/test_v1/images/*.jpg')[:3]
 
-if not test_images:
+if not detector.available:
+    print("No YOLO model could be loaded.")
+elif not test_images:
     print("No test images found.")
 else:
     print(f"Testing on {len(test_images)} images...")
-    results = model(test_images)
+    results = detector.detect_batch([Image.open(path) for path in test_images])
 
-    for i, r in enumerate(results):
+    for i, detections in enumerate(results):
         print(f"\nImage: {test_images[i]}")
-        for box in r.boxes:
-            print(f"  - Class: {model.names[int(box.cls)]}, Conf: {float(box.conf):.2f}")
+        for d in detections:
+            print(f"  - Class: {d['label']}, Conf: {d['confidence']:.2f}")